@@ -1,5 +1,28 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Category, Company, Subscription
+from django.core.cache import cache
+
+from .cache import CATALOG_MODELS, get_version
+from .exports import export_response
+from .models import Category, Company, Plan, Subscription, UserSubscriptionSummary
+from .pagination import EstimatedCountPaginator
+
+
+class CachedRelatedFieldListFilter(admin.RelatedFieldListFilter):
+    """
+    Фильтр по связанной модели с вариантами из кэша. Для категорий и компаний
+    ключ включает версию каталога, поэтому варианты обновляются сразу после изменений
+    """
+
+    def field_choices(self, field, request, model_admin):
+        related = field.related_model._meta.model_name
+        version = get_version(related) if related in CATALOG_MODELS else ''
+        key = f'admin:choices:{model_admin.opts.label_lower}:{self.field_path}:{version}'
+        choices = cache.get(key)
+        if choices is None:
+            choices = super().field_choices(field, request, model_admin)
+            cache.set(key, choices, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return choices
 
 
 @admin.register(Category)
@@ -11,13 +34,27 @@ class CategoryAdmin(admin.ModelAdmin):
     ordering = ('name',)
 
 
+class PlanInline(admin.TabularInline):
+    """Планы компании (заполняются из subscription_plans)"""
+    model = Plan
+    fields = ('name', 'price', 'billing_period')
+    readonly_fields = ('name', 'price', 'billing_period')
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Company)
 class CompanyAdmin(admin.ModelAdmin):
     """Админ-панель для компаний"""
     list_display = ('name', 'category', 'website', 'created_at')
+    list_select_related = ('category',)
     search_fields = ('name', 'description')
-    list_filter = ('category', 'created_at')
+    list_filter = (('category', CachedRelatedFieldListFilter), 'created_at')
     ordering = ('name',)
+    inlines = (PlanInline,)
     
     fieldsets = (
         ('Основная информация', {
@@ -35,11 +72,24 @@ class CompanyAdmin(admin.ModelAdmin):
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
-    """Админ-панель для подписок"""
+    """
+    Админ-панель для подписок. Рассчитана на миллионы строк: пользователь
+    и компания загружаются одним JOIN, количество строк не считается
+    полностью (EstimatedCountPaginator, show_full_result_count), а варианты
+    фильтра по категории и date_hierarchy берутся из кэша
+    (шаблон admin/core/subscription/change_list.html)
+    """
     list_display = ('user', 'company', 'plan_name', 'price', 'billing_period', 'status', 'next_billing_date')
+    list_select_related = ('user', 'company')
     search_fields = ('user__username', 'company__name', 'plan_name')
-    list_filter = ('status', 'billing_period', 'company__category', 'created_at')
+    list_filter = ('status', 'billing_period', ('company__category', CachedRelatedFieldListFilter), 'created_at')
     ordering = ('-start_date',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Пользователей слишком много для выпадающего списка
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('company',)
+    date_hierarchy_cache_timeout = 300
     
     fieldsets = (
         ('Основная информация', {
@@ -57,6 +107,16 @@ class SubscriptionAdmin(admin.ModelAdmin):
         }),
     )
     
+    actions = ('export_csv', 'export_ndjson')
+
+    @admin.action(description='Выгрузить выбранные подписки в CSV')
+    def export_csv(self, request, queryset):
+        return export_response(queryset, 'csv', 'subscriptions')
+
+    @admin.action(description='Выгрузить выбранные подписки в NDJSON')
+    def export_ndjson(self, request, queryset):
+        return export_response(queryset, 'ndjson', 'subscriptions')
+
     def get_readonly_fields(self, request, obj=None):
         """Делаем created_at и updated_at только для чтения"""
         if obj:  # При редактировании
@@ -64,3 +124,15 @@ class SubscriptionAdmin(admin.ModelAdmin):
         return ()
     
     date_hierarchy = 'start_date'
+
+
+@admin.register(UserSubscriptionSummary)
+class UserSubscriptionSummaryAdmin(admin.ModelAdmin):
+    """Админ-панель для сводок подписок (только просмотр)"""
+    list_display = ('user', 'active_count', 'total_count', 'monthly_cost', 'updated_at')
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    readonly_fields = ('user', 'total_count', 'active_count', 'monthly_cost', 'cost_by_period', 'by_category', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,412 @@
+"""
+Столбцовое хранилище подписок в памяти для аналитики по всему портфелю.
+
+Подписки читаются через values_list() пачками по pk и складываются
+в типизированные массивы (array из стандартной библиотеки): id, компания,
+цена в копейках, коды периода оплаты и статуса, даты как порядковые номера
+дней (date.toordinal(), 0 - нет даты окончания). Строка занимает 26 байт
+вместо экземпляра модели; категория берётся через компанию из небольшой
+таблицы соответствия, поэтому смена категории компании не требует
+перечитывать подписки.
+
+refresh() догружает только подписки с updated_at после последнего чтения
+(с запасом REFRESH_OVERLAP на незафиксированные транзакции) и убирает
+удалённые по записям Tombstone ленты изменений (core.sync). Если
+последнее чтение старше срока хранения этих записей, хранилище
+перечитывается целиком.
+
+Группировка и суммы считаются NumPy (массивы передаются без копирования);
+тот же алгоритм на Python остаётся запасным вариантом для окружений без него
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from .forecast import month_from_index, month_index
+from .models import BILLING_PERIOD_MONTHS, Company, Subscription, Tombstone
+from .sync import tombstone_retention
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Коды статусов и периодов оплаты - номера в choices модели
+STATUS_VALUES = [value for value, _ in Subscription.STATUS_CHOICES]
+PERIOD_VALUES = [value for value, _ in Subscription.BILLING_PERIOD_CHOICES]
+
+DIMENSIONS = ('company', 'category', 'status', 'billing_period', 'month')
+VALUES = ('count', 'price', 'monthly')
+
+# Запас на транзакции, зафиксированные позже, чем записан их updated_at
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+# Порядковый номер дня 1970-01-01 (начало отсчёта datetime64)
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Множитель цены до годового эквивалента по коду периода (12 / месяцев периода)
+_YEARLY_FACTORS = [12 // BILLING_PERIOD_MONTHS[value] for value in PERIOD_VALUES]
+
+
+def _code_expression(field, values):
+    return Case(
+        *(When(**{field: value}, then=Value(code)) for code, value in enumerate(values)),
+        output_field=IntegerField(),
+    )
+
+
+class SubscriptionStore:
+    """Подписки в столбцовом виде; строки упорядочены по id"""
+    typecodes = {
+        'id': 'q',
+        'company': 'i',
+        'price': 'q',
+        'period': 'b',
+        'status': 'b',
+        'start': 'i',
+        'end': 'i',
+    }
+
+    def __init__(self, chunk_size=50_000):
+        self.chunk_size = chunk_size
+        self._clear()
+
+    def _clear(self):
+        for name, typecode in self.typecodes.items():
+            setattr(self, name, array(typecode))
+        self.company_categories = {}
+        self.watermark = None
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self.id)
+
+    def memory_bytes(self):
+        return sum(getattr(self, name).itemsize * len(self) for name in self.typecodes)
+
+    # ---------- Загрузка ----------
+    def _rows(self, queryset):
+        return queryset.order_by('pk').annotate(
+            analytics_price=Cast(Round(F('price') * 100), IntegerField()),
+            analytics_period=_code_expression('billing_period', PERIOD_VALUES),
+            analytics_status=_code_expression('status', STATUS_VALUES),
+        ).values_list(
+            'pk', 'company_id', 'analytics_price', 'analytics_period', 'analytics_status', 'start_date', 'end_date',
+        )
+
+    @staticmethod
+    def _ordinals(row):
+        pk, company, price, period, status, start, end = row
+        return pk, company, price, period, status, start.toordinal(), end.toordinal() if end else 0
+
+    def load(self):
+        """Читает все подписки заново"""
+        self._clear()
+        started = timezone.now()
+        queryset = self._rows(Subscription.objects.all())
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk)[:self.chunk_size])
+            if not rows:
+                break
+            columns = zip(*map(self._ordinals, rows))
+            for name, column in zip(self.typecodes, columns):
+                getattr(self, name).extend(column)
+            last_pk = rows[-1][0]
+        self._load_companies()
+        self.watermark = started
+        self.loaded_at = time.monotonic()
+        return self
+
+    def _load_companies(self):
+        self.company_categories = dict(Company.objects.values_list('pk', 'category_id'))
+
+    def refresh(self):
+        """
+        Применяет изменения после последнего чтения. Возвращает словарь
+        с количеством обновлённых, добавленных и удалённых строк и признаком
+        полной перезагрузки
+        """
+        started = timezone.now()
+        if self.watermark is None or self.watermark - REFRESH_OVERLAP < started - tombstone_retention():
+            self.load()
+            return {'updated': 0, 'added': len(self), 'deleted': 0, 'reloaded': True}
+        changed = self._rows(Subscription.objects.filter(updated_at__gte=self.watermark - REFRESH_OVERLAP))
+        updated = added = 0
+        for row in changed.iterator(chunk_size=self.chunk_size):
+            row = self._ordinals(row)
+            position = bisect_left(self.id, row[0])
+            if position < len(self.id) and self.id[position] == row[0]:
+                for name, value in zip(self.typecodes, row):
+                    getattr(self, name)[position] = value
+                updated += 1
+            else:
+                # Новые id почти всегда больше последнего - тогда это добавление в конец
+                for name, value in zip(self.typecodes, row):
+                    getattr(self, name).insert(position, value)
+                added += 1
+
+        deleted = self._remove_deleted(self.watermark - REFRESH_OVERLAP)
+        self._load_companies()
+        self.watermark = started
+        self.loaded_at = time.monotonic()
+        return {'updated': updated, 'added': added, 'deleted': deleted, 'reloaded': False}
+
+    def _remove_deleted(self, since):
+        """Убирает строки подписок, удалённых после since; возвращает их количество"""
+        ids = set(
+            Tombstone.objects.filter(object_type='subscription', deleted_at__gte=since)
+            .values_list('object_id', flat=True)
+        )
+        if not ids:
+            return 0
+        # Запись есть и при передаче подписки другому пользователю - такие строки остаются
+        ids -= set(Subscription.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        positions = []
+        for pk in ids:
+            position = bisect_left(self.id, pk)
+            if position < len(self.id) and self.id[position] == pk:
+                positions.append(position)
+        if not positions:
+            return 0
+        if numpy is not None:
+            keep = numpy.ones(len(self), dtype=bool)
+            keep[positions] = False
+            for name, typecode in self.typecodes.items():
+                setattr(self, name, array(typecode, self._view(name)[keep].tobytes()))
+        else:
+            removed = set(positions)
+            for name, typecode in self.typecodes.items():
+                column = getattr(self, name)
+                setattr(self, name, array(typecode, (value for index, value in enumerate(column) if index not in removed)))
+        return len(positions)
+
+    # ---------- Измерения и значения ----------
+    def _view(self, name):
+        column = getattr(self, name)
+        return numpy.frombuffer(column, dtype=column.typecode) if len(column) else numpy.zeros(0, column.typecode)
+
+    def _dimension(self, name):
+        """Коды измерения name по строкам и функция перевода кода в значение"""
+        if name == 'company':
+            return self.company, int
+        if name == 'status':
+            return self.status, STATUS_VALUES.__getitem__
+        if name == 'billing_period':
+            return self.period, PERIOD_VALUES.__getitem__
+        if name == 'category':
+            categories = self.company_categories
+            if numpy is None:
+                return [categories.get(company, -1) for company in self.company], int
+            lookup = numpy.full(max(categories, default=0) + 1, -1, dtype=numpy.int64)
+            lookup[list(categories)] = list(categories.values())
+            companies = self._view('company')
+            inside = companies < len(lookup)
+            return numpy.where(inside, lookup[numpy.where(inside, companies, 0)], -1), int
+        if name == 'month':
+            return self._start_months(), month_from_index
+        raise ValueError(f'Неизвестное измерение {name!r}; доступны: {", ".join(DIMENSIONS)}')
+
+    def _start_months(self):
+        if numpy is None:
+            return [month_index(date.fromordinal(ordinal)) for ordinal in self.start]
+        return self._months(self._view('start'))
+
+    @staticmethod
+    def _months(ordinals):
+        """Индексы месяцев (год * 12 + месяц - 1) для порядковых номеров дней"""
+        if not len(ordinals):
+            return numpy.zeros(0, dtype=numpy.int64)
+        # Таблица месяцев на диапазон дат (тысячи дней) и выборка по ней - быстрее перевода каждой даты
+        low, high = int(ordinals.min()), int(ordinals.max())
+        days = (numpy.arange(low, high + 1, dtype=numpy.int64) - _EPOCH_ORDINAL).astype('datetime64[D]')
+        table = days.astype('datetime64[M]').astype(numpy.int64) + 1970 * 12
+        return table[ordinals - low]
+
+    def _values(self, value):
+        """Значения строк: количество, цена в копейках или годовой эквивалент в копейках"""
+        if value not in VALUES:
+            raise ValueError(f'Неизвестное значение {value!r}; доступны: {", ".join(VALUES)}')
+        if value == 'count':
+            return None
+        if value == 'price':
+            return self.price if numpy is None else self._view('price')
+        if numpy is None:
+            return [price * _YEARLY_FACTORS[period] for price, period in zip(self.price, self.period)]
+        return self._view('price') * numpy.array(_YEARLY_FACTORS, dtype=numpy.int64)[self._view('period')]
+
+    def _mask(self, statuses):
+        if statuses is None:
+            return None
+        codes = [STATUS_VALUES.index(status) for status in statuses]
+        if numpy is None:
+            return [status in codes for status in self.status]
+        return numpy.isin(self._view('status'), codes)
+
+    @staticmethod
+    def _result(total, value):
+        if value == 'count':
+            return int(total)
+        if value == 'price':
+            return (Decimal(int(total)) / 100).quantize(Decimal('0.01'))
+        # Годовой эквивалент в копейках -> ежемесячный в рублях
+        return (Decimal(int(total)) / 1200).quantize(Decimal('0.01'))
+
+    # ---------- Группировка ----------
+    def group_sum(self, by, value='price', statuses=None):
+        """
+        Суммы value ('count', 'price' или 'monthly' - ежемесячный эквивалент)
+        по сочетаниям измерений by (из DIMENSIONS; 'month' - месяц начала подписки).
+        statuses ограничивает статусы подписок. Возвращает словарь
+        {кортеж значений измерений: сумма}
+        """
+        by = (by,) if isinstance(by, str) else tuple(by)
+        dimensions = [self._dimension(name) for name in by]
+        weights = self._values(value)
+        mask = self._mask(statuses)
+        if numpy is not None:
+            groups, totals = self._group_numpy([codes for codes, _ in dimensions], weights, mask)
+        else:
+            groups, totals = self._group_python([codes for codes, _ in dimensions], weights, mask)
+        return {
+            tuple(decode(code) for (_, decode), code in zip(dimensions, group)): self._result(total, value)
+            for group, total in zip(groups, totals)
+        }
+
+    def _group_numpy(self, columns, weights, mask):
+        columns = [numpy.asarray(column, dtype=numpy.int64) for column in columns]
+        if mask is not None:
+            columns = [column[mask] for column in columns]
+            weights = None if weights is None else weights[mask]
+        if not columns or not len(columns[0]):
+            return [], []
+        # Сочетание кодов - одно число в смешанной системе счисления (по размаху каждого измерения)
+        code = numpy.zeros(len(columns[0]), dtype=numpy.int64)
+        bases = []
+        for column in columns:
+            low = int(column.min())
+            span = int(column.max()) - low + 1
+            code = code * span + (column - low)
+            bases.append((low, span))
+        weights = None if weights is None else weights.astype(numpy.float64)
+        size = 1
+        for _, span in bases:
+            size *= span
+        if size <= max(len(code), 1 << 20):
+            # Небольшое пространство сочетаний - подсчёт без сортировки
+            counts = numpy.bincount(code, minlength=size)
+            groups = numpy.flatnonzero(counts)
+            totals = counts[groups] if weights is None else numpy.bincount(code, weights=weights, minlength=size)[groups]
+        else:
+            groups, inverse = numpy.unique(code, return_inverse=True)
+            totals = numpy.bincount(inverse, weights=weights, minlength=len(groups))
+        keys = []
+        for low, span in reversed(bases):
+            groups, digits = numpy.divmod(groups, span)
+            keys.append(digits + low)
+        return list(zip(*(key.tolist() for key in reversed(keys)))), numpy.rint(totals).astype(numpy.int64).tolist()
+
+    def _group_python(self, columns, weights, mask):
+        totals = defaultdict(int)
+        rows = zip(*columns)
+        weights = weights if weights is not None else [1] * len(self)
+        for index, (key, weight) in enumerate(zip(rows, weights)):
+            if mask is None or mask[index]:
+                totals[key] += weight
+        return list(totals), list(totals.values())
+
+    def monthly_spend(self, first, months=12, by='category', statuses=('active', 'expired')):
+        """
+        Ежемесячный эквивалент расходов по подпискам, действовавшим в каждом
+        из months месяцев начиная с first (подписка действует с месяца начала
+        по месяц окончания включительно), в разрезе измерения by.
+        Возвращает {значение измерения: [сумма по месяцам]}
+        """
+        if by == 'month':
+            raise ValueError('Месяц уже является осью результата')
+        first = month_index(first)
+        codes, decode = self._dimension(by)
+        weights = self._values('monthly')
+        mask = self._mask(statuses)
+        if numpy is not None:
+            totals = self._monthly_numpy(codes, weights, mask, first, months)
+        else:
+            totals = self._monthly_python(codes, weights, mask, first, months)
+        return {decode(code): [self._result(total, 'monthly') for total in row] for code, row in totals.items()}
+
+    def _monthly_numpy(self, codes, weights, mask, first, months):
+        # Разностный массив по месяцам для каждой группы: +цена в месяце начала, -цена после окончания
+        codes = numpy.asarray(codes, dtype=numpy.int64)
+        ends = self._view('end')
+        start = numpy.clip(self._months(self._view('start')) - first, 0, months)
+        stop = numpy.full(len(ends), months, dtype=numpy.int64)
+        has_end = ends > 0
+        stop[has_end] = numpy.clip(self._months(ends[has_end]) - first + 1, 0, months)
+        selected = start < stop
+        if mask is not None:
+            selected &= mask
+        groups, inverse = numpy.unique(codes[selected], return_inverse=True)
+        if not len(groups):
+            return {}
+        width = months + 1
+        values = weights[selected].astype(numpy.float64)
+        diff = numpy.bincount(inverse * width + start[selected], weights=values, minlength=len(groups) * width)
+        diff -= numpy.bincount(inverse * width + stop[selected], weights=values, minlength=len(groups) * width)
+        totals = numpy.rint(diff.reshape(len(groups), width).cumsum(axis=1)[:, :months]).astype(numpy.int64)
+        return dict(zip(groups.tolist(), totals.tolist()))
+
+    def _monthly_python(self, codes, weights, mask, first, months):
+        diffs = defaultdict(lambda: [0] * (months + 1))
+        for index, (code, weight, start, end) in enumerate(zip(codes, weights, self.start, self.end)):
+            if mask is not None and not mask[index]:
+                continue
+            begin = min(max(month_index(date.fromordinal(start)) - first, 0), months)
+            stop = months if not end else min(max(month_index(date.fromordinal(end)) - first + 1, 0), months)
+            if begin < stop:
+                diffs[code][begin] += weight
+                diffs[code][stop] -= weight
+        totals = {}
+        for code, diff in diffs.items():
+            running, row = 0, []
+            for value in diff[:months]:
+                running += value
+                row.append(running)
+            totals[code] = row
+        return totals
+
+
+# ==================== Общее хранилище процесса ====================
+_lock = threading.Lock()
+_store = None
+
+
+def get_store(max_age=60):
+    """
+    Хранилище процесса: при первом обращении загружается целиком, затем
+    не чаще раза в max_age секунд догружает изменения через refresh()
+    """
+    global _store
+    with _lock:
+        if _store is None:
+            _store = SubscriptionStore().load()
+        elif time.monotonic() - _store.loaded_at > max_age:
+            _store.refresh()
+        return _store
+
+
+def portfolio_spend(first, months=12, by='category', statuses=('active', 'expired')):
+    """
+    Ежемесячные расходы по всем подпискам за months месяцев начиная с first
+    в разрезе измерения by (для SpendPortfolioView)
+    """
+    return get_store().monthly_spend(first, months, by=by, statuses=statuses)
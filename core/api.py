@@ -0,0 +1,434 @@
+"""
+JSON API категорий, компаний и подписок (те же операции, что и HTML-страницы).
+
+    GET    /api/<ресурс>/              список: {"results": [...], "next": курсор, "previous": курсор}
+    POST   /api/<ресурс>/              создание
+    GET    /api/<ресурс>/<id>/         объект
+    PUT    /api/<ресурс>/<id>/         замена (все поля), PATCH - изменение части полей
+    DELETE /api/<ресурс>/<id>/         удаление
+    POST   /api/subscriptions/batch/   {"create": [...], "update": [{"id": 1, ...}]} одной транзакцией
+
+Ответы содержат только перечисленные в *_FIELDS поля и читаются из БД
+через only(). Объекты отдаются с ETag и Last-Modified по updated_at,
+списки - с ETag по версии данных в кэше (см. core.cache), поэтому
+повторный запрос с If-None-Match / If-Modified-Since получает 304, а
+для списка - без обращения к БД. PUT, PATCH и DELETE учитывают If-Match
+(412 при устаревшей версии объекта).
+
+Категории и компании читаются без входа, остальное требует сессии
+(и заголовка X-CSRFToken для изменений, как формы сайта). Частота запросов
+ограничена для каждого пользователя (анонимных - по IP) корзиной токенов
+API_RATE_LIMIT_RATE запросов в секунду с запасом API_RATE_LIMIT_BURST
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.forms import modelform_factory
+from django.forms.models import model_to_dict
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views import View
+
+from .cache import bump_user_subscriptions, get_version, user_subscriptions_version
+from .forms import SubscriptionApiForm
+from .models import Category, Company, PriceEvent, Subscription, UserSubscriptionSummary
+from .pagination import InvalidCursor, KeysetPaginator
+from .ratelimit import TokenBucket
+
+
+CATEGORY_FIELDS = ('id', 'name', 'description', 'updated_at')
+COMPANY_FIELDS = (
+    'id', 'name', 'category', 'description', 'website', 'logo_url', 'subscription_plans', 'updated_at',
+)
+SUBSCRIPTION_FIELDS = (
+    'id', 'company', 'plan_name', 'price', 'billing_period', 'status', 'start_date', 'next_billing_date',
+    'end_date', 'notes', 'updated_at',
+)
+
+
+class ApiError(Exception):
+    """Ошибка запроса, которая возвращается клиенту как JSON {"error": ..., ...}"""
+
+    def __init__(self, status, message, **extra):
+        super().__init__(message)
+        self.status = status
+        self.payload = {'error': message, **extra}
+
+
+def json_response(payload, status=200):
+    content = json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False)
+    return HttpResponse(content, status=status, content_type='application/json')
+
+
+# ==================== Базовые представления ====================
+class ApiView(View):
+    """Ограничение частоты, проверка входа и ошибки в JSON"""
+    public_methods = ()
+
+    def get_client_key(self, request):
+        if request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+    def check_rate_limit(self, request):
+        rate = getattr(settings, 'API_RATE_LIMIT_RATE', None)
+        if not rate:
+            return None
+        burst = getattr(settings, 'API_RATE_LIMIT_BURST', rate)
+        allowed, remaining, retry_after = TokenBucket(self.get_client_key(request), rate, burst).consume()
+        if not allowed:
+            raise ApiError(429, 'Слишком много запросов', retry_after=retry_after)
+        return burst, remaining
+
+    def dispatch(self, request, *args, **kwargs):
+        limit = None
+        try:
+            limit = self.check_rate_limit(request)
+            if request.method not in self.public_methods and not request.user.is_authenticated:
+                raise ApiError(401, 'Требуется вход')
+            response = super().dispatch(request, *args, **kwargs)
+        except ApiError as error:
+            response = json_response(error.payload, status=error.status)
+            if error.status == 429:
+                response['Retry-After'] = error.payload['retry_after']
+        if limit is not None:
+            response['X-RateLimit-Limit'], response['X-RateLimit-Remaining'] = limit
+        return response
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        raise ApiError(405, f'Метод {request.method} не поддерживается')
+
+    def get_payload(self):
+        try:
+            payload = json.loads(self.request.body)
+        except ValueError:
+            raise ApiError(400, 'Тело запроса должно быть JSON')
+        if not isinstance(payload, dict):
+            raise ApiError(400, 'Тело запроса должно быть JSON-объектом')
+        return payload
+
+
+class ResourceMixin:
+    """Описание ресурса: модель, поля ответа, форма и порядок списка"""
+    model = None
+    fields = ()
+    form_class = None
+    ordering = ('pk',)
+    detail_url_name = None
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def serialize(self, obj):
+        opts = self.model._meta
+        return {
+            attname: getattr(obj, attname)
+            for attname in (opts.get_field(name).attname for name in self.fields)
+        }
+
+    def get_form(self, data, instance=None):
+        return self.form_class(data=data, instance=instance)
+
+    def save_form(self, form):
+        return form.save()
+
+    def form_errors(self, form):
+        return ApiError(400, 'Некорректные данные', errors=form.errors.get_json_data())
+
+
+class ResourceListView(ResourceMixin, ApiView):
+    """Список с keyset-пагинацией (?cursor=, ?limit=) и создание объекта"""
+    default_limit = 50
+    max_limit = 200
+
+    def get_list_version(self):
+        """Версия данных списка в кэше: меняется при любом изменении его объектов"""
+        raise NotImplementedError
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        return min(max(limit, 1), self.max_limit)
+
+    def build_list(self):
+        paginator = KeysetPaginator(self.get_queryset().only(*self.fields), self.ordering, self.get_limit())
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise ApiError(400, 'Некорректный курсор страницы')
+        content = json.dumps(
+            {
+                'results': [self.serialize(obj) for obj in page],
+                'next': page.next_cursor,
+                'previous': page.previous_cursor,
+            },
+            cls=DjangoJSONEncoder,
+            ensure_ascii=False,
+        )
+        return content.encode()
+
+    def get(self, request, *args, **kwargs):
+        query_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = f'api:{self.model._meta.model_name}:{self.get_list_version()}:{query_hash}'
+        etag = f'"{hashlib.md5(key.encode()).hexdigest()}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            content = cache.get(key)
+            if content is None:
+                content = self.build_list()
+                cache.set(key, content, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def post(self, request, *args, **kwargs):
+        form = self.get_form(self.get_payload())
+        if not form.is_valid():
+            raise self.form_errors(form)
+        obj = self.save_form(form)
+        response = json_response(self.serialize(obj), status=201)
+        response['Location'] = reverse(self.detail_url_name, args=[obj.pk])
+        return response
+
+
+class ResourceDetailView(ResourceMixin, ApiView):
+    """Объект с ETag / Last-Modified по updated_at; PUT, PATCH и DELETE"""
+
+    def get_object(self, fields=None):
+        queryset = self.get_queryset()
+        if fields:
+            queryset = queryset.only(*fields)
+        obj = queryset.filter(pk=self.kwargs['pk']).first()
+        if obj is None:
+            raise ApiError(404, 'Объект не найден')
+        return obj
+
+    def get_etag(self, obj):
+        return f'"{obj.pk}-{int(obj.updated_at.timestamp() * 1_000_000)}"'
+
+    def conditional(self, obj):
+        """304 (GET) или 412 (изменение) по условным заголовкам запроса, иначе None"""
+        return get_conditional_response(
+            self.request, etag=self.get_etag(obj), last_modified=int(obj.updated_at.timestamp()),
+        )
+
+    def respond(self, obj):
+        response = json_response(self.serialize(obj))
+        response['ETag'] = self.get_etag(obj)
+        response['Last-Modified'] = http_date(obj.updated_at.timestamp())
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def get(self, request, *args, **kwargs):
+        obj = self.get_object(self.fields)
+        response = self.conditional(obj)
+        if response is not None:
+            response['ETag'] = self.get_etag(obj)
+            return response
+        return self.respond(obj)
+
+    def update(self, partial):
+        obj = self.get_object()
+        response = self.conditional(obj)
+        if response is not None:
+            return response
+        payload = self.get_payload()
+        data = {**model_to_dict(obj), **payload} if partial else payload
+        form = self.get_form(data, instance=obj)
+        if not form.is_valid():
+            raise self.form_errors(form)
+        return self.respond(self.save_form(form))
+
+    def put(self, request, *args, **kwargs):
+        return self.update(partial=False)
+
+    def patch(self, request, *args, **kwargs):
+        return self.update(partial=True)
+
+    def delete(self, request, *args, **kwargs):
+        obj = self.get_object()
+        response = self.conditional(obj)
+        if response is not None:
+            return response
+        obj.delete()
+        return HttpResponse(status=204)
+
+
+# ==================== Категории ====================
+class CategoryResource(ResourceMixin):
+    model = Category
+    fields = CATEGORY_FIELDS
+    form_class = modelform_factory(Category, fields=['name', 'description'])
+    ordering = ('name',)
+    detail_url_name = 'api-category-detail'
+    public_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def get_list_version(self):
+        return get_version('category')
+
+
+class CategoryListApi(CategoryResource, ResourceListView):
+    pass
+
+
+class CategoryDetailApi(CategoryResource, ResourceDetailView):
+    pass
+
+
+# ==================== Компании ====================
+class CompanyResource(ResourceMixin):
+    model = Company
+    fields = COMPANY_FIELDS
+    form_class = modelform_factory(
+        Company, fields=['name', 'category', 'description', 'website', 'logo_url', 'subscription_plans'],
+    )
+    ordering = ('name',)
+    detail_url_name = 'api-company-detail'
+    public_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def get_queryset(self):
+        queryset = Company.objects.all()
+        category_id = self.request.GET.get('category', '')
+        if category_id.isdigit():
+            queryset = queryset.filter(category_id=category_id)
+        return queryset
+
+    def get_list_version(self):
+        return get_version('company')
+
+
+class CompanyListApi(CompanyResource, ResourceListView):
+    pass
+
+
+class CompanyDetailApi(CompanyResource, ResourceDetailView):
+    pass
+
+
+# ==================== Подписки ====================
+class SubscriptionResource(ResourceMixin):
+    model = Subscription
+    fields = SUBSCRIPTION_FIELDS
+    form_class = SubscriptionApiForm
+    ordering = ('-start_date', 'id')
+    detail_url_name = 'api-subscription-detail'
+
+    def get_queryset(self):
+        return Subscription.objects.filter(user=self.request.user)
+
+    def get_list_version(self):
+        user_id = self.request.user.pk
+        return f'{user_id}.{user_subscriptions_version(user_id)}'
+
+    def save_form(self, form):
+        form.instance.user = self.request.user
+        return form.save()
+
+
+class SubscriptionListApi(SubscriptionResource, ResourceListView):
+    pass
+
+
+class SubscriptionDetailApi(SubscriptionResource, ResourceDetailView):
+    pass
+
+
+class SubscriptionBatchApi(SubscriptionResource, ApiView):
+    """
+    Создание и изменение до API_BATCH_MAX_SIZE подписок одной транзакцией.
+    Все строки валидируются до записи; при ошибке в любой строке ничего не
+    сохраняется и возвращаются ошибки по индексам строк. Строки пишутся
+    bulk_create / bulk_update, а сводка, история цен и кэш пользователя
+    обновляются один раз на пакет, а не сигналами на каждую строку
+    """
+
+    def get_items(self, payload, name):
+        items = payload.get(name, [])
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ApiError(400, f'{name} должен быть списком объектов')
+        return items
+
+    def post(self, request, *args, **kwargs):
+        payload = self.get_payload()
+        create, update = self.get_items(payload, 'create'), self.get_items(payload, 'update')
+        max_size = getattr(settings, 'API_BATCH_MAX_SIZE', 500)
+        if len(create) + len(update) > max_size:
+            raise ApiError(400, f'В пакете больше {max_size} подписок')
+
+        errors = {'create': {}, 'update': {}}
+        created = []
+        for index, data in enumerate(create):
+            form = self.get_form(data)
+            if form.is_valid():
+                form.instance.user = request.user
+                created.append(form.save(commit=False))
+            else:
+                errors['create'][index] = form.errors.get_json_data()
+
+        ids = [item.get('id') for item in update]
+        existing = self.get_queryset().in_bulk([pk for pk in ids if isinstance(pk, int)])
+        old_prices = {pk: obj.price for pk, obj in existing.items()}
+        updated = []
+        seen = set()
+        for index, data in enumerate(update):
+            obj = existing.get(data.get('id'))
+            if obj is None or obj.pk in seen:
+                message = 'Подписка не найдена' if obj is None else 'Подписка указана в пакете дважды'
+                errors['update'][index] = {'id': [{'message': message, 'code': 'invalid'}]}
+                continue
+            seen.add(obj.pk)
+            form = self.get_form({**model_to_dict(obj), **data}, instance=obj)
+            if form.is_valid():
+                updated.append(form.save(commit=False))
+            else:
+                errors['update'][index] = form.errors.get_json_data()
+
+        if errors['create'] or errors['update']:
+            raise ApiError(400, 'Некорректные данные', errors=errors)
+        self.write(created, updated, old_prices)
+        return json_response({
+            'created': [self.serialize(obj) for obj in created],
+            'updated': [self.serialize(obj) for obj in updated],
+        })
+
+    def write(self, created, updated, old_prices):
+        now = timezone.now()
+        with transaction.atomic():
+            Subscription.objects.bulk_create(created)
+            for obj in updated:
+                obj.updated_at = now
+            Subscription.objects.bulk_update(updated, [name for name in SUBSCRIPTION_FIELDS if name != 'id'])
+            # bulk_create / bulk_update не вызывают сигналы - история цен и сводка явно
+            events = [(obj, obj.start_date) for obj in created]
+            events += [(obj, now.date()) for obj in updated if obj.price != old_prices[obj.pk]]
+            if events:
+                # Категории - из БД в той же транзакции: снимок каталога в кэше
+                # может ещё не знать только что созданную компанию
+                categories = dict(
+                    Subscription.objects.filter(pk__in=[obj.pk for obj, _ in events])
+                    .values_list('pk', 'company__category_id')
+                )
+                PriceEvent.record([
+                    PriceEvent(
+                        subscription_id=obj.pk,
+                        user_id=obj.user_id,
+                        category_id=categories[obj.pk],
+                        kind=PriceEvent.KIND_PRICE_CHANGE,
+                        effective_date=effective_date,
+                        amount=obj.price,
+                    )
+                    for obj, effective_date in events
+                ])
+            UserSubscriptionSummary.rebuild(self.request.user.pk)
+        bump_user_subscriptions([self.request.user.pk])
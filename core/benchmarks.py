@@ -0,0 +1,55 @@
+"""
+Вспомогательные функции для команд бенчмарков
+"""
+
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, connections
+
+
+@contextmanager
+def temporary_database(verbosity=0):
+    """
+    Создаёт отдельную тестовую БД со всеми миграциями и удаляет её после работы.
+    Реплики (settings.DATABASE_REPLICAS) на это время читают ту же тестовую БД
+    """
+    replicas = {alias: connections.settings[alias]['NAME'] for alias in getattr(settings, 'DATABASE_REPLICAS', [])}
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    # Как TEST MIRROR: и для текущего соединения, и для соединений других потоков
+    for alias in replicas:
+        connections[alias].close()
+        connections.settings[alias]['NAME'] = connections[alias].settings_dict['NAME'] = connection.settings_dict['NAME']
+    try:
+        yield
+    finally:
+        for alias, name in replicas.items():
+            connections[alias].close()
+            connections.settings[alias]['NAME'] = connections[alias].settings_dict['NAME'] = name
+        connection.creation.destroy_test_db(old_name, verbosity)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(func, repeat=20, warmup=2):
+    """Выполняет func repeat раз и возвращает p50/p95/среднее в миллисекундах"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+    }
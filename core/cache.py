@@ -0,0 +1,148 @@
+"""
+Версионированные ключи кэша. Каждая модель каталога имеет номер версии,
+который увеличивается при изменении её данных; версия входит в ключи,
+поэтому после изменения старые записи кэша просто перестают читаться.
+
+При репликах (см. core.routers) новая версия REPLICA_PIN_SECONDS секунд
+считается свежей: запрос, прочитавший её, закрепляется за основной БД,
+чтобы не заполнить ключи новой версии данными с отстающей реплики
+"""
+
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .routers import pin_to_primary
+
+
+CATALOG_MODELS = ('category', 'company')
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def _fresh_key(name):
+    return f'version:fresh:{name}'
+
+
+def _mark_fresh(names):
+    """Помечает версии names свежими на время отставания реплик"""
+    if getattr(settings, 'DATABASE_REPLICAS', None):
+        cache.set_many({_fresh_key(name): True for name in names}, timeout=getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+def get_version(name):
+    """Текущая версия данных name; свежая версия закрепляет чтение за основной БД"""
+    values = cache.get_many([_version_key(name), _fresh_key(name)])
+    version = values.get(_version_key(name))
+    if version is None:
+        # Начальная версия по времени: после вытеснения ключа из кэша
+        # версия не вернётся к уже использованному значению
+        version = time.time_ns() // 1000
+        if not cache.add(_version_key(name), version, timeout=None):
+            version = cache.get(_version_key(name), version)
+        pin_to_primary()
+    elif _fresh_key(name) in values:
+        pin_to_primary()
+    return version
+
+
+def bump_version(name):
+    """Увеличивает версию name, делая недействительными связанные записи кэша"""
+    _mark_fresh([name])
+    try:
+        return cache.incr(_version_key(name))
+    except ValueError:
+        version = time.time_ns() // 1000
+        cache.set(_version_key(name), version, timeout=None)
+        return version
+
+
+def catalog_version():
+    """Общая версия каталога (категории и компании)"""
+    return '.'.join(str(get_version(name)) for name in CATALOG_MODELS)
+
+
+async def acatalog_version():
+    """Асинхронный вариант catalog_version() (без перехода в поток, если версии в кэше)"""
+    keys = [_version_key(name) for name in CATALOG_MODELS]
+    versions = await cache.aget_many([*keys, *map(_fresh_key, CATALOG_MODELS)])
+    if not all(key in versions for key in keys):
+        return await sync_to_async(catalog_version)()
+    if len(versions) > len(keys):
+        pin_to_primary()
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def bump_catalog():
+    for name in CATALOG_MODELS:
+        bump_version(name)
+
+
+def user_subscriptions_version(user_id):
+    """Версия подписок пользователя user_id"""
+    return get_version(f'subscriptions:{user_id}')
+
+
+def bump_user_subscriptions(user_ids):
+    """
+    Сбрасывает версии подписок пользователей одним обращением к кэшу
+    (для массовых операций без сигналов): удалённая версия создаётся
+    заново по времени, поэтому старые ключи перестают читаться
+    """
+    _mark_fresh([f'subscriptions:{user_id}' for user_id in user_ids])
+    cache.delete_many([_version_key(f'subscriptions:{user_id}') for user_id in user_ids])
+
+
+def cached_count(queryset, version_name, *key_parts, timeout=None):
+    """COUNT(*) queryset, закэшированный до изменения версии version_name"""
+    key = ':'.join(['count', version_name, str(get_version(version_name)), *map(str, key_parts)])
+    return cache.get_or_set(key, queryset.count, timeout or getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+
+
+class CatalogCacheMixin:
+    """
+    Кэширует страницы каталога целиком для анонимных GET-запросов.
+    Запрос считается анонимным, если у него нет cookie сессии и сообщений:
+    тогда в ответе нет персональных данных и даже сессию читать не нужно.
+    Для остальных запросов в контекст передаётся catalog_version
+    для кэширования фрагментов шаблона
+    """
+    cache_timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+    def is_cacheable_request(self, request):
+        return request.method == 'GET' and not (
+            settings.SESSION_COOKIE_NAME in request.COOKIES or 'messages' in request.COOKIES
+        )
+
+    def get_page_cache_key(self, request):
+        path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return f'catalog:page:{catalog_version()}:{path_hash}'
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_cacheable_request(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        key = self.get_page_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(
+                lambda rendered: cache.set(key, (rendered.content, rendered['Content-Type']), self.cache_timeout)
+            )
+        return response
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['catalog_version'] = catalog_version()
+        context['catalog_cache_timeout'] = self.cache_timeout
+        return context
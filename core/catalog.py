@@ -0,0 +1,88 @@
+"""
+Компактный снимок каталога компаний в памяти процесса: id, название,
+категория и планы с ценами из таблицы Plan. Пересобирается, когда
+меняется версия каталога (см. core.cache), а не на каждый запрос, и
+не реже раза в CATALOG_CACHE_TIMEOUT секунд - на случай, если снимок
+собран по данным, которые ещё не дошли до реплики
+"""
+
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cache import acatalog_version, catalog_version
+from .models import Company, Plan
+
+
+CatalogEntry = namedtuple('CatalogEntry', ['id', 'name', 'category_id', 'category_name', 'plans'])
+
+
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога"""
+
+    def __init__(self, version, entries):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.entries = entries
+        self.by_id = {entry.id: entry for entry in entries}
+
+    def is_current(self, version):
+        age = time.monotonic() - self.built_at
+        return self.version == version and age < getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+    def choices(self):
+        return [(entry.id, entry.name) for entry in self.entries]
+
+    def as_json(self, company_ids=None):
+        entries = self.entries if company_ids is None else [
+            self.by_id[pk] for pk in company_ids if pk in self.by_id
+        ]
+        return [
+            {
+                'id': entry.id,
+                'name': entry.name,
+                'category_id': entry.category_id,
+                'category': entry.category_name,
+                'plans': {name: str(price) for name, price in entry.plans.items()},
+            }
+            for entry in entries
+        ]
+
+
+def build_catalog(version):
+    plans = defaultdict(dict)
+    for company_id, name, price in Plan.objects.order_by('company_id', 'price').values_list('company_id', 'name', 'price'):
+        plans[company_id][name] = price
+    rows = Company.objects.order_by('name').values_list('pk', 'name', 'category_id', 'category__name')
+    return CatalogSnapshot(version, [
+        CatalogEntry(pk, name, category_id, category_name, plans.get(pk, {}))
+        for pk, name, category_id, category_name in rows
+    ])
+
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def get_catalog():
+    """Актуальный снимок каталога (пересобирается при изменении версии)"""
+    global _snapshot
+    version = catalog_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.is_current(version):
+        return snapshot
+    with _lock:
+        if _snapshot is None or not _snapshot.is_current(version):
+            _snapshot = build_catalog(version)
+        return _snapshot
+
+
+async def aget_catalog():
+    """Асинхронный вариант get_catalog(): актуальный снимок отдаётся без перехода в поток"""
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.is_current(await acatalog_version()):
+        return snapshot
+    return await sync_to_async(get_catalog)()
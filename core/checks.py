@@ -0,0 +1,30 @@
+"""
+Проверки конфигурации (manage.py check --deploy)
+"""
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Версии каталога и подписок пользователей (core.cache) и счётчики главной
+    страницы (core.counters) живут в кэше: с кэшем процесса изменение в одном
+    воркере не сбрасывает записи и не меняет счётчики в других
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [Warning(
+        f'Кэш {backend} не общий для процессов: версии каталога и подписок и счётчики '
+        'будут расходиться между воркерами',
+        hint='Задайте REDIS_URL (см. CACHES в settings.py) или запускайте один процесс',
+        id='core.W001',
+    )]
@@ -0,0 +1,81 @@
+"""
+Материализованные счётчики для главной страницы. Значения хранятся
+в таблице Counter и дублируются в кэше; сигналы моделей меняют их на ±1,
+а reconcile() (команда reconcile_counters) сверяет их с COUNT(*) - после
+массовых операций без сигналов и периодически на случай расхождений.
+
+Кэш меняется атомарным cache.incr после фиксации транзакции, а заполняется
+из таблицы через cache.add и живёт COUNTER_CACHE_TIMEOUT секунд: значение,
+прочитанное до чужой фиксации, не затирает свежее и не остаётся навсегда
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import Category, Company, Counter
+
+
+COUNTED_MODELS = {
+    'categories': Category,
+    'companies': Company,
+}
+
+
+def _key(name):
+    return f'counter:{name}'
+
+
+def _timeout():
+    return getattr(settings, 'COUNTER_CACHE_TIMEOUT', 300)
+
+
+def reconcile(names=None):
+    """Пересчитывает счётчики names (по умолчанию - все) по таблицам"""
+    values = {}
+    for name in names or COUNTED_MODELS:
+        values[name] = COUNTED_MODELS[name].objects.count()
+        Counter.objects.update_or_create(name=name, defaults={'value': values[name]})
+    cache.set_many({_key(name): value for name, value in values.items()}, timeout=_timeout())
+    return values
+
+
+def get_counters(names):
+    """Значения счётчиков: из кэша, затем из таблицы Counter, в крайнем случае - пересчётом"""
+    cached = cache.get_many([_key(name) for name in names])
+    values = {name: cached[_key(name)] for name in names if _key(name) in cached}
+    missing = [name for name in names if name not in values]
+    if missing:
+        stored = dict(Counter.objects.filter(name__in=missing).values_list('name', 'value'))
+        for name, value in stored.items():
+            cache.add(_key(name), value, timeout=_timeout())
+        values.update(stored)
+        unknown = [name for name in missing if name not in stored]
+        if unknown:
+            values.update(reconcile(unknown))
+    return values
+
+
+async def aget_counters(names):
+    """Асинхронный вариант get_counters(): при попадании в кэш обходится без потока"""
+    cached = await cache.aget_many([_key(name) for name in names])
+    if len(cached) == len(names):
+        return {name: cached[_key(name)] for name in names}
+    return await sync_to_async(get_counters)(names)
+
+
+def _increment_cached(name, delta):
+    try:
+        cache.incr(_key(name), delta)
+    except ValueError:
+        # Значения в кэше нет - его заполнит следующее чтение
+        pass
+
+
+def increment(name, delta=1):
+    """Меняет счётчик на delta; значение в кэше меняется после фиксации транзакции"""
+    # Если строки счётчика ещё нет, она будет создана пересчётом при первом чтении
+    Counter.objects.filter(name=name).update(value=F('value') + delta)
+    transaction.on_commit(lambda: _increment_cached(name, delta))
@@ -0,0 +1,141 @@
+"""
+Генерация синтетических данных для нагрузочных проверок
+"""
+
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+
+from . import counters, search
+from .cache import bump_catalog
+from .models import BILLING_PERIOD_MONTHS, Category, Company, Plan, Subscription, UserSubscriptionSummary
+
+
+STATUS_WEIGHTS = {'active': 60, 'cancelled': 20, 'expired': 10, 'paused': 10}
+BILLING_PERIOD_WEIGHTS = {'monthly': 70, 'quarterly': 10, 'yearly': 20}
+
+# Темы описаний компаний (чтобы поиску было что находить)
+COMPANY_TOPICS = [
+    'музыка и подкасты',
+    'фильмы и сериалы',
+    'облачное хранилище',
+    'новости и журналы',
+    'фитнес-тренировки',
+    'доставка продуктов',
+    'онлайн-курсы',
+    'облачные игры',
+    'электронные книги',
+    'такси и каршеринг',
+]
+
+# Типовые планы и множитель цены относительно базового
+PLAN_TIERS = [
+    ('Базовая', 1),
+    ('Стандартная', 2),
+    ('Премиум', 3),
+    ('Семейная', 4),
+]
+
+
+def _batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def make_subscription_plans(rng):
+    """Планы компании в формате subscription_plans: {"Базовая": "990", ...}"""
+    base_price = rng.randrange(99, 1000)
+    plan_count = rng.randint(1, len(PLAN_TIERS))
+    return {
+        name: str(int(base_price * multiplier))
+        for name, multiplier in PLAN_TIERS[:plan_count]
+    }
+
+
+def generate_dataset(users=100, companies=50, subscriptions=1000, categories=10, seed=0, batch_size=5000):
+    """
+    Создаёт пользователей, категории, компании и подписки пакетными вставками.
+    Результат воспроизводим для одного и того же seed.
+    Возвращает словарь с количеством созданных объектов
+    """
+    rng = random.Random(seed)
+
+    Category.objects.bulk_create(
+        Category(name=f'Категория {i}', description=f'Синтетическая категория {i}')
+        for i in range(categories)
+    )
+    category_ids = list(Category.objects.values_list('pk', flat=True))
+
+    Company.objects.bulk_create(
+        (
+            Company(
+                name=f'Компания {i}',
+                category_id=rng.choice(category_ids),
+                description=f'Синтетическая компания {i}: {COMPANY_TOPICS[i % len(COMPANY_TOPICS)]}',
+                website=f'https://company{i}.example.com',
+                subscription_plans=make_subscription_plans(rng),
+            )
+            for i in range(companies)
+        ),
+        batch_size=batch_size,
+    )
+    company_plans = [
+        (pk, [(name, Decimal(price)) for name, price in plans.items()])
+        for pk, plans in Company.objects.values_list('pk', 'subscription_plans')
+    ]
+    for start in range(0, len(company_plans), batch_size):
+        Plan.sync_companies(pk for pk, _ in company_plans[start:start + batch_size])
+        search.index_companies(pk for pk, _ in company_plans[start:start + batch_size])
+
+    User.objects.bulk_create(
+        (User(username=f'user{i}', email=f'user{i}@example.com') for i in range(users)),
+        batch_size=batch_size,
+    )
+    user_ids = list(User.objects.values_list('pk', flat=True))
+
+    statuses = list(STATUS_WEIGHTS)
+    status_weights = list(STATUS_WEIGHTS.values())
+    periods = list(BILLING_PERIOD_WEIGHTS)
+    period_weights = list(BILLING_PERIOD_WEIGHTS.values())
+    today = date.today()
+
+    def make_subscription():
+        company_id, plans = rng.choice(company_plans)
+        plan_name, price = rng.choice(plans)
+        period = rng.choices(periods, period_weights)[0]
+        start_date = today - timedelta(days=rng.randrange(5 * 365))
+        return Subscription(
+            user_id=rng.choice(user_ids),
+            company_id=company_id,
+            plan_name=plan_name,
+            price=price * BILLING_PERIOD_MONTHS[period],
+            billing_period=period,
+            status=rng.choices(statuses, status_weights)[0],
+            start_date=start_date,
+            next_billing_date=today + timedelta(days=rng.randrange(BILLING_PERIOD_MONTHS[period] * 31)),
+        )
+
+    for batch in _batched((make_subscription() for _ in range(subscriptions)), batch_size):
+        Subscription.objects.bulk_create(batch)
+
+    # bulk_create не вызывает сигналы - собираем сводки пользователей, сбрасываем кэш каталога
+    # и пересчитываем счётчики
+    for start in range(0, len(user_ids), 1000):
+        UserSubscriptionSummary.rebuild_many(user_ids[start:start + 1000])
+    bump_catalog()
+    counters.reconcile()
+
+    return {
+        'users': len(user_ids),
+        'categories': len(category_ids),
+        'companies': len(company_plans),
+        'subscriptions': subscriptions,
+    }
@@ -0,0 +1,82 @@
+"""
+Данные детальных страниц категорий, компаний и подписок.
+
+Каждая страница читает всё, что показывает, одним запросом (JOIN вместо
+ленивой загрузки связанных объектов, только отображаемые поля) и кэширует
+результат целиком. Ключ включает версию каталога, а для подписки - ещё
+и версию подписок пользователя, поэтому после изменения страница сразу
+собирается заново, а повторные открытия обходятся без запросов к БД
+"""
+
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import catalog_version, user_subscriptions_version
+from .models import Category, Company, Subscription
+
+
+CompanyCard = namedtuple('CompanyCard', ['pk', 'name', 'description'])
+CategoryDetail = namedtuple('CategoryDetail', ['category', 'companies'])
+
+CATEGORY_FIELDS = ('name', 'description', 'created_at', 'updated_at')
+COMPANY_FIELDS = (
+    'name', 'description', 'website', 'subscription_plans', 'created_at', 'updated_at', 'category__name',
+)
+SUBSCRIPTION_FIELDS = (
+    'user', 'plan_name', 'price', 'billing_period', 'status', 'start_date', 'next_billing_date', 'end_date',
+    'notes', 'created_at', 'updated_at', 'company__name', 'company__category__name',
+)
+
+
+def _cached(key, build):
+    # Отсутствующие объекты (DoesNotExist) не кэшируются
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        cache.set(key, payload, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+    return payload
+
+
+def _load_category(pk):
+    # LEFT JOIN с компаниями: строка на компанию (или одна строка без компаний)
+    rows = list(
+        Category.objects.filter(pk=pk)
+        .order_by('companies__name')
+        .values_list(*CATEGORY_FIELDS, 'companies__id', 'companies__name', 'companies__description')
+    )
+    if not rows:
+        raise Category.DoesNotExist
+    category = Category(pk=pk, **dict(zip(CATEGORY_FIELDS, rows[0])))
+    companies = [CompanyCard(*row[len(CATEGORY_FIELDS):]) for row in rows if row[len(CATEGORY_FIELDS)] is not None]
+    return CategoryDetail(category, companies)
+
+
+def category_detail(pk):
+    """Категория и карточки её компаний (CategoryDetail)"""
+    return _cached(f'detail:category:{catalog_version()}:{pk}', lambda: _load_category(pk))
+
+
+def company_detail(pk):
+    """Компания с категорией"""
+    return _cached(
+        f'detail:company:{catalog_version()}:{pk}',
+        lambda: Company.objects.select_related('category').only(*COMPANY_FIELDS).get(pk=pk),
+    )
+
+
+def subscription_detail(user, pk):
+    """Подписка пользователя user с компанией и категорией"""
+    subscription = _cached(
+        f'detail:subscription:{user.pk}:{user_subscriptions_version(user.pk)}:{catalog_version()}:{pk}',
+        lambda: (
+            Subscription.objects.select_related('company__category')
+            .only(*SUBSCRIPTION_FIELDS)
+            .get(pk=pk, user=user)
+        ),
+    )
+    # Ключ уже содержит пользователя; проверка владельца - на случай чужой записи в кэше
+    if subscription.user_id != user.pk:
+        raise Subscription.DoesNotExist
+    return subscription
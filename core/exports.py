@@ -0,0 +1,71 @@
+"""
+Потоковая выгрузка подписок в CSV и NDJSON
+"""
+
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+
+
+# Колонка выгрузки -> поле для values_list
+EXPORT_COLUMNS = [
+    ('id', 'pk'),
+    ('username', 'user__username'),
+    ('company', 'company__name'),
+    ('category', 'company__category__name'),
+    ('plan_name', 'plan_name'),
+    ('price', 'price'),
+    ('billing_period', 'billing_period'),
+    ('status', 'status'),
+    ('start_date', 'start_date'),
+    ('next_billing_date', 'next_billing_date'),
+    ('end_date', 'end_date'),
+    ('notes', 'notes'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, chunk_size=2000):
+    """Строки выгрузки кортежами, без создания экземпляров моделей"""
+    return (
+        queryset
+        .order_by('pk')
+        .values_list(*(lookup for _, lookup in EXPORT_COLUMNS))
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def csv_stream(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([column for column, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def ndjson_stream(rows):
+    columns = [column for column, _ in EXPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n'
+
+
+def export_response(queryset, export_format, filename):
+    """StreamingHttpResponse с выгрузкой queryset в формате export_format"""
+    rows = export_rows(queryset)
+    stream = csv_stream(rows) if export_format == 'csv' else ndjson_stream(rows)
+    response = StreamingHttpResponse(stream, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
@@ -0,0 +1,230 @@
+"""
+Прогноз будущих списаний по активным подпискам.
+
+Подписки загружаются столбцами (цена в копейках, период в месяцах, месяц
+и день следующей оплаты, день начала, месяц и день окончания), после чего списания
+раскладываются по месяцам за один проход без перебора дат: каждая подписка
+даёт "начало" и "конец" серии списаний в разностном массиве своего периода,
+а суммы по месяцам получаются накопленной суммой с шагом периода.
+
+Даты списаний следуют графику core.renewals: следующая оплата, затем
+каждый период в день начала подписки (в коротких месяцах - последний день).
+
+Вычисление векторное на NumPy; тот же алгоритм на списках остаётся
+запасным вариантом для окружений без него
+"""
+
+import calendar
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Cast, Coalesce, ExtractDay, ExtractMonth, ExtractYear, Round
+
+from .models import BILLING_PERIOD_MONTHS, Subscription, month_start
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Индекс месяца для подписок без даты окончания
+NO_END = 10 ** 6
+
+MonthForecast = namedtuple('MonthForecast', ['month', 'amount', 'charges'])
+
+
+class SubscriptionColumns:
+    """Подписки в столбцовом виде (массивы NumPy или списки одинаковой длины)"""
+    names = ('price', 'period', 'month', 'day', 'start_day', 'end_month', 'end_day')
+
+    def __init__(self, price, period, month, day, start_day, end_month, end_day):
+        self.price = price
+        self.period = period
+        self.month = month
+        self.day = day
+        self.start_day = start_day
+        self.end_month = end_month
+        self.end_day = end_day
+
+    def __len__(self):
+        return len(self.price)
+
+    @classmethod
+    def from_rows(cls, rows):
+        columns = list(zip(*rows)) or [()] * len(cls.names)
+        if numpy is not None:
+            columns = [numpy.array(column, dtype=numpy.int64) for column in columns]
+        else:
+            columns = [list(column) for column in columns]
+        return cls(*columns)
+
+
+def month_index(value):
+    return value.year * 12 + value.month - 1
+
+
+def month_from_index(index):
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _month_expression(field):
+    return ExtractYear(field) * 12 + ExtractMonth(field) - 1
+
+
+def load_columns(queryset):
+    """Загружает активные подписки queryset столбцами; даты и цены переводятся в числа в SQL"""
+    rows = (
+        queryset.active()
+        .order_by()
+        .annotate(
+            forecast_price=Cast(Round(F('price') * 100), IntegerField()),
+            forecast_period=Case(
+                *(When(billing_period=period, then=Value(months)) for period, months in BILLING_PERIOD_MONTHS.items()),
+                output_field=IntegerField(),
+            ),
+            forecast_month=_month_expression('next_billing_date'),
+            forecast_day=ExtractDay('next_billing_date'),
+            forecast_start_day=ExtractDay('start_date'),
+            forecast_end_month=Coalesce(_month_expression('end_date'), Value(NO_END)),
+            forecast_end_day=Coalesce(ExtractDay('end_date'), Value(31)),
+        )
+        .values_list(
+            'forecast_price', 'forecast_period', 'forecast_month', 'forecast_day', 'forecast_start_day',
+            'forecast_end_month', 'forecast_end_day',
+        )
+    )
+    return SubscriptionColumns.from_rows(rows)
+
+
+# ==================== Раскладка по месяцам ====================
+# Для каждой подписки: offset - смещение первого списания от первого месяца
+# прогноза (просроченная оплата переносится на ближайшую дату по графику),
+# stop - смещение первого списания после даты окончания. В разностный
+# массив периода p добавляется цена в offset и вычитается в stop; накопленная
+# сумма с шагом p даёт сумму списаний каждого месяца. Списание в месяце
+# окончания учитывается, если его день (день следующей оплаты, если это её
+# месяц, иначе день начала в пределах месяца) не позже дня окончания
+
+def _days_in_month_numpy(month):
+    first = (month - 1970 * 12).astype('datetime64[M]')
+    return ((first + 1).astype('datetime64[D]') - first.astype('datetime64[D]')).astype(numpy.int64)
+
+
+def _ends_before_charge_numpy(columns):
+    charge_day = numpy.where(
+        columns.end_month == columns.month,
+        columns.day,
+        numpy.minimum(columns.start_day, _days_in_month_numpy(columns.end_month)),
+    )
+    return (columns.end_month != NO_END) & (charge_day > columns.end_day)
+
+
+def _ends_before_charge(month, day, start_day, end_month, end_day):
+    if end_month == NO_END:
+        return False
+    if end_month != month:
+        day = min(start_day, calendar.monthrange(end_month // 12, end_month % 12 + 1)[1])
+    return day > end_day
+
+
+def _strided_cumsum(diff, period, months):
+    """Накопленная сумма с шагом period: месяц m получает diff[m] + diff[m - period] + ..."""
+    if numpy is not None:
+        return diff.reshape(-1, period).cumsum(axis=0).ravel()[:months]
+    for index in range(period, len(diff)):
+        diff[index] += diff[index - period]
+    return diff[:months]
+
+
+def _project_numpy(columns, first_month, months):
+    offset = columns.month - first_month
+    offset = numpy.where(offset < 0, offset % columns.period, offset)
+    last = columns.end_month - first_month - _ends_before_charge_numpy(columns)
+    count = numpy.where(last >= offset, (last - offset) // columns.period + 1, 0)
+    stop = offset + count * columns.period
+
+    amounts = numpy.zeros(months, dtype=numpy.int64)
+    charges = numpy.zeros(months, dtype=numpy.int64)
+    for period in set(BILLING_PERIOD_MONTHS.values()):
+        size = -(-months // period) * period
+        selected = columns.period == period
+        starts = selected & (offset < size)
+        ends = selected & (stop < size)
+        for totals, weights in ((amounts, columns.price), (charges, None)):
+            diff = numpy.bincount(
+                offset[starts], weights=None if weights is None else weights[starts], minlength=size
+            ) - numpy.bincount(
+                stop[ends], weights=None if weights is None else weights[ends], minlength=size
+            )
+            totals += _strided_cumsum(numpy.rint(diff).astype(numpy.int64), period, months)
+    return amounts.tolist(), charges.tolist()
+
+
+def _project_python(columns, first_month, months):
+    sizes = {period: -(-months // period) * period for period in set(BILLING_PERIOD_MONTHS.values())}
+    amount_diffs = {period: [0] * size for period, size in sizes.items()}
+    charge_diffs = {period: [0] * size for period, size in sizes.items()}
+    for price, period, month, day, start_day, end_month, end_day in zip(
+        columns.price, columns.period, columns.month, columns.day, columns.start_day,
+        columns.end_month, columns.end_day,
+    ):
+        offset = (month - first_month) % period if month < first_month else month - first_month
+        last = end_month - first_month - _ends_before_charge(month, day, start_day, end_month, end_day)
+        if last < offset or offset >= sizes[period]:
+            continue
+        stop = offset + ((last - offset) // period + 1) * period
+        amount_diffs[period][offset] += price
+        charge_diffs[period][offset] += 1
+        if stop < sizes[period]:
+            amount_diffs[period][stop] -= price
+            charge_diffs[period][stop] -= 1
+
+    amounts = [0] * months
+    charges = [0] * months
+    for period in sizes:
+        for totals, diff in ((amounts, amount_diffs[period]), (charges, charge_diffs[period])):
+            for index, value in enumerate(_strided_cumsum(diff, period, months)):
+                totals[index] += value
+    return amounts, charges
+
+
+def project(columns, first_month, months):
+    """
+    Суммы (в копейках) и количество списаний по месяцам начиная с индекса
+    месяца first_month на months месяцев
+    """
+    if not len(columns):
+        return [0] * months, [0] * months
+    if numpy is not None:
+        return _project_numpy(columns, first_month, months)
+    return _project_python(columns, first_month, months)
+
+
+# ==================== Прогнозы ====================
+def forecast(queryset, today=None, months=12):
+    """Прогноз списаний по активным подпискам queryset на months месяцев начиная с текущего"""
+    first_month = month_index(month_start(today or date.today()))
+    amounts, charges = project(load_columns(queryset), first_month, months)
+    return [
+        MonthForecast(month_from_index(first_month + index), (Decimal(amount) / 100).quantize(Decimal('0.01')), count)
+        for index, (amount, count) in enumerate(zip(amounts, charges))
+    ]
+
+
+def user_forecast(user, today=None, months=12):
+    """Предстоящие списания пользователя по месяцам"""
+    return forecast(Subscription.objects.filter(user=user), today, months)
+
+
+def revenue_forecast(today=None, months=12, timeout=3600):
+    """Прогноз списаний по всем подпискам (кэшируется на timeout секунд)"""
+    today = today or date.today()
+    return cache.get_or_set(
+        f'forecast:all:{today.isoformat()}:{months}',
+        lambda: forecast(Subscription.objects.all(), today, months),
+        timeout,
+    )
@@ -0,0 +1,46 @@
+from django import forms
+
+from .catalog import get_catalog
+from .models import Company, Subscription
+
+
+class SubscriptionForm(forms.ModelForm):
+    """Форма подписки; список компаний берётся из снимка каталога"""
+
+    class Meta:
+        model = Subscription
+        fields = ['company', 'plan_name', 'price', 'billing_period', 'status', 'start_date', 'next_billing_date', 'end_date', 'notes']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        company = self.fields['company']
+        # Для проверки выбранного значения достаточно id и названия
+        company.queryset = Company.objects.only('pk', 'name')
+        company.choices = [('', company.empty_label)] + get_catalog().choices()
+        # Подсказки планов выбранной компании заполняются из /companies/catalog.json
+        self.fields['plan_name'].widget.attrs['list'] = 'plan-options'
+
+
+class SubscriptionApiForm(forms.ModelForm):
+    """
+    Подписка в JSON API. Компания проверяется по снимку каталога, а не
+    запросом к БД, поэтому пакет из сотен подписок валидируется без
+    запроса на каждую строку
+    """
+    company = forms.IntegerField()
+
+    class Meta:
+        model = Subscription
+        fields = ['plan_name', 'price', 'billing_period', 'status', 'start_date', 'next_billing_date', 'end_date', 'notes']
+
+    def clean_company(self):
+        company_id = self.cleaned_data['company']
+        if company_id not in get_catalog().by_id:
+            raise forms.ValidationError('Компания не найдена', code='invalid_choice')
+        return company_id
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if 'company' in cleaned_data:
+            self.instance.company_id = cleaned_data['company']
+        return cleaned_data
@@ -0,0 +1,321 @@
+"""
+Пакетный импорт компаний и подписок из CSV / JSON / NDJSON
+"""
+
+import csv
+import json
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import counters, search
+from .cache import bump_user_subscriptions, bump_version
+from .models import Category, Company, Plan, PriceEvent, Subscription, UserSubscriptionSummary
+
+
+SUBSCRIPTION_UPDATE_FIELDS = [
+    'user', 'company', 'plan_name', 'price', 'billing_period', 'status',
+    'start_date', 'next_billing_date', 'end_date', 'notes', 'updated_at',
+]
+COMPANY_UPDATE_FIELDS = ['category', 'description', 'website', 'logo_url', 'subscription_plans', 'updated_at']
+
+
+class RowError(ValueError):
+    """Ошибка валидации строки импорта"""
+
+
+def read_records(path, file_format=None):
+    """Построчно читает записи-словари из CSV, NDJSON или JSON-массива"""
+    path = Path(path)
+    file_format = file_format or path.suffix.lstrip('.').lower()
+    with path.open(encoding='utf-8', newline='') as source:
+        if file_format == 'csv':
+            yield from csv.DictReader(source)
+        elif file_format in ('ndjson', 'jsonl'):
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        elif file_format == 'json':
+            yield from json.load(source)
+        else:
+            raise ValueError(f'Неизвестный формат файла: {file_format}')
+
+
+def _text(record, key, required=False):
+    value = record.get(key)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f'не заполнено поле {key}')
+    return value or None
+
+
+def _date(record, key, required=False):
+    value = _text(record, key, required)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        raise RowError(f'некорректная дата в поле {key}: {value}')
+
+
+def _choice(record, key, choices, default):
+    value = _text(record, key) or default
+    if value not in dict(choices):
+        raise RowError(f'недопустимое значение поля {key}: {value}')
+    return value
+
+
+class ImportReport:
+    """Итоги импорта: обработанные строки, отклонённые строки и скорость"""
+
+    def __init__(self):
+        self.imported = 0
+        self.rejected = []
+        self.started = time.perf_counter()
+
+    def reject(self, line, reason):
+        self.rejected.append((line, reason))
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+
+class Importer:
+    """
+    Валидирует записи потоком и пишет их пачками bulk_create(update_conflicts=True).
+    Пользователи, компании и категории сопоставляются по именам через словари,
+    которые загружаются один раз и дополняются по мере создания новых объектов
+    """
+
+    def __init__(self, batch_size=5000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+        self.companies = dict(Company.objects.values_list('name', 'pk'))
+        self.touched_users = set()
+
+    # ---------- Категории ----------
+    def _ensure_categories(self, names):
+        missing = {name for name in names if name not in self.categories}
+        if missing and not self.dry_run:
+            Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+            self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'pk'))
+            bump_version('category')
+            counters.reconcile(['categories'])
+
+    # ---------- Компании ----------
+    def import_companies(self, records):
+        report = ImportReport()
+        batch = []
+        for line, record in enumerate(records, start=1):
+            try:
+                batch.append(self._company_row(record))
+            except RowError as exc:
+                report.reject(line, str(exc))
+                continue
+            if len(batch) >= self.batch_size:
+                report.imported += self._write_companies(batch)
+                batch = []
+        if batch:
+            report.imported += self._write_companies(batch)
+        return report
+
+    def _company_row(self, record):
+        plans = record.get('subscription_plans') or {}
+        if isinstance(plans, str):
+            try:
+                plans = json.loads(plans)
+            except ValueError:
+                raise RowError('subscription_plans должен быть JSON-объектом')
+        if not isinstance(plans, dict):
+            raise RowError('subscription_plans должен быть JSON-объектом')
+        return {
+            'name': _text(record, 'name', required=True),
+            'category': _text(record, 'category', required=True),
+            'description': _text(record, 'description'),
+            'website': _text(record, 'website'),
+            'logo_url': _text(record, 'logo_url'),
+            'subscription_plans': plans,
+        }
+
+    def _write_companies(self, rows):
+        if self.dry_run:
+            return len(rows)
+        with transaction.atomic():
+            self._ensure_categories({row['category'] for row in rows})
+            companies = [
+                Company(
+                    category_id=self.categories[row['category']],
+                    **{key: value for key, value in row.items() if key != 'category'},
+                )
+                for row in rows
+            ]
+            old_categories = dict(
+                Company.objects.filter(name__in=[company.name for company in companies]).values_list('name', 'category_id')
+            )
+            Company.objects.bulk_create(
+                companies,
+                update_conflicts=True,
+                unique_fields=['name'],
+                update_fields=COMPANY_UPDATE_FIELDS,
+            )
+        names = [company.name for company in companies]
+        self.companies.update(Company.objects.filter(name__in=names).values_list('name', 'pk'))
+        # bulk_create не вызывает сигналы - обновляем планы и кэш каталога явно
+        Plan.sync_companies(self.companies[name] for name in names)
+        search.index_companies(self.companies[name] for name in names)
+        self._rebuild_recategorized([
+            self.companies[company.name] for company in companies
+            if company.name in old_categories and old_categories[company.name] != company.category_id
+        ])
+        bump_version('company')
+        counters.reconcile(['companies'])
+        return len(companies)
+
+    def _rebuild_recategorized(self, company_ids):
+        """Сводки подписчиков компаний, сменивших категорию (как сигнал при save())"""
+        if not company_ids:
+            return
+        user_ids = sorted(
+            Subscription.objects.filter(company_id__in=company_ids).order_by().values_list('user_id', flat=True).distinct()
+        )
+        for start in range(0, len(user_ids), 1000):
+            UserSubscriptionSummary.rebuild_many(user_ids[start:start + 1000])
+
+    # ---------- Подписки ----------
+    def import_subscriptions(self, records):
+        report = ImportReport()
+        batch = []
+        for line, record in enumerate(records, start=1):
+            try:
+                batch.append((line, self._subscription_row(record)))
+            except RowError as exc:
+                report.reject(line, str(exc))
+                continue
+            if len(batch) >= self.batch_size:
+                report.imported += self._write_subscriptions(batch, report)
+                batch = []
+        if batch:
+            report.imported += self._write_subscriptions(batch, report)
+
+        if self.touched_users and not self.dry_run:
+            # bulk_create не вызывает сигналы - пересчитываем сводки
+            user_ids = sorted(self.touched_users)
+            for start in range(0, len(user_ids), 1000):
+                UserSubscriptionSummary.rebuild_many(user_ids[start:start + 1000])
+                bump_user_subscriptions(user_ids[start:start + 1000])
+        return report
+
+    def _subscription_row(self, record):
+        username = _text(record, 'username', required=True)
+        if username not in self.users:
+            raise RowError(f'пользователь не найден: {username}')
+        try:
+            price = Decimal(_text(record, 'price', required=True))
+        except InvalidOperation:
+            raise RowError(f'некорректная цена: {record.get("price")}')
+        if price < Decimal('0.01'):
+            raise RowError('цена должна быть не меньше 0.01')
+        pk = _text(record, 'id')
+        if pk is not None and not pk.isdigit():
+            raise RowError(f'некорректный id: {pk}')
+
+        return {
+            'company': _text(record, 'company', required=True),
+            'category': _text(record, 'category'),
+            'pk': int(pk) if pk else None,
+            'user_id': self.users[username],
+            'plan_name': _text(record, 'plan_name', required=True),
+            'price': price,
+            'billing_period': _choice(record, 'billing_period', Subscription.BILLING_PERIOD_CHOICES, 'monthly'),
+            'status': _choice(record, 'status', Subscription.STATUS_CHOICES, 'active'),
+            'start_date': _date(record, 'start_date', required=True),
+            'next_billing_date': _date(record, 'next_billing_date', required=True),
+            'end_date': _date(record, 'end_date'),
+            'notes': _text(record, 'notes'),
+        }
+
+    def _write_subscriptions(self, rows, report):
+        # Неизвестные компании создаём, если в строке указана категория
+        new_companies = {
+            row['company']: row['category']
+            for _, row in rows
+            if row['company'] not in self.companies and row['category']
+        }
+        subscriptions = []
+        # id -> номер строки: ON CONFLICT не обновляет одну строку дважды за запрос,
+        # поэтому из повторов id в пачке остаётся последний
+        lines_by_pk = {}
+        with transaction.atomic():
+            if new_companies and not self.dry_run:
+                self._write_companies([
+                    {'name': name, 'category': category, 'subscription_plans': {}}
+                    for name, category in new_companies.items()
+                ])
+            for line, row in rows:
+                company_name = row.pop('company')
+                row.pop('category')
+                company_id = self.companies.get(company_name)
+                if company_id is None and not (self.dry_run and company_name in new_companies):
+                    report.reject(line, f'компания не найдена: {company_name}')
+                    continue
+                subscription = Subscription(company_id=company_id, **row)
+                if subscription.pk:
+                    if subscription.pk in lines_by_pk:
+                        report.reject(lines_by_pk[subscription.pk], f'id {subscription.pk} повторяется в строке {line}')
+                    lines_by_pk[subscription.pk] = line
+                subscriptions.append((line, subscription))
+            subscriptions = [
+                subscription for line, subscription in subscriptions
+                if not subscription.pk or lines_by_pk[subscription.pk] == line
+            ]
+
+            if not self.dry_run:
+                # Сводки прежних владельцев перезаписываемых подписок тоже пересчитываем
+                pks = [subscription.pk for subscription in subscriptions if subscription.pk]
+                old_prices = {}
+                if pks:
+                    for pk, user_id, price in Subscription.objects.filter(pk__in=pks).values_list('pk', 'user_id', 'price'):
+                        self.touched_users.add(user_id)
+                        old_prices[pk] = price
+                Subscription.objects.bulk_create(
+                    subscriptions,
+                    update_conflicts=True,
+                    unique_fields=['id'],
+                    update_fields=SUBSCRIPTION_UPDATE_FIELDS,
+                )
+                # В историю цен: начальная цена новых подписок и изменения цен существующих
+                today = date.today()
+                effective_dates = {}
+                for subscription in subscriptions:
+                    if subscription.pk not in old_prices:
+                        effective_dates[subscription.pk] = subscription.start_date
+                    elif old_prices[subscription.pk] != subscription.price:
+                        effective_dates[subscription.pk] = today
+                if effective_dates:
+                    PriceEvent.record([
+                        PriceEvent(
+                            subscription_id=pk,
+                            user_id=user_id,
+                            category_id=category_id,
+                            kind=PriceEvent.KIND_PRICE_CHANGE,
+                            effective_date=effective_dates[pk],
+                            amount=price,
+                        )
+                        for pk, user_id, category_id, price in Subscription.objects.filter(
+                            pk__in=list(effective_dates),
+                        ).values_list('pk', 'user_id', 'company__category_id', 'price')
+                    ])
+        self.touched_users.update(subscription.user_id for subscription in subscriptions)
+        return len(subscriptions)
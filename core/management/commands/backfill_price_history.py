@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from core.models import MonthlySpend
+from core.renewals import backfill_price_history
+
+
+class Command(BaseCommand):
+    help = 'Заполняет историю цен (PriceEvent) и помесячные свёртки расходов (MonthlySpend)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Подписок за одну транзакцию')
+        parser.add_argument(
+            '--rollups-only', action='store_true',
+            help='Только пересобрать помесячные свёртки по уже записанной истории',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if options['rollups_only']:
+            users = User.objects.order_by('pk')
+            last_pk = 0
+            while True:
+                user_ids = list(users.filter(pk__gt=last_pk).values_list('pk', flat=True)[:chunk_size])
+                if not user_ids:
+                    break
+                MonthlySpend.refresh(user_ids)
+                last_pk = user_ids[-1]
+            self.stdout.write(self.style.SUCCESS('Свёртки расходов пересобраны'))
+            return
+
+        recorded = backfill_price_history(chunk_size=chunk_size)
+        self.stdout.write(self.style.SUCCESS(f'Записано событий истории цен: {recorded}'))
@@ -0,0 +1,112 @@
+import json
+import time
+from contextlib import contextmanager
+from datetime import date
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.benchmarks import measure, temporary_database
+from core.datagen import generate_dataset
+from core.models import Category, Subscription
+
+
+# Настройки SubscriptionAdmin по умолчанию Django - для сравнения
+BASELINE_OPTIONS = {
+    'list_select_related': False,
+    'paginator': Paginator,
+    'show_full_result_count': True,
+    'list_filter': ('status', 'billing_period', 'company__category', 'created_at'),
+    'date_hierarchy_cache_timeout': 0,
+}
+
+
+@contextmanager
+def admin_options(model_admin, options):
+    """Временно переопределяет атрибуты экземпляра ModelAdmin"""
+    for name, value in options.items():
+        setattr(model_admin, name, value)
+    try:
+        yield
+    finally:
+        for name in options:
+            delattr(model_admin, name)
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет время открытия списка подписок в админке (без фильтров, с фильтрами, '
+        'date_hierarchy, дальняя страница, поиск) с настройками Django по умолчанию '
+        'и с текущими настройками SubscriptionAdmin. Работает на временной БД'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Количество подписок')
+        parser.add_argument('--users', type=int, default=20_000)
+        parser.add_argument('--companies', type=int, default=2_000)
+        parser.add_argument('--repeat', type=int, default=10, help='Повторов каждого запроса')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            self.stdout.write(f'Генерация {options["rows"]} подписок...')
+            generate_dataset(
+                users=options['users'], companies=options['companies'], subscriptions=options['rows'],
+            )
+            with connection.cursor() as cursor:
+                # Статистика планировщика нужна и индексам, и оценке количества строк
+                cursor.execute('ANALYZE')
+            results = self.run(options['repeat'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+
+    def pages(self):
+        url = reverse('admin:core_subscription_changelist')
+        category_id = Category.objects.values_list('pk', flat=True).first()
+        return {
+            'без фильтров': url,
+            'статус': f'{url}?status__exact=active',
+            'категория': f'{url}?company__category__id__exact={category_id}',
+            'год': f'{url}?start_date__year={date.today().year}',
+            'страница 100': f'{url}?p=100',
+            'поиск': f'{url}?q=plan',
+        }
+
+    def run(self, repeat):
+        superuser = User.objects.create_superuser('bench-admin', 'bench@example.com', 'bench')
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(superuser)
+        model_admin = admin.site._registry[Subscription]
+
+        results = {}
+        for label, overrides in (('django', BASELINE_OPTIONS), ('настроенная', {})):
+            with admin_options(model_admin, overrides):
+                results[label] = {name: self.measure_page(client, url, repeat) for name, url in self.pages().items()}
+            for name, result in results[label].items():
+                self.stdout.write(
+                    f'{label:<12} {name:<14} первый {result["cold_ms"]:>9} мс  p50 {result["p50_ms"]:>9} мс  '
+                    f'p95 {result["p95_ms"]:>9} мс  запросов {result["queries"]}'
+                )
+        return results
+
+    def measure_page(self, client, url, repeat):
+        def request():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: ответ {response.status_code}')
+
+        cache.clear()
+        client.force_login(User.objects.get(username='bench-admin'))
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            request()
+        cold_ms = round((time.perf_counter() - started) * 1000, 3)
+        return {'cold_ms': cold_ms, 'queries': len(queries), **measure(request, repeat=repeat, warmup=0)}
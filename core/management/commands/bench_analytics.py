@@ -0,0 +1,83 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from core import analytics
+from core.benchmarks import measure, temporary_database
+from core.datagen import generate_dataset
+from core.forecast import month_from_index, month_index
+from core.models import Subscription
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет столбцовое хранилище подписок (core.analytics): загрузку, память, '
+        'догрузку изменений и группировки в сравнении с GROUP BY в БД. Работает на временной БД'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Количество подписок')
+        parser.add_argument('--users', type=int, default=20_000)
+        parser.add_argument('--companies', type=int, default=2_000)
+        parser.add_argument('--changes', type=int, default=10_000, help='Изменённых подписок перед догрузкой')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        backend = 'numpy' if analytics.numpy is not None else 'python'
+        with temporary_database():
+            self.stdout.write(f'Генерация {options["rows"]} подписок...')
+            generate_dataset(users=options['users'], companies=options['companies'], subscriptions=options['rows'])
+            # Как в рабочей БД: большинство подписок давно не менялось
+            Subscription.objects.update(updated_at=timezone.now() - timedelta(days=1))
+
+            started = time.perf_counter()
+            store = analytics.SubscriptionStore().load()
+            self.stdout.write(
+                f'Загрузка: {time.perf_counter() - started:.2f} с, строк {len(store)}, '
+                f'память {store.memory_bytes() / 2 ** 20:.1f} МиБ, вычисление: {backend}'
+            )
+
+            self.report('Догрузка без изменений', measure(store.refresh, repeat=options['repeat'], warmup=0))
+            self.bench_refresh(store, options['changes'])
+            self.bench_grouping(store, options['repeat'])
+
+    def report(self, label, result):
+        self.stdout.write(f'{label:<40} p50 {result["p50_ms"]:>10} мс  p95 {result["p95_ms"]:>10} мс')
+
+    def bench_refresh(self, store, changes):
+        ids = list(Subscription.objects.order_by('?').values_list('pk', flat=True)[:changes])
+        for start in range(0, len(ids), 900):
+            Subscription.objects.filter(pk__in=ids[start:start + 900]).update(status='paused', updated_at=timezone.now())
+        started = time.perf_counter()
+        result = store.refresh()
+        self.stdout.write(
+            f'Догрузка {changes} изменений: {(time.perf_counter() - started) * 1000:.1f} мс, '
+            f'обновлено {result["updated"]}, удалено {result["deleted"]}, перезагрузка: {result["reloaded"]}'
+        )
+
+    def bench_grouping(self, store, repeat):
+        by_category_month = store.group_sum(('category', 'month'), 'price')
+        rows = (
+            Subscription.objects.order_by()
+            .values_list('company__category_id', TruncMonth('start_date'))
+            .annotate(total=Sum('price'), count=Count('pk'))
+        )
+        expected = {(category, month): total for category, month, total, _ in rows}
+        if {key: total.quantize(by_category_month[key]) for key, total in expected.items()} != by_category_month:
+            raise CommandError('Суммы по категориям и месяцам не совпадают с GROUP BY в БД')
+
+        self.report('Хранилище: категория x месяц начала', measure(
+            lambda: store.group_sum(('category', 'month'), 'price'), repeat=repeat,
+        ))
+        self.report('БД: GROUP BY категория, месяц начала', measure(lambda: list(rows.all()), repeat=repeat))
+        self.report('Хранилище: компания x статус', measure(
+            lambda: store.group_sum(('company', 'status'), 'monthly'), repeat=repeat,
+        ))
+        first = month_from_index(month_index(date.today()) - 11)
+        self.report('Хранилище: расходы по категориям, 12 мес.', measure(
+            lambda: store.monthly_spend(first, 12, by='category'), repeat=repeat,
+        ))
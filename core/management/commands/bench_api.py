@@ -0,0 +1,127 @@
+import json
+from contextlib import ExitStack, contextmanager
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+
+from core.benchmarks import measure, temporary_database
+from core.datagen import generate_dataset
+from core.metrics import QueryCollector
+from core.models import Category, Company, Subscription
+
+
+@contextmanager
+def count_queries():
+    """Считает запросы ко всем БД (чтение идёт и с реплик)"""
+    collector = QueryCollector()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(collector))
+        yield collector
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает JSON API (core.api) с HTML-страницами: размер ответа, время и запросы к БД '
+        'для списков и объектов, повторные запросы с ETag (304) и пакетное создание подписок. '
+        'Работает на временной БД'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help='Количество подписок')
+        parser.add_argument('--users', type=int, default=1_000)
+        parser.add_argument('--companies', type=int, default=500)
+        parser.add_argument('--batch', type=int, default=100, help='Подписок в пакетном создании')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with temporary_database(), override_settings(API_RATE_LIMIT_RATE=None):
+            self.stdout.write(f'Генерация {options["rows"]} подписок...')
+            generate_dataset(users=options['users'], companies=options['companies'], subscriptions=options['rows'])
+            user_id = (
+                Subscription.objects.order_by().values('user_id')
+                .annotate(count=Count('pk')).order_by('-count').values_list('user_id', flat=True)[0]
+            )
+            client = Client(SERVER_NAME='localhost')
+            client.force_login(User.objects.get(pk=user_id))
+
+            self.compare_pages(client, user_id, options['repeat'])
+            self.bench_revalidation(client, user_id, options['repeat'])
+            self.bench_batch(client, options['batch'])
+
+    def request(self, client, url, status=200, **headers):
+        response = client.get(url, headers=headers)
+        if response.status_code != status:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+        return response
+
+    def pages(self, user_id):
+        subscription_id = Subscription.objects.filter(user_id=user_id).values_list('pk', flat=True).first()
+        company_id = Company.objects.values_list('pk', flat=True).first()
+        category_id = Category.objects.values_list('pk', flat=True).first()
+        return {
+            'список подписок': ('/subscriptions/', '/api/subscriptions/?limit=10'),
+            'подписка': (f'/subscriptions/{subscription_id}/', f'/api/subscriptions/{subscription_id}/'),
+            'список компаний': ('/companies/', '/api/companies/?limit=12'),
+            'компания': (f'/companies/{company_id}/', f'/api/companies/{company_id}/'),
+            'список категорий': ('/categories/', '/api/categories/?limit=10'),
+            'категория': (f'/categories/{category_id}/', f'/api/categories/{category_id}/'),
+        }
+
+    def measure_url(self, client, url, repeat, **headers):
+        status = 304 if headers else 200
+        with count_queries() as queries:
+            response = self.request(client, url, status, **headers)
+        result = measure(lambda: self.request(client, url, status, **headers), repeat=repeat)
+        return {'bytes': len(response.content), 'queries': queries.count, **result}
+
+    def report(self, label, result):
+        self.stdout.write(
+            f'{label:<34} {result["bytes"]:>8} байт  p50 {result["p50_ms"]:>8} мс  '
+            f'p95 {result["p95_ms"]:>8} мс  запросов {result["queries"]}'
+        )
+
+    def compare_pages(self, client, user_id, repeat):
+        for name, (html_url, api_url) in self.pages(user_id).items():
+            self.report(f'{name}: HTML', self.measure_url(client, html_url, repeat))
+            self.report(f'{name}: API', self.measure_url(client, api_url, repeat))
+
+    def bench_revalidation(self, client, user_id, repeat):
+        for name, (_, api_url) in self.pages(user_id).items():
+            etag = self.request(client, api_url)['ETag']
+            self.report(f'{name}: API, 304', self.measure_url(client, api_url, repeat, if_none_match=etag))
+
+    def bench_batch(self, client, size):
+        company_id = Company.objects.values_list('pk', flat=True).first()
+        start = date.today()
+
+        def items(prefix):
+            return [
+                {
+                    'company': company_id, 'plan_name': f'{prefix} {index}', 'price': '9.99',
+                    'billing_period': 'monthly', 'status': 'active',
+                    'start_date': start.isoformat(), 'next_billing_date': (start + timedelta(days=30)).isoformat(),
+                }
+                for index in range(size)
+            ]
+
+        with count_queries() as queries:
+            single = measure(lambda: [
+                client.post('/api/subscriptions/', json.dumps(item), content_type='application/json')
+                for item in items('single')
+            ], repeat=1, warmup=0)
+        self.stdout.write(f'{size} x POST /api/subscriptions/: {single["p50_ms"]} мс, запросов {queries.count}')
+
+        with count_queries() as queries:
+            batch = measure(lambda: self.post_batch(client, items('batch')), repeat=1, warmup=0)
+        self.stdout.write(f'POST /api/subscriptions/batch/ ({size}): {batch["p50_ms"]} мс, запросов {queries.count}')
+
+    def post_batch(self, client, items):
+        response = client.post('/api/subscriptions/batch/', json.dumps({'create': items}), content_type='application/json')
+        if response.status_code != 200:
+            raise CommandError(f'Пакетное создание: ответ {response.status_code} {response.content[:500]!r}')
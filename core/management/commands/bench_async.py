@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from core.benchmarks import percentile, temporary_database
+from core.datagen import generate_dataset
+from core.models import UserSubscriptionSummary
+
+
+ROUTES = ('home', 'company-catalog', 'subscription-stats')
+
+
+def _summary(timings, elapsed):
+    return {
+        'requests': len(timings),
+        'rps': round(len(timings) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает асинхронные маршруты под ASGI с обработкой через WSGI при конкурентной нагрузке. '
+        'По умолчанию обработчики вызываются в процессе (AsyncClient и Client в потоках); '
+        'с --asgi-url/--wsgi-url запросы идут на запущенные серверы, '
+        'например uvicorn subscribe_track.asgi:application и manage.py runserver'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--companies', type=int, default=500)
+        parser.add_argument('--subscriptions', type=int, default=100_000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--existing', action='store_true', help='Использовать текущую БД вместо временной')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на маршрут')
+        parser.add_argument('--concurrency', type=int, default=20, help='Одновременных запросов')
+        parser.add_argument('--asgi-url', help='Адрес запущенного ASGI-сервера (требует --existing)')
+        parser.add_argument('--wsgi-url', help='Адрес запущенного WSGI-сервера (требует --existing)')
+
+    def handle(self, *args, **options):
+        if (options['asgi_url'] or options['wsgi_url']) and not options['existing']:
+            raise CommandError('Внешние серверы работают с текущей БД - укажите --existing')
+        if options['existing']:
+            return self.run(options)
+        with temporary_database():
+            self.stdout.write('Генерация данных...')
+            generate_dataset(
+                users=options['users'],
+                companies=options['companies'],
+                subscriptions=options['subscriptions'],
+                seed=options['seed'],
+            )
+            self.run(options)
+
+    def run(self, options):
+        summary = UserSubscriptionSummary.objects.select_related('user').order_by('-total_count').first()
+        if summary is None:
+            raise CommandError('В БД нет пользователей с подписками')
+        login = Client(SERVER_NAME='localhost')
+        login.force_login(summary.user)
+        session = login.cookies[settings.SESSION_COOKIE_NAME].value
+
+        count, concurrency = options['requests'], options['concurrency']
+        for name in ROUTES:
+            path = reverse(name)
+            results = {}
+            if options['asgi_url'] or options['wsgi_url']:
+                for label in ('asgi', 'wsgi'):
+                    if options[f'{label}_url']:
+                        results[label] = self.bench_http(options[f'{label}_url'] + path, session, count, concurrency)
+            else:
+                results['asgi'] = asyncio.run(self.bench_asgi(path, session, count, concurrency))
+                results['wsgi'] = self.bench_wsgi(path, session, count, concurrency)
+            for label, result in results.items():
+                self.stdout.write(
+                    f'{name:<20} {label}: {result["rps"]:>8} запр/с  '
+                    f'p50 {result["p50_ms"]:>8} мс  p95 {result["p95_ms"]:>8} мс'
+                )
+
+    async def bench_asgi(self, path, session, count, concurrency):
+        client = AsyncClient(SERVER_NAME='localhost')
+        client.cookies[settings.SESSION_COOKIE_NAME] = session
+        semaphore = asyncio.Semaphore(concurrency)
+        timings = []
+
+        async def request():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f'{path}: ответ {response.status_code}')
+
+        started = time.perf_counter()
+        await asyncio.gather(*(request() for _ in range(count)))
+        return _summary(timings, time.perf_counter() - started)
+
+    def bench_wsgi(self, path, session, count, concurrency):
+        local = threading.local()
+
+        def request(_):
+            if not hasattr(local, 'client'):
+                local.client = Client(SERVER_NAME='localhost')
+                local.client.cookies[settings.SESSION_COOKIE_NAME] = session
+            started = time.perf_counter()
+            response = local.client.get(path)
+            if response.status_code != 200:
+                raise CommandError(f'{path}: ответ {response.status_code}')
+            return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            timings = list(executor.map(request, range(count)))
+        return _summary(timings, time.perf_counter() - started)
+
+    def bench_http(self, url, session, count, concurrency):
+        cookie = f'{settings.SESSION_COOKIE_NAME}={session}'
+
+        def request(_):
+            started = time.perf_counter()
+            with urllib.request.urlopen(urllib.request.Request(url, headers={'Cookie': cookie})) as response:
+                response.read()
+            return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            timings = list(executor.map(request, range(count)))
+        return _summary(timings, time.perf_counter() - started)
@@ -0,0 +1,137 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from core.benchmarks import percentile, temporary_database
+from core.datagen import generate_dataset
+from core.models import UserSubscriptionSummary
+
+
+ROUTES = ('category-list', 'company-list', 'subscription-list')
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет пропускную способность списков для профилей БД (DB_PROFILE). '
+        'Каждый профиль запускается в отдельном процессе: временная БД с синтетическими '
+        'данными и локальный многопоточный WSGI-сервер, чтобы соединения открывались '
+        'и закрывались как в реальном сервере (CONN_MAX_AGE)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default='sqlite,sqlite-wal', help='Профили через запятую')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--companies', type=int, default=500)
+        parser.add_argument('--subscriptions', type=int, default=100_000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=500, help='Запросов на маршрут')
+        parser.add_argument('--concurrency', type=int, default=8, help='Одновременных запросов')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+        parser.add_argument('--run-current', action='store_true', help='Измерить только текущий профиль (JSON в stdout)')
+
+    def handle(self, *args, **options):
+        if options['run_current']:
+            self.stdout.write(json.dumps(self.run_current(options)))
+            return
+
+        results = {}
+        for profile in filter(None, options['profiles'].split(',')):
+            results[profile] = self.run_profile(profile, options)
+            for route, result in results[profile].items():
+                self.stdout.write(
+                    f'{profile:<12} {route:<20} {result["rps"]:>8} запр/с  '
+                    f'p50 {result["p50_ms"]:>8} мс  p95 {result["p95_ms"]:>8} мс'
+                )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+
+    def run_profile(self, profile, options):
+        command = [
+            sys.executable, sys.argv[0], 'bench_db_profiles', '--run-current',
+            *(f'--{key}={options[key]}' for key in ('users', 'companies', 'subscriptions', 'seed', 'requests', 'concurrency')),
+        ]
+        completed = subprocess.run(
+            command, env={**os.environ, 'DB_PROFILE': profile}, capture_output=True, text=True,
+        )
+        if completed.returncode:
+            raise CommandError(f'Профиль {profile}: {completed.stderr.strip()[-2000:]}')
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def run_current(self, options):
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # Тестовая БД SQLite по умолчанию в памяти - для сравнения PRAGMA нужен файл
+                connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            with temporary_database():
+                generate_dataset(
+                    users=options['users'],
+                    companies=options['companies'],
+                    subscriptions=options['subscriptions'],
+                    seed=options['seed'],
+                )
+                return self.serve_and_measure(options)
+
+    def serve_and_measure(self, options):
+        summary = UserSubscriptionSummary.objects.select_related('user').order_by('-total_count').first()
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(summary.user)
+        # Сессия нужна, чтобы списки не отдавались из кэша страниц каталога
+        cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        connection.close()
+
+        server = make_server(
+            '127.0.0.1', 0, get_wsgi_application(), server_class=_ThreadingWSGIServer, handler_class=_QuietHandler,
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://localhost:{server.server_port}'
+        try:
+            return {
+                name: self.measure_route(base_url + reverse(name), cookie, options['requests'], options['concurrency'])
+                for name in ROUTES
+            }
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def measure_route(self, url, cookie, count, concurrency):
+        def request(_):
+            started = time.perf_counter()
+            with urllib.request.urlopen(urllib.request.Request(url, headers={'Cookie': cookie})) as response:
+                response.read()
+            return (time.perf_counter() - started) * 1000
+
+        request(None)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            timings = list(executor.map(request, range(count)))
+        elapsed = time.perf_counter() - started
+        return {
+            'rps': round(count / elapsed, 1),
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+        }
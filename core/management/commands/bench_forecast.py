@@ -0,0 +1,48 @@
+import random
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from core import forecast
+from core.benchmarks import measure
+from core.models import BILLING_PERIOD_MONTHS
+
+
+class Command(BaseCommand):
+    help = 'Измеряет раскладку прогноза списаний по месяцам на синтетических столбцах подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Количество подписок')
+        parser.add_argument('--months', type=int, default=12, help='Горизонт прогноза в месяцах')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        first_month = forecast.month_index(date.today())
+        periods = list(BILLING_PERIOD_MONTHS.values())
+        rows = []
+        for _ in range(options['rows']):
+            month = first_month + rng.randint(-1, 11)
+            has_end = rng.random() < 0.2
+            rows.append((
+                rng.randint(9900, 299000),
+                rng.choice(periods),
+                month,
+                rng.randint(1, 28),
+                rng.randint(1, 31),
+                month + rng.randint(0, 24) if has_end else forecast.NO_END,
+                rng.randint(1, 28) if has_end else 31,
+            ))
+        columns = forecast.SubscriptionColumns.from_rows(rows)
+
+        backend = 'numpy' if forecast.numpy is not None else 'python'
+        self.stdout.write(f'Подписок: {len(columns)}, горизонт: {options["months"]} мес., вычисление: {backend}')
+        result = measure(
+            lambda: forecast.project(columns, first_month, options['months']),
+            repeat=options['repeat'],
+            warmup=1,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'p50 {result["p50_ms"]} мс, p95 {result["p95_ms"]} мс, среднее {result["mean_ms"]} мс'
+        ))
@@ -0,0 +1,90 @@
+import json
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from core.benchmarks import measure, temporary_database
+from core.datagen import generate_dataset
+from core.models import Subscription
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает планы и время основных запросов к Subscription без индексов '
+        'из Meta.indexes и с ними. Работает на временной БД'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Количество подписок')
+        parser.add_argument('--users', type=int, default=20_000, help='Количество пользователей')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов каждого запроса')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+
+    def queries(self, user_id):
+        """Запросы бенчмарка: название -> (queryset для EXPLAIN, функция выполнения)"""
+        today = date.today()
+        user_subscriptions = Subscription.objects.filter(user_id=user_id).order_by()
+        querysets = {
+            'список пользователя': Subscription.objects.filter(user_id=user_id).order_by('-start_date', 'id')[:10],
+            'активные пользователя': (
+                Subscription.objects.filter(user_id=user_id, status='active').order_by('-start_date')[:10]
+            ),
+            'ближайшие списания': (
+                Subscription.objects.filter(status='active', next_billing_date__lte=today)
+                .order_by('next_billing_date')[:1000]
+            ),
+            'админка: статус и период': (
+                Subscription.objects.filter(status='cancelled', billing_period='yearly').order_by('-start_date')[:100]
+            ),
+            'админка: date_hierarchy': (
+                Subscription.objects.filter(start_date__year=today.year).order_by('-start_date')[:100]
+            ),
+            'админка: created_at': (
+                Subscription.objects.filter(created_at__gte=timezone.now() - timedelta(days=1)).order_by('-created_at')[:100]
+            ),
+        }
+        queries = {name: (queryset, lambda queryset=queryset: list(queryset.all())) for name, queryset in querysets.items()}
+        queries['статистика пользователя'] = (user_subscriptions, user_subscriptions.stats)
+        return queries
+
+    def run_queries(self, user_id, repeat):
+        return {
+            name: {'plan': queryset.explain(), **measure(execute, repeat=repeat)}
+            for name, (queryset, execute) in self.queries(user_id).items()
+        }
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            self.stdout.write(f'Генерация {options["rows"]} подписок...')
+            generate_dataset(users=options['users'], companies=500, subscriptions=options['rows'])
+            user_id = Subscription.objects.values_list('user_id', flat=True).first()
+            indexes = Subscription._meta.indexes
+
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.remove_index(Subscription, index)
+            self._analyze()
+            before = self.run_queries(user_id, options['repeat'])
+
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(Subscription, index)
+            self._analyze()
+            after = self.run_queries(user_id, options['repeat'])
+
+        for name in before:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(f'  без индексов: p50 {before[name]["p50_ms"]} мс, p95 {before[name]["p95_ms"]} мс')
+            self.stdout.write(f'    {before[name]["plan"]}')
+            self.stdout.write(f'  с индексами:  p50 {after[name]["p50_ms"]} мс, p95 {after[name]["p95_ms"]} мс')
+            self.stdout.write(f'    {after[name]["plan"]}')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump({'rows': options['rows'], 'before': before, 'after': after}, output, ensure_ascii=False, indent=2)
+
+    def _analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
@@ -0,0 +1,208 @@
+import json
+import platform
+import subprocess
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from core import urls as core_urls
+from core.benchmarks import measure, temporary_database
+from core.cache import bump_user_subscriptions
+from core.datagen import generate_dataset
+from core.models import Category, Company, Subscription, UserSubscriptionSummary
+
+
+# Маршрут с pk -> объект, который в него подставляется
+SAMPLE_ROUTES = {
+    'category-detail': 'category',
+    'category-update': 'category',
+    'category-delete': 'category',
+    'company-detail': 'company',
+    'company-update': 'company',
+    'company-delete': 'company',
+    'subscription-detail': 'subscription',
+    'subscription-update': 'subscription',
+    'subscription-delete': 'subscription',
+    'api-category-detail': 'category',
+    'api-company-detail': 'company',
+    'api-subscription-detail': 'subscription',
+}
+
+
+def _consume(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет все GET-маршруты core.urls через тестовый клиент и сохраняет число SQL-запросов, '
+        'p50/p95 времени ответа и пиковую память в JSON. По умолчанию работает на временной БД '
+        'с синтетическими данными'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--companies', type=int, default=500)
+        parser.add_argument('--subscriptions', type=int, default=100_000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--existing', action='store_true', help='Использовать текущую БД вместо временной')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов каждого маршрута')
+        parser.add_argument('--skip', action='append', default=[], help='Пропустить маршрут по имени')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+        parser.add_argument('--compare', help='Сравнить с результатами из JSON-файла')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Допустимый рост p95 (доля)')
+
+    def handle(self, *args, **options):
+        if options['existing']:
+            results = self.run_routes(options)
+        else:
+            with temporary_database():
+                self.stdout.write('Генерация данных...')
+                generate_dataset(
+                    users=options['users'],
+                    companies=options['companies'],
+                    subscriptions=options['subscriptions'],
+                    seed=options['seed'],
+                )
+                results = self.run_routes(options)
+
+        report = {
+            'meta': {
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'git_revision': _git_revision(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'dataset': {
+                    key: options[key] for key in ('users', 'companies', 'subscriptions', 'seed', 'existing')
+                },
+                'repeat': options['repeat'],
+            },
+            'routes': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(results, options['compare'], options['threshold'])
+
+    def sample_kwargs(self, user):
+        """Значения pk для маршрутов с параметрами (по имени маршрута): самые "тяжёлые" объекты"""
+        category = Category.objects.annotate(total=Count('companies')).order_by('-total').first()
+        company = Company.objects.annotate(total=Count('subscriptions')).order_by('-total').first()
+        subscription = Subscription.objects.filter(user=user).first()
+        objects = {'category': category, 'company': company, 'subscription': subscription}
+        return {
+            name: {'pk': objects[kind].pk}
+            for name, kind in SAMPLE_ROUTES.items() if objects[kind] is not None
+        }
+
+    def run_routes(self, options):
+        summary = UserSubscriptionSummary.objects.select_related('user').order_by('-total_count').first()
+        if summary is None:
+            raise CommandError('В БД нет пользователей с подписками')
+        owner = summary.user
+        client = Client(SERVER_NAME='localhost')
+        # Маршруты открываются от имени временного сотрудника, которому переданы данные
+        # самого "тяжёлого" пользователя. Всё это - в откатываемой транзакции, поэтому
+        # в --existing учётные записи и данные не меняются даже при прерывании прогона
+        with transaction.atomic():
+            user = User.objects.create_user(f'bench-routes-{uuid.uuid4().hex[:12]}', is_staff=True)
+            for relation in User._meta.related_objects:
+                if relation.related_model._meta.app_label == 'core':
+                    relation.related_model._base_manager.filter(**{relation.field.name: owner}).update(
+                        **{relation.field.name: user}
+                    )
+            try:
+                client.force_login(user)
+                return self.run_patterns(client, self.sample_kwargs(user), options)
+            finally:
+                transaction.set_rollback(True)
+                # Записи кэша, собранные по данным из откатываемой транзакции
+                bump_user_subscriptions([owner.pk, user.pk])
+
+    def run_patterns(self, client, samples, options):
+        results = {}
+        for pattern in core_urls.urlpatterns:
+            if not isinstance(pattern, URLPattern) or pattern.name in options['skip']:
+                continue
+            view_class = getattr(pattern.callback, 'view_class', None)
+            if view_class is not None and not hasattr(view_class, 'get'):
+                self.stdout.write(f'{pattern.name:<28} пропущен: маршрут не принимает GET')
+                continue
+            kwargs = {}
+            if pattern.pattern.converters:
+                kwargs = samples.get(pattern.name)
+                if kwargs is None:
+                    continue
+            path = reverse(pattern.name, kwargs=kwargs)
+            results[pattern.name] = self.run_route(client, path, options['repeat'])
+            result = results[pattern.name]
+            self.stdout.write(
+                f'{pattern.name:<28} {result["status"]} запросов: {result["queries"]:<4} '
+                f'p50 {result["p50_ms"]:>8} мс  p95 {result["p95_ms"]:>8} мс  '
+                f'память {result["peak_kb"]:>8} КБ'
+            )
+        return results
+
+    def run_route(self, client, path, repeat):
+        # Журнал запросов ограничен по длине - очищаем, чтобы захват был точным
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(path)
+            size = _consume(response)
+
+        tracemalloc.start()
+        _consume(client.get(path))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        timings = measure(lambda: _consume(client.get(path)), repeat=repeat, warmup=1)
+        return {
+            'path': path,
+            'status': response.status_code,
+            'queries': len(queries.captured_queries),
+            'bytes': size,
+            'peak_kb': round(peak / 1024, 1),
+            **timings,
+        }
+
+    def compare(self, results, path, threshold):
+        with open(path, encoding='utf-8') as source:
+            baseline = json.load(source)['routes']
+
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append(f'{name}: запросов {base["queries"]} -> {result["queries"]}')
+            if result['p95_ms'] > base['p95_ms'] * (1 + threshold):
+                regressions.append(f'{name}: p95 {base["p95_ms"]} -> {result["p95_ms"]} мс')
+
+        if regressions:
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            raise CommandError(f'Обнаружено регрессий: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий не обнаружено'))
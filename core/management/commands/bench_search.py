@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.benchmarks import measure, temporary_database
+from core.datagen import generate_dataset
+from core.models import Company
+from core.search import _search, search_company_ids
+
+
+QUERIES = ('муз', 'облачн', 'доставка продуктов', 'компания 4242', 'книги', 'фитнес')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск компаний по индексу (без кэша и из кэша результатов) '
+        'с LIKE-поиском (как search_fields админки) на временной БД'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            self.stdout.write(f'Генерация {options["companies"]} компаний...')
+            generate_dataset(users=1, companies=options['companies'], subscriptions=0, categories=20)
+            for query in QUERIES:
+                cold = measure(lambda: _search(query.lower().split(), 10), repeat=options['repeat'])
+                cached = measure(lambda: search_company_ids(query, limit=10), repeat=options['repeat'])
+                like = measure(
+                    lambda: list(
+                        Company.objects.filter(Q(name__icontains=query) | Q(description__icontains=query))
+                        .values_list('pk', flat=True)[:10]
+                    ),
+                    repeat=max(options['repeat'] // 10, 5),
+                )
+                found = len(search_company_ids(query, limit=10))
+                self.stdout.write(
+                    f'{query!r:<24} найдено {found:<3} индекс p50 {cold["p50_ms"]:>8} мс  '
+                    f'p95 {cold["p95_ms"]:>8} мс   кэш p50 {cached["p50_ms"]:>8} мс   '
+                    f'LIKE p50 {like["p50_ms"]:>8} мс'
+                )
@@ -0,0 +1,52 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import Importer, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует подписки (и при необходимости компании) из CSV, NDJSON или JSON. '
+        'Колонки подписок совпадают с выгрузкой: username, company, category, plan_name, price, '
+        'billing_period, status, start_date, next_billing_date, end_date, notes, id'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='Файлы с подписками')
+        parser.add_argument('--companies', action='append', default=[], help='Файл с компаниями (можно несколько)')
+        parser.add_argument('--format', choices=['csv', 'json', 'ndjson'], help='Формат файлов (по умолчанию по расширению)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Строк в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить файлы, ничего не записывать')
+        parser.add_argument('--rejects', help='Записать отклонённые строки в CSV-файл')
+
+    def handle(self, *args, **options):
+        if not options['files'] and not options['companies']:
+            raise CommandError('Укажите файлы с подписками или --companies')
+
+        importer = Importer(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        rejected = []
+        for path in options['companies']:
+            report = importer.import_companies(read_records(path, options['format']))
+            self._print_report('Компании', path, report)
+            rejected.extend((path, line, reason) for line, reason in report.rejected)
+        for path in options['files']:
+            report = importer.import_subscriptions(read_records(path, options['format']))
+            self._print_report('Подписки', path, report)
+            rejected.extend((path, line, reason) for line, reason in report.rejected)
+
+        if options['rejects'] and rejected:
+            with open(options['rejects'], 'w', encoding='utf-8', newline='') as output:
+                writer = csv.writer(output)
+                writer.writerow(['file', 'line', 'reason'])
+                writer.writerows(rejected)
+
+    def _print_report(self, title, path, report):
+        self.stdout.write(self.style.SUCCESS(
+            f'{title} из {path}: {report.imported} строк за {report.elapsed:.2f} с '
+            f'({report.rows_per_second:.0f} строк/с), отклонено: {len(report.rejected)}'
+        ))
+        for line, reason in report.rejected[:20]:
+            self.stdout.write(self.style.WARNING(f'  строка {line}: {reason}'))
+        if len(report.rejected) > 20:
+            self.stdout.write(self.style.WARNING(f'  ... и ещё {len(report.rejected) - 20}'))
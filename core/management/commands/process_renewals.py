@@ -0,0 +1,32 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from core.renewals import RenewalEngine
+
+
+class Command(BaseCommand):
+    help = 'Продлевает подписки с наступившей датой оплаты и переводит закончившиеся в "Истекла"'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Строк в одной транзакции')
+        parser.add_argument('--date', type=date.fromisoformat, help='Дата обработки (ГГГГ-ММ-ДД), по умолчанию сегодня')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно как воркер')
+        parser.add_argument('--interval', type=int, default=60, help='Пауза между проходами воркера, сек')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                started = time.perf_counter()
+                result = RenewalEngine(today=options['date'], chunk_size=options['chunk_size']).run()
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{"Продолжение прохода. " if result["resumed"] else ""}'
+                    f'Истекло: {result["expired"]}, продлено: {result["renewed"]} ({elapsed:.2f} с)'
+                )
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Остановлено')
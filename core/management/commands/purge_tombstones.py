@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import sync
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет записи об удалённых объектах старше SYNC_TOMBSTONE_RETENTION_DAYS. '
+        'Клиенты с более старой отметкой получат ленту изменений заново'
+    )
+
+    def handle(self, *args, **options):
+        deleted = sync.purge_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей: {deleted}'))
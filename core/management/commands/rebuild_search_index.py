@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Пересоздаёт индекс полнотекстового поиска компаний'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if search.get_backend(connection) is None:
+            raise CommandError(f'Поисковый индекс не поддерживается для {connection.vendor}')
+        indexed = search.rebuild_index(connection, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано компаний: {indexed}'))
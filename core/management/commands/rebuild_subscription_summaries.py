@@ -0,0 +1,30 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from core.models import UserSubscriptionSummary
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает сводки подписок пользователей (UserSubscriptionSummary)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Пользователи (по умолчанию - все)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Пользователей за один запрос')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        batch_size = options['batch_size']
+        rebuilt = 0
+        last_pk = 0
+        while True:
+            user_ids = list(users.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not user_ids:
+                break
+            UserSubscriptionSummary.rebuild_many(user_ids)
+            rebuilt += len(user_ids)
+            last_pk = user_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Пересобрано сводок: {rebuilt}'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import counters
+
+
+class Command(BaseCommand):
+    help = 'Сверяет материализованные счётчики (core.counters) с COUNT(*) по таблицам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f'Счётчики (по умолчанию - все: {", ".join(counters.COUNTED_MODELS)})')
+
+    def handle(self, *args, **options):
+        unknown = set(options['names']) - set(counters.COUNTED_MODELS)
+        if unknown:
+            raise CommandError(f'Неизвестные счётчики: {", ".join(sorted(unknown))}')
+        for name, value in counters.reconcile(options['names'] or None).items():
+            self.stdout.write(f'{name}: {value}')
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены'))
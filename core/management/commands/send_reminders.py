@@ -0,0 +1,44 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from core.reminders import ReminderDispatcher, get_backend
+
+
+class Command(BaseCommand):
+    help = 'Рассылает пользователям сводки о подписках с приближающейся датой оплаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help='Дата рассылки (ГГГГ-ММ-ДД), по умолчанию сегодня')
+        parser.add_argument('--days', type=int, help='За сколько дней напоминать (REMINDER_DAYS_BEFORE)')
+        parser.add_argument('--backend', help='Путь к классу отправителя (REMINDER_BACKEND)')
+        parser.add_argument('--workers', type=int, help='Потоков отправки (REMINDER_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Сводок в одной пачке отправки')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно как воркер')
+        parser.add_argument('--interval', type=int, default=300, help='Пауза между проходами воркера, сек')
+
+    def handle(self, *args, **options):
+        backend = get_backend(options['backend'])
+        try:
+            while True:
+                started = time.perf_counter()
+                result = ReminderDispatcher(
+                    today=options['date'],
+                    days_before=options['days'],
+                    backend=backend,
+                    workers=options['workers'],
+                    batch_size=options['batch_size'],
+                ).run()
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'Сводок: {result["digests"]}, напоминаний: {result["reminders"]}, '
+                    f'ошибок отправки: {result["failed"]}, отправляются другим процессом: {result["skipped"]}, '
+                    f'без адреса: {result["undeliverable"]}, '
+                    f'удалено из журнала: {result["purged"]} ({elapsed:.2f} с)'
+                )
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Остановлено')
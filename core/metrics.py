@@ -0,0 +1,138 @@
+"""
+Сбор метрик запросов: число и время SQL, время view и шаблона.
+Данные хранятся в памяти процесса в скользящем окне по каждому имени URL.
+
+SQL считается обёрткой collect_queries, которая ставится на соединения
+один раз и передаёт запрос сборщику из контекстной переменной. Под ASGI
+асинхронные запросы делят поток sync_to_async и его соединения, а
+контекст у каждого запроса свой - так запросы не считают SQL друг друга
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .benchmarks import percentile
+
+
+logger = logging.getLogger('core.metrics')
+
+# Границы корзин гистограммы общего времени, мс
+HISTOGRAM_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+
+def normalize_sql(sql):
+    """Приводит SQL к шаблону: списки IN (%s, %s, ...) схлопываются"""
+    return _IN_LIST.sub('(%s...)', sql)
+
+
+class QueryCollector:
+    """execute_wrapper, считающий SQL-запросы и их суммарное время"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[normalize_sql(sql)] += 1
+
+    def repeated(self, threshold):
+        """Запросы, повторившиеся не меньше threshold раз (признак N+1)"""
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+_current_collector = ContextVar('core_metrics_collector', default=None)
+
+
+def collect_queries(execute, sql, params, many, context):
+    """execute_wrapper: передаёт запрос сборщику текущего контекста, если он задан"""
+    collector = _current_collector.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    return collector(execute, sql, params, many, context)
+
+
+def install_query_wrapper(connections):
+    """Ставит collect_queries на соединения текущего потока (повторно не ставит)"""
+    for connection in connections.all():
+        if collect_queries not in connection.execute_wrappers:
+            connection.execute_wrappers.append(collect_queries)
+
+
+@contextmanager
+def collecting(collector):
+    """Запросы внутри блока (и в sync_to_async из него) считает collector"""
+    token = _current_collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _current_collector.reset(token)
+
+
+class MetricsRegistry:
+    """Скользящее окно метрик по именам URL"""
+
+    def __init__(self, window=500, flagged_window=100):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._totals = Counter()
+        self.flagged = deque(maxlen=flagged_window)
+
+    def record(self, name, sample, flags=()):
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(sample)
+            self._totals[name] += 1
+            if flags:
+                self.flagged.append({'name': name, 'path': sample['path'], 'flags': list(flags)})
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+            self.flagged.clear()
+
+    def snapshot(self):
+        """Сводка по каждому URL: p50/p95 времени, SQL и гистограмма"""
+        with self._lock:
+            samples = {name: list(values) for name, values in self._samples.items()}
+            totals = dict(self._totals)
+
+        result = []
+        for name, values in sorted(samples.items()):
+            total_ms = [sample['total_ms'] for sample in values]
+            histogram = Counter()
+            for value in total_ms:
+                bucket = next((bound for bound in HISTOGRAM_BUCKETS if value <= bound), None)
+                histogram[f'≤{bucket}' if bucket else f'>{HISTOGRAM_BUCKETS[-1]}'] += 1
+            result.append({
+                'name': name,
+                'requests': totals[name],
+                'p50_ms': round(percentile(total_ms, 0.5), 2),
+                'p95_ms': round(percentile(total_ms, 0.95), 2),
+                'max_ms': round(max(total_ms), 2),
+                'sql_p95_ms': round(percentile([sample['sql_ms'] for sample in values], 0.95), 2),
+                'queries_p95': percentile([sample['queries'] for sample in values], 0.95),
+                'view_p95_ms': round(percentile([sample['view_ms'] for sample in values], 0.95), 2),
+                'template_p95_ms': round(percentile([sample['template_ms'] for sample in values], 0.95), 2),
+                'histogram': dict(histogram),
+            })
+        return result
+
+
+registry = MetricsRegistry(window=getattr(settings, 'REQUEST_METRICS_WINDOW', 500))
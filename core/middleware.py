@@ -0,0 +1,147 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import QueryCollector, collecting, install_query_wrapper, logger, registry
+from .routers import has_written, pin_to_primary, reset_pin
+
+
+class RequestMetricsMiddleware:
+    """
+    Замеряет для каждого запроса число и время SQL, время view и рендеринга
+    шаблона. Отдаёт их в заголовке Server-Timing, копит в metrics.registry
+    и пишет в лог медленные запросы и повторяющиеся SQL (N+1).
+    Включается настройкой REQUEST_METRICS_ENABLED
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'REQUEST_METRICS_SLOW_MS', 500)
+        self.repeat_threshold = getattr(settings, 'REQUEST_METRICS_REPEATED_QUERY_THRESHOLD', 2)
+        # Под ASGI асинхронные view не должны переходить в поток из-за middleware
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        collector = QueryCollector()
+        request._metrics = {'view_started': None, 'view_finished': None, 'template_ms': 0.0}
+        started = time.perf_counter()
+        install_query_wrapper(connections)
+        with collecting(collector):
+            response = self.get_response(request)
+        return self._record(request, response, collector, started)
+
+    async def __acall__(self, request):
+        collector = QueryCollector()
+        request._metrics = {'view_started': None, 'view_finished': None, 'template_ms': 0.0}
+        started = time.perf_counter()
+        # Асинхронный ORM выполняет запросы в общем потоке sync_to_async: обёртка
+        # ставится на его соединения, а сборщик запроса приходит туда через контекст
+        await sync_to_async(install_query_wrapper)(connections)
+        with collecting(collector):
+            response = await self.get_response(request)
+        return self._record(request, response, collector, started)
+
+    def _record(self, request, response, collector, started):
+        finished = time.perf_counter()
+        metrics = request._metrics
+        view_ms = 0.0
+        if metrics['view_started'] is not None:
+            view_ms = ((metrics['view_finished'] or finished) - metrics['view_started']) * 1000
+        total_ms = (finished - started) * 1000
+        sql_ms = collector.duration * 1000
+
+        response['Server-Timing'] = ', '.join([
+            f'sql;dur={sql_ms:.2f};desc="{collector.count} queries"',
+            f'view;dur={view_ms:.2f}',
+            f'tpl;dur={metrics["template_ms"]:.2f}',
+            f'total;dur={total_ms:.2f}',
+        ])
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+
+        flags = []
+        if total_ms > self.slow_ms:
+            flags.append(f'медленный запрос: {total_ms:.0f} мс')
+        for sql, count in collector.repeated(self.repeat_threshold):
+            flags.append(f'SQL выполнен {count} раз: {sql[:200]}')
+        for flag in flags:
+            logger.warning('%s %s: %s', request.method, request.path, flag)
+
+        registry.record(match.view_name, {
+            'path': request.path,
+            'total_ms': total_ms,
+            'sql_ms': sql_ms,
+            'queries': collector.count,
+            'view_ms': view_ms,
+            'template_ms': metrics['template_ms'],
+        }, flags)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics['view_started'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        metrics = request._metrics
+        metrics['view_finished'] = render_started = time.perf_counter()
+
+        def finish_render(rendered):
+            metrics['template_ms'] += (time.perf_counter() - render_started) * 1000
+
+        response.add_post_render_callback(finish_render)
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    Закрепляет чтение за основной БД (см. core.routers): сбрасывает
+    закрепление в начале запроса, а после запроса с записью ставит cookie,
+    по которой следующие REPLICA_PIN_SECONDS секунд запросы клиента тоже
+    читают с основной БД - например, страница после редиректа из формы.
+    Подключается только при наличии реплик
+    """
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'db_primary'
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICAS', None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        self._start(request)
+        return self._finish(self.get_response(request))
+
+    async def __acall__(self, request):
+        self._start(request)
+        return self._finish(await self.get_response(request))
+
+    def _start(self, request):
+        reset_pin()
+        if self.cookie_name in request.COOKIES:
+            pin_to_primary()
+
+    def _finish(self, response):
+        if has_written():
+            response.set_cookie(self.cookie_name, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:10
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Название категории')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Описание')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Категория',
+                'verbose_name_plural': 'Категории',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Company',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True, verbose_name='Название компании')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Описание')),
+                ('website', models.URLField(blank=True, null=True, verbose_name='Веб-сайт')),
+                ('logo_url', models.URLField(blank=True, null=True, verbose_name='URL логотипа')),
+                ('subscription_plans', models.JSONField(blank=True, default=dict, help_text='Формат: {"Базовая": "990", "Продвинутая": "1990", "Премиум": "2990"}', verbose_name='Планы подписок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='companies', to='core.category', verbose_name='Категория')),
+            ],
+            options={
+                'verbose_name': 'Компания',
+                'verbose_name_plural': 'Компании',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Subscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plan_name', models.CharField(max_length=100, verbose_name='Название плана')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))], verbose_name='Цена')),
+                ('billing_period', models.CharField(choices=[('monthly', 'Ежемесячно'), ('quarterly', 'Ежеквартально'), ('yearly', 'Ежегодно')], default='monthly', max_length=20, verbose_name='Период оплаты')),
+                ('status', models.CharField(choices=[('active', 'Активна'), ('cancelled', 'Отменена'), ('expired', 'Истекла'), ('paused', 'Приостановлена')], default='active', max_length=20, verbose_name='Статус')),
+                ('start_date', models.DateField(verbose_name='Дата начала')),
+                ('next_billing_date', models.DateField(verbose_name='Следующая дата оплаты')),
+                ('end_date', models.DateField(blank=True, null=True, verbose_name='Дата окончания')),
+                ('notes', models.TextField(blank=True, null=True, verbose_name='Заметки')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to='core.company', verbose_name='Компания')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Подписка',
+                'verbose_name_plural': 'Подписки',
+                'ordering': ['-start_date'],
+            },
+        ),
+    ]
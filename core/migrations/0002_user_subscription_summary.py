@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:11
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSubscriptionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_count', models.PositiveIntegerField(default=0, verbose_name='Всего подписок')),
+                ('active_count', models.PositiveIntegerField(default=0, verbose_name='Активных подписок')),
+                ('monthly_cost', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Ежемесячные расходы')),
+                ('cost_by_period', models.JSONField(blank=True, default=dict, verbose_name='Расходы по периодам')),
+                ('by_category', models.JSONField(blank=True, default=dict, verbose_name='Расходы по категориям')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='subscription_summary', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Сводка подписок',
+                'verbose_name_plural': 'Сводки подписок',
+            },
+        ),
+    ]
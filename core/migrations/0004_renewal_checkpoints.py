@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_subscription_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Задача')),
+                ('state', models.JSONField(blank=True, default=dict, verbose_name='Состояние')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Контрольная точка задачи',
+                'verbose_name_plural': 'Контрольные точки задач',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('end_date__isnull', False), ('status', 'active')), fields=['end_date'], name='sub_active_end_date_idx'),
+        ),
+    ]
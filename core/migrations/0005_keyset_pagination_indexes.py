@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_renewal_checkpoints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='subscription',
+            name='sub_user_start_idx',
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['category', 'name'], name='company_category_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', '-start_date', 'id'], name='sub_user_start_id_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:22
+
+import django.db.models.deletion
+from decimal import Decimal, InvalidOperation
+from django.db import migrations, models
+
+
+# Plan.price: max_digits=10, decimal_places=2
+PRICE_LIMIT = Decimal('100000000')
+
+
+def backfill_plans(apps, schema_editor):
+    """Переносит существующие Company.subscription_plans в таблицу Plan"""
+    Company = apps.get_model('core', 'Company')
+    Plan = apps.get_model('core', 'Plan')
+    batch = []
+    for company_id, plans in Company.objects.order_by('pk').values_list('pk', 'subscription_plans').iterator(chunk_size=1000):
+        # Те же проверки, что и в core.models.parse_plan_prices: некорректные
+        # значения пропускаются, а не прерывают миграцию
+        if not isinstance(plans, dict):
+            continue
+        for name, price in plans.items():
+            try:
+                price = Decimal(str(price).replace(' ', '').replace(',', '.'))
+                if not price.is_finite() or abs(price) >= PRICE_LIMIT:
+                    continue
+                price = price.quantize(Decimal('0.01'))
+            except InvalidOperation:
+                continue
+            if abs(price) < PRICE_LIMIT:
+                batch.append(Plan(company_id=company_id, name=str(name)[:100], price=price))
+        if len(batch) >= 1000:
+            Plan.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        Plan.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Plan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название плана')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('billing_period', models.CharField(choices=[('monthly', 'Ежемесячно'), ('quarterly', 'Ежеквартально'), ('yearly', 'Ежегодно')], default='monthly', max_length=20, verbose_name='Период оплаты')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plans', to='core.company', verbose_name='Компания')),
+            ],
+            options={
+                'verbose_name': 'План подписки',
+                'verbose_name_plural': 'Планы подписок',
+                'ordering': ['company', 'price'],
+                'indexes': [models.Index(fields=['price'], name='plan_price_idx'), models.Index(fields=['company', 'price'], name='plan_company_price_idx')],
+                'constraints': [models.UniqueConstraint(fields=('company', 'name'), name='plan_company_name_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_plans, migrations.RunPython.noop),
+    ]
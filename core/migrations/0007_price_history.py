@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:25
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_plans'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Сумма')),
+                ('charges', models.PositiveIntegerField(default=0, verbose_name='Списаний')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_spend', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Расходы за месяц',
+                'verbose_name_plural': 'Расходы по месяцам',
+                'indexes': [models.Index(fields=['user', 'month'], name='monthly_spend_user_idx'), models.Index(fields=['category', 'month'], name='monthly_spend_category_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'category', 'month'), name='monthly_spend_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Списание'), (2, 'Изменение цены')], verbose_name='Тип')),
+                ('effective_date', models.DateField(verbose_name='Дата')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.category', verbose_name='Категория')),
+                ('subscription', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='price_events', to='core.subscription', verbose_name='Подписка')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Событие истории цен',
+                'verbose_name_plural': 'История цен',
+                'indexes': [models.Index(fields=['subscription', 'effective_date'], name='price_event_sub_date_idx'), models.Index(fields=['user', 'effective_date'], name='price_event_user_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+
+
+# Схема индекса - на момент этой миграции (core.search может меняться дальше)
+SEARCH_TABLE = 'core_company_search'
+
+SQLITE_CREATE = [
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+    f"name, category, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3 4 5 6')",
+]
+
+# core.search индексирует основы слов (stem), здесь - слова целиком: основа -
+# начало слова, поэтому префиксный поиск по основам их находит. Как и stem(),
+# заменяем ё на е; rebuild_search_index переиндексирует компании основами
+SQLITE_BACKFILL = [
+    f'INSERT INTO {SEARCH_TABLE} (rowid, name, category, description) '
+    "SELECT company.id, replace(replace(company.name, 'ё', 'е'), 'Ё', 'Е'), "
+    "replace(replace(category.name, 'ё', 'е'), 'Ё', 'Е'), "
+    "replace(replace(coalesce(company.description, ''), 'ё', 'е'), 'Ё', 'Е') "
+    'FROM core_company company JOIN core_category category ON category.id = company.category_id',
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')",
+]
+
+POSTGRES_CREATE = [
+    f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+    f'company_id bigint PRIMARY KEY REFERENCES core_company (id) ON DELETE CASCADE, '
+    f'document tsvector NOT NULL)',
+    f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_gin ON {SEARCH_TABLE} USING gin (document)',
+]
+
+POSTGRES_BACKFILL = [
+    f'INSERT INTO {SEARCH_TABLE} (company_id, document) '
+    "SELECT company.id, setweight(to_tsvector('russian', company.name), 'A') || "
+    "setweight(to_tsvector('russian', category.name), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(company.description, '')), 'C') "
+    'FROM core_company company JOIN core_category category ON category.id = company.category_id',
+    f'ANALYZE {SEARCH_TABLE}',
+]
+
+SQL = {
+    'sqlite': SQLITE_CREATE + SQLITE_BACKFILL,
+    'postgresql': POSTGRES_CREATE + POSTGRES_BACKFILL,
+}
+
+
+def create_search_index(apps, schema_editor):
+    """Создаёт индекс полнотекстового поиска и заполняет его существующими компаниями"""
+    for statement in SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in SQL:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_company_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='subscription',
+            name='sub_start_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['-start_date', '-id'], name='sub_start_id_idx'),
+        ),
+    ]
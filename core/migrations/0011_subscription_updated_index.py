@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_subscription_start_id_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['updated_at', 'id'], name='sub_updated_id_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 13:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_sync_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billing_date', models.DateField(verbose_name='Дата оплаты')),
+                ('sent_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата отправки')),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.subscription', verbose_name='Подписка')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Отправленное напоминание',
+                'verbose_name_plural': 'Отправленные напоминания',
+                'indexes': [models.Index(fields=['billing_date'], name='reminder_billing_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('subscription', 'billing_date'), name='reminder_subscription_date_uniq')],
+            },
+        ),
+    ]
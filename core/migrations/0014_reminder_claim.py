@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_reminder_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminderlog',
+            name='claim',
+            field=models.UUIDField(editable=False, null=True, verbose_name='Проход рассылки'),
+        ),
+    ]
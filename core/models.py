@@ -1,8 +1,77 @@
+import json
+
+from asgiref.sync import sync_to_async
 from django.db import models
+from django.db.models import Count, F, Q, Sum, Window
+from django.db.models.functions import RowNumber, TruncMonth
 from django.contrib.auth.models import User
 from datetime import date
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from decimal import Decimal
+from django.utils import timezone
+from decimal import Decimal, InvalidOperation
+
+
+# Количество месяцев в одном периоде оплаты
+BILLING_PERIOD_MONTHS = {
+    'monthly': 1,
+    'quarterly': 3,
+    'yearly': 12,
+}
+
+
+def monthly_equivalent(cost_by_period):
+    """Приводит суммы по периодам оплаты к ежемесячному эквиваленту"""
+    total = sum(
+        (Decimal(cost) / BILLING_PERIOD_MONTHS[period] for period, cost in cost_by_period.items() if cost),
+        Decimal('0'),
+    )
+    return total.quantize(Decimal('0.01'))
+
+
+def parse_plan_prices(subscription_plans):
+    """
+    {"Базовая": "990"} -> {"Базовая": Decimal("990.00")}. Значение не-объект
+    даёт пустой словарь; нечисловые, бесконечные и не помещающиеся в Plan.price
+    цены пропускаются, названия обрезаются до длины Plan.name
+    """
+    if not isinstance(subscription_plans, dict):
+        return {}
+    name_length = Plan._meta.get_field('name').max_length
+    price_field = Plan._meta.get_field('price')
+    limit = Decimal(10) ** (price_field.max_digits - price_field.decimal_places)
+    step = Decimal(1).scaleb(-price_field.decimal_places)
+    plans = {}
+    for name, price in subscription_plans.items():
+        try:
+            price = Decimal(str(price).replace(' ', '').replace(',', '.'))
+            if not price.is_finite() or abs(price) >= limit:
+                continue
+            price = price.quantize(step)
+        except InvalidOperation:
+            continue
+        # После округления цена может дойти до границы (99999999.999 -> 100000000.00)
+        if abs(price) < limit:
+            plans[str(name)[:name_length]] = price
+    return plans
+
+
+def month_start(value):
+    """Первое число месяца даты value"""
+    return value.replace(day=1)
+
+
+def next_month_start(value):
+    """Первое число месяца, следующего за месяцем даты value"""
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def iter_months(start, end):
+    """Первые числа месяцев от start до end включительно"""
+    month = month_start(start)
+    while month <= end:
+        yield month
+        month = next_month_start(month)
 
 
 class Category(models.Model):
@@ -16,6 +85,10 @@ class Category(models.Model):
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
         ordering = ['name']
+        indexes = [
+            # Лента изменений (core.sync)
+            models.Index(fields=['updated_at', 'id'], name='category_updated_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -49,13 +122,66 @@ class Company(models.Model):
         verbose_name = "Компания"
         verbose_name_plural = "Компании"
         ordering = ['name']
+        indexes = [
+            # Список компаний категории по названию (keyset-пагинация)
+            models.Index(fields=['category', 'name'], name='company_category_name_idx'),
+            # Лента изменений (core.sync)
+            models.Index(fields=['updated_at', 'id'], name='company_updated_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def clean(self):
+        # NaN и Infinity json.loads принимает, но в БД это некорректный JSON
+        try:
+            json.dumps(self.subscription_plans, allow_nan=False)
+        except ValueError:
+            raise ValidationError({'subscription_plans': 'Цены планов должны быть конечными числами'})
+
     def get_plan_names(self):
         """Возвращает список названий доступных планов"""
-        return list(self.subscription_plans.keys()) if self.subscription_plans else []
+        return list(self.subscription_plans) if isinstance(self.subscription_plans, dict) else []
+
+
+class SubscriptionQuerySet(models.QuerySet):
+    """QuerySet подписок со статистикой"""
+
+    def active(self):
+        return self.filter(status='active')
+
+    def _stats_aggregates(self):
+        aggregates = {'total': Count('pk')}
+        for status, _ in self.model.STATUS_CHOICES:
+            aggregates[f'status_{status}'] = Count('pk', filter=Q(status=status))
+        for period, _ in self.model.BILLING_PERIOD_CHOICES:
+            aggregates[f'cost_{period}'] = Sum('price', filter=Q(status='active', billing_period=period))
+        return aggregates
+
+    def _stats_result(self, row):
+        by_status = {status: row[f'status_{status}'] for status, _ in self.model.STATUS_CHOICES}
+        cost_by_period = {
+            period: row[f'cost_{period}'] or Decimal('0.00')
+            for period, _ in self.model.BILLING_PERIOD_CHOICES
+        }
+        return {
+            'total': row['total'],
+            'active': by_status['active'],
+            'by_status': by_status,
+            'cost_by_period': cost_by_period,
+            'monthly_cost': monthly_equivalent(cost_by_period),
+        }
+
+    def stats(self):
+        """
+        Считает статистику одним агрегирующим запросом: общее количество,
+        количество по статусам и стоимость активных подписок по периодам оплаты
+        """
+        return self._stats_result(self.order_by().aggregate(**self._stats_aggregates()))
+
+    async def astats(self):
+        """Асинхронный вариант stats()"""
+        return self._stats_result(await self.order_by().aaggregate(**self._stats_aggregates()))
 
 
 class Subscription(models.Model):
@@ -117,10 +243,39 @@ class Subscription(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    objects = SubscriptionQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
         ordering = ['-start_date']
+        indexes = [
+            # Список подписок пользователя и его фильтры
+            models.Index(fields=['user', '-start_date', 'id'], name='sub_user_start_id_idx'),
+            models.Index(fields=['user', 'status', '-start_date'], name='sub_user_status_start_idx'),
+            models.Index(fields=['user', 'billing_period', 'status'], name='sub_user_period_status_idx'),
+            # Ближайшие списания по активным подпискам
+            models.Index(
+                fields=['next_billing_date'],
+                condition=Q(status='active'),
+                name='sub_active_next_billing_idx',
+            ),
+            # Активные подписки с датой окончания (для перевода в "Истекла")
+            models.Index(
+                fields=['end_date'],
+                condition=Q(status='active', end_date__isnull=False),
+                name='sub_active_end_date_idx',
+            ),
+            # Фильтры и date_hierarchy админки
+            models.Index(fields=['status', 'billing_period'], name='sub_status_period_idx'),
+            # Порядок списка админки: -start_date и -pk, который Django добавляет для однозначности;
+            # без id SQLite сортирует весь JOIN с пользователями и компаниями
+            models.Index(fields=['-start_date', '-id'], name='sub_start_id_idx'),
+            models.Index(fields=['created_at'], name='sub_created_at_idx'),
+            # Изменения после отметки updated_at (догрузка core.analytics, лента изменений core.sync)
+            models.Index(fields=['updated_at', 'id'], name='sub_updated_id_idx'),
+            models.Index(fields=['user', 'updated_at', 'id'], name='sub_user_updated_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.company.name} ({self.plan_name})"
@@ -130,3 +285,439 @@ class Subscription(models.Model):
         return self.status == 'active' and (
             self.end_date is None or self.end_date >= date.today()
         )
+
+
+class UserSubscriptionSummary(models.Model):
+    """
+    Сводка по подпискам пользователя (одна строка на пользователя).
+    Обновляется инкрементально сигналами Subscription и пересобирается
+    командой rebuild_subscription_summaries
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='subscription_summary',
+        verbose_name="Пользователь"
+    )
+    total_count = models.PositiveIntegerField(default=0, verbose_name="Всего подписок")
+    active_count = models.PositiveIntegerField(default=0, verbose_name="Активных подписок")
+    monthly_cost = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        verbose_name="Ежемесячные расходы"
+    )
+
+    # Стоимость активных подписок по периодам оплаты: {"monthly": "990.00", ...}
+    cost_by_period = models.JSONField(default=dict, blank=True, verbose_name="Расходы по периодам")
+    # Активные подписки по категориям: {"<id>": {"active_count": 1, "cost_by_period": {...}}}
+    by_category = models.JSONField(default=dict, blank=True, verbose_name="Расходы по категориям")
+
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Сводка подписок"
+        verbose_name_plural = "Сводки подписок"
+
+    def __str__(self):
+        return f"{self.user.username}: {self.active_count}/{self.total_count}"
+
+    @classmethod
+    def for_user(cls, user):
+        """Возвращает сводку пользователя, создавая её при первом обращении"""
+        summary = cls.objects.filter(user=user).first()
+        if summary is None:
+            summary = cls.rebuild(user.pk)
+        return summary
+
+    @classmethod
+    async def afor_user(cls, user):
+        """Асинхронный вариант for_user()"""
+        summary = await cls.objects.filter(user=user).afirst()
+        if summary is None:
+            summary = await sync_to_async(cls.rebuild)(user.pk)
+        return summary
+
+    @classmethod
+    def rebuild(cls, user_id):
+        """Пересчитывает сводку пользователя с нуля"""
+        return cls.rebuild_many([user_id])[0]
+
+    @classmethod
+    def rebuild_many(cls, user_ids):
+        """Пересчитывает сводки группы пользователей одним агрегирующим запросом"""
+        summaries = {user_id: cls(user_id=user_id) for user_id in user_ids}
+        rows = (
+            Subscription.objects
+            .filter(user_id__in=user_ids)
+            .order_by()
+            .values('user_id', 'company__category_id', 'status', 'billing_period')
+            .annotate(count=Count('pk'), cost=Sum('price'))
+        )
+        for row in rows:
+            summaries[row['user_id']]._add(
+                row['status'], row['billing_period'], row['company__category_id'], row['cost'], row['count']
+            )
+
+        for summary in summaries.values():
+            summary.monthly_cost = monthly_equivalent(summary.cost_by_period)
+        cls.objects.bulk_create(
+            summaries.values(),
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['total_count', 'active_count', 'monthly_cost', 'cost_by_period', 'by_category', 'updated_at'],
+        )
+        return list(summaries.values())
+
+    @staticmethod
+    def _shift_cost(costs, period, amount):
+        cost = Decimal(costs.get(period, '0')) + amount
+        if cost:
+            costs[period] = str(cost.quantize(Decimal('0.01')))
+        else:
+            costs.pop(period, None)
+
+    def _add(self, status, billing_period, category_id, price, count=1):
+        """
+        Добавляет (count > 0) или вычитает (count < 0) вклад подписок в сводку.
+        price - суммарная цена этих подписок
+        """
+        self.total_count += count
+        if status != 'active':
+            return
+        self.active_count += count
+        price = Decimal(price) if count > 0 else -Decimal(price)
+        self._shift_cost(self.cost_by_period, billing_period, price)
+
+        key = str(category_id)
+        category = self.by_category.setdefault(key, {'active_count': 0, 'cost_by_period': {}})
+        category['active_count'] += count
+        self._shift_cost(category['cost_by_period'], billing_period, price)
+        if not category['active_count']:
+            del self.by_category[key]
+
+    def apply(self, old=None, new=None):
+        """
+        Применяет изменение одной подписки. old и new - кортежи
+        (status, billing_period, category_id, price) или None
+        """
+        if old is not None:
+            self._add(*old, count=-1)
+        if new is not None:
+            self._add(*new)
+        self.monthly_cost = monthly_equivalent(self.cost_by_period)
+
+    def category_breakdown(self):
+        """Активные подписки и ежемесячные расходы по категориям"""
+        return {
+            int(category_id): {
+                'active_count': data['active_count'],
+                'monthly_cost': monthly_equivalent(data['cost_by_period']),
+            }
+            for category_id, data in self.by_category.items()
+        }
+
+
+class PlanQuerySet(models.QuerySet):
+    """QuerySet тарифных планов"""
+
+    def under(self, amount):
+        """Планы дешевле amount"""
+        return self.filter(price__lt=amount)
+
+    def cheapest_per_category(self):
+        """Самый дешёвый план в каждой категории"""
+        return self.annotate(
+            category_rank=Window(
+                RowNumber(),
+                partition_by=F('company__category'),
+                order_by=[F('price').asc(), F('pk').asc()],
+            )
+        ).filter(category_rank=1)
+
+
+class Plan(models.Model):
+    """
+    Тарифный план компании. Заполняется из Company.subscription_plans
+    при сохранении компании и позволяет фильтровать и сортировать по цене в SQL
+    """
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.CASCADE,
+        related_name='plans',
+        verbose_name="Компания"
+    )
+    name = models.CharField(max_length=100, verbose_name="Название плана")
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена")
+    billing_period = models.CharField(
+        max_length=20,
+        choices=Subscription.BILLING_PERIOD_CHOICES,
+        default='monthly',
+        verbose_name="Период оплаты"
+    )
+
+    objects = PlanQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "План подписки"
+        verbose_name_plural = "Планы подписок"
+        ordering = ['company', 'price']
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'name'], name='plan_company_name_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['price'], name='plan_price_idx'),
+            models.Index(fields=['company', 'price'], name='plan_company_price_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.price})"
+
+    @classmethod
+    def sync_companies(cls, company_ids):
+        """Приводит планы компаний в соответствие с их subscription_plans"""
+        company_ids = list(company_ids)
+        existing = {
+            (plan.company_id, plan.name): plan
+            for plan in cls.objects.filter(company_id__in=company_ids).only('pk', 'company_id', 'name', 'price')
+        }
+        wanted = {
+            (company_id, name): price
+            for company_id, plans in Company.objects.filter(pk__in=company_ids).values_list('pk', 'subscription_plans')
+            for name, price in parse_plan_prices(plans).items()
+        }
+
+        to_create = [
+            cls(company_id=company_id, name=name, price=price)
+            for (company_id, name), price in wanted.items()
+            if (company_id, name) not in existing
+        ]
+        to_update = []
+        for key, plan in existing.items():
+            if key in wanted and plan.price != wanted[key]:
+                plan.price = wanted[key]
+                to_update.append(plan)
+        to_delete = [plan.pk for key, plan in existing.items() if key not in wanted]
+
+        if to_delete:
+            cls.objects.filter(pk__in=to_delete).delete()
+        if to_create:
+            cls.objects.bulk_create(to_create)
+        if to_update:
+            cls.objects.bulk_update(to_update, ['price'])
+
+
+class PriceEvent(models.Model):
+    """
+    История цен подписки (строки только добавляются): списания при продлении
+    и изменения цены. Пользователь и категория записываются на момент события,
+    чтобы ряды расходов строились без JOIN и не менялись задним числом
+    """
+    KIND_CHARGE = 1
+    KIND_PRICE_CHANGE = 2
+    KIND_CHOICES = [
+        (KIND_CHARGE, 'Списание'),
+        (KIND_PRICE_CHANGE, 'Изменение цены'),
+    ]
+
+    subscription = models.ForeignKey(
+        Subscription,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='price_events',
+        verbose_name="Подписка"
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name="Пользователь")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+', verbose_name="Категория")
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES, verbose_name="Тип")
+    effective_date = models.DateField(verbose_name="Дата")
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Сумма")
+
+    class Meta:
+        verbose_name = "Событие истории цен"
+        verbose_name_plural = "История цен"
+        indexes = [
+            models.Index(fields=['subscription', 'effective_date'], name='price_event_sub_date_idx'),
+            models.Index(fields=['user', 'effective_date'], name='price_event_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.amount} ({self.effective_date})"
+
+    @classmethod
+    def record(cls, events):
+        """Добавляет события и обновляет помесячные свёртки затронутых пользователей"""
+        events = cls.objects.bulk_create(events)
+        charges = [event for event in events if event.kind == cls.KIND_CHARGE]
+        if charges:
+            MonthlySpend.refresh(
+                {event.user_id for event in charges},
+                min(event.effective_date for event in charges),
+                max(event.effective_date for event in charges),
+            )
+        return events
+
+
+class MonthlySpend(models.Model):
+    """
+    Помесячная свёртка списаний PriceEvent по пользователю и категории.
+    Ряд расходов за 5 лет читает 60 месяцев свёртки, а не каждое списание
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_spend', verbose_name="Пользователь")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+', verbose_name="Категория")
+    month = models.DateField(verbose_name="Месяц")
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Сумма")
+    charges = models.PositiveIntegerField(default=0, verbose_name="Списаний")
+
+    class Meta:
+        verbose_name = "Расходы за месяц"
+        verbose_name_plural = "Расходы по месяцам"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category', 'month'], name='monthly_spend_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'month'], name='monthly_spend_user_idx'),
+            models.Index(fields=['category', 'month'], name='monthly_spend_category_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.month:%Y-%m}: {self.total}"
+
+    @classmethod
+    def refresh(cls, user_ids, start=None, end=None):
+        """Пересчитывает свёртки пользователей за месяцы с start по end (по умолчанию - за всё время)"""
+        events = PriceEvent.objects.filter(kind=PriceEvent.KIND_CHARGE, user_id__in=list(user_ids))
+        if start is not None:
+            events = events.filter(effective_date__gte=month_start(start))
+        if end is not None:
+            # Месяц end пересчитывается целиком, иначе в upsert попадёт сумма только до end
+            events = events.filter(effective_date__lt=next_month_start(end))
+        rows = (
+            events
+            .order_by()
+            .annotate(month=TruncMonth('effective_date'))
+            .values('user_id', 'category_id', 'month')
+            .annotate(total=Sum('amount'), charges=Count('pk'))
+        )
+        cls.objects.bulk_create(
+            [cls(**row) for row in rows],
+            update_conflicts=True,
+            unique_fields=['user', 'category', 'month'],
+            update_fields=['total', 'charges'],
+        )
+
+    @classmethod
+    def series(cls, start, end, user=None, category=None):
+        """
+        Помесячные расходы с start по end: [(первое число месяца, сумма), ...].
+        Месяцы без списаний входят в ряд с нулевой суммой
+        """
+        rollups = cls.objects.filter(month__gte=month_start(start), month__lte=end)
+        if user is not None:
+            rollups = rollups.filter(user=user)
+        if category is not None:
+            rollups = rollups.filter(category=category)
+        totals = dict(rollups.order_by().values('month').annotate(sum=Sum('total')).values_list('month', 'sum'))
+        return [
+            (month, Decimal(totals.get(month) or 0).quantize(Decimal('0.01')))
+            for month in iter_months(start, end)
+        ]
+
+
+class JobCheckpoint(models.Model):
+    """Состояние фоновой задачи для продолжения работы после сбоя"""
+    name = models.CharField(max_length=100, unique=True, verbose_name="Задача")
+    state = models.JSONField(default=dict, blank=True, verbose_name="Состояние")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Контрольная точка задачи"
+        verbose_name_plural = "Контрольные точки задач"
+
+    def __str__(self):
+        return self.name
+
+
+class Counter(models.Model):
+    """Материализованный счётчик (см. core.counters)"""
+    name = models.CharField(max_length=100, unique=True, verbose_name="Счётчик")
+    value = models.BigIntegerField(default=0, verbose_name="Значение")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Счётчик"
+        verbose_name_plural = "Счётчики"
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class Tombstone(models.Model):
+    """
+    Запись об удалённом объекте для ленты изменений (core.sync): по ней
+    клиенты узнают об удалениях, которых нет среди изменённых строк.
+    Старые записи удаляет команда purge_tombstones
+    """
+    OBJECT_TYPE_CHOICES = [
+        ('category', 'Категория'),
+        ('company', 'Компания'),
+        ('subscription', 'Подписка'),
+    ]
+
+    object_type = models.CharField(max_length=20, choices=OBJECT_TYPE_CHOICES, verbose_name="Тип объекта")
+    object_id = models.BigIntegerField(verbose_name="id объекта")
+    # Владелец удалённой подписки; без ограничения внешнего ключа - запись
+    # создаётся и при каскадном удалении подписок вместе с пользователем
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="Пользователь"
+    )
+    deleted_at = models.DateTimeField(default=timezone.now, verbose_name="Дата удаления")
+
+    class Meta:
+        verbose_name = "Удалённый объект"
+        verbose_name_plural = "Удалённые объекты"
+        indexes = [
+            models.Index(fields=['object_type', 'deleted_at', 'id'], name='tombstone_type_deleted_idx'),
+            models.Index(fields=['user', 'deleted_at', 'id'], name='tombstone_user_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.object_type} #{self.object_id}"
+
+
+class ReminderLog(models.Model):
+    """
+    Отправленное напоминание об оплате подписки (core.reminders). Одна
+    строка на подписку и дату оплаты: по ней рассылка не повторяется
+    после перезапуска. Строки с прошедшей датой оплаты удаляются
+    """
+    subscription = models.ForeignKey(
+        Subscription,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name="Подписка"
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name="Пользователь")
+    billing_date = models.DateField(verbose_name="Дата оплаты")
+    sent_at = models.DateTimeField(default=timezone.now, verbose_name="Дата отправки")
+    # Метка прохода рассылки, записавшего строку: по ней проход находит свои записи
+    claim = models.UUIDField(null=True, editable=False, verbose_name="Проход рассылки")
+
+    class Meta:
+        verbose_name = "Отправленное напоминание"
+        verbose_name_plural = "Отправленные напоминания"
+        constraints = [
+            models.UniqueConstraint(fields=['subscription', 'billing_date'], name='reminder_subscription_date_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['billing_date'], name='reminder_billing_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subscription_id}: {self.billing_date}"
@@ -0,0 +1,185 @@
+"""
+Пагинация больших таблиц.
+
+Keyset-пагинация (по курсору): следующая страница выбирается условием
+"после последней строки" по полям сортировки, без COUNT(*) и OFFSET,
+поэтому любая страница стоит столько же, сколько первая.
+
+EstimatedCountPaginator сохраняет номера страниц (для админки), но не
+считает строки дальше count_limit: для таблицы без фильтров количество
+берётся из статистики планировщика БД
+"""
+
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """Страница результатов с курсорами соседних страниц"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, approximate_total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approximate_total = approximate_total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по полям ordering (например ('-start_date', 'id')).
+    Последнее поле должно делать порядок однозначным
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.per_page = per_page
+        opts = queryset.model._meta
+        self.fields = [opts.pk if name in ('pk', 'id') else opts.get_field(name) for name, _ in self.ordering]
+
+    # ---------- Курсоры ----------
+    def encode_cursor(self, direction, obj):
+        values = [field.value_to_string(obj) for field in self.fields]
+        token = json.dumps([direction, values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(token).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            token = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(token)
+            if direction not in ('next', 'previous') or len(values) != len(self.fields):
+                raise InvalidCursor
+            return direction, [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise InvalidCursor
+
+    def _seek(self, values, backwards):
+        """Условие "строго после values" в порядке сортировки (или до - при backwards)"""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _order_by(self, backwards):
+        return [f'{"-" if descending != backwards else ""}{name}' for name, descending in self.ordering]
+
+    # ---------- Страница ----------
+    def page(self, cursor=None):
+        direction, values = ('next', None) if not cursor else self.decode_cursor(cursor)
+        backwards = direction == 'previous'
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, backwards))
+        rows = list(queryset.order_by(*self._order_by(backwards))[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor('next', rows[-1]) if rows and has_next else None,
+            previous_cursor=self.encode_cursor('previous', rows[0]) if rows and has_previous else None,
+        )
+
+
+class KeysetPaginationMixin:
+    """
+    Заменяет постраничную пагинацию ListView на keyset по keyset_ordering.
+    Примерное общее количество даёт get_approximate_total() (из кэша или сводки)
+    """
+    keyset_ordering = ('pk',)
+    cursor_kwarg = 'cursor'
+
+    def get_approximate_total(self, queryset):
+        return None
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, self.keyset_ordering, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404('Некорректный курсор страницы')
+        page.approximate_total = self.get_approximate_total(queryset)
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+# ==================== Примерное количество ====================
+def estimated_row_count(model, using):
+    """
+    Количество строк таблицы model по статистике БД (ANALYZE) или None,
+    если статистики нет
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                return row[0] if row and row[0] >= 0 else None
+            if connection.vendor == 'sqlite':
+                # Первое число stat - количество строк таблицы (или частичного индекса)
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+                counts = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+                return max(counts) if counts else None
+    except DatabaseError:
+        # sqlite_stat1 появляется только после первого ANALYZE
+        pass
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator, который считает не больше count_limit строк. Если строк
+    меньше, количество точное; иначе для запроса без фильтров берётся
+    оценка estimated_row_count(), а для отфильтрованного - count_limit
+    """
+    count_limit = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        count = queryset.order_by()[:self.count_limit].count()
+        if count < self.count_limit:
+            return count
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None:
+                return max(estimate, count)
+        return count
@@ -0,0 +1,41 @@
+"""
+Ограничение частоты запросов алгоритмом token bucket. Состояние корзины
+(остаток токенов и время последнего пополнения) хранится в кэше Django,
+поэтому лимит общий для всех процессов с общим кэшем (Redis, Memcached).
+
+Корзина вмещает burst токенов и пополняется со скоростью rate токенов
+в секунду; запрос тратит cost токенов. Чтение и запись состояния не
+атомарны: одновременные запросы одного клиента могут потратить немного
+больше burst, для защиты от перегрузки этого достаточно
+"""
+
+import math
+import time
+
+from django.core.cache import cache
+
+
+class TokenBucket:
+    """Корзина токенов клиента key"""
+
+    def __init__(self, key, rate, burst):
+        self.key = f'ratelimit:{key}'
+        self.rate = rate
+        self.burst = burst
+
+    def consume(self, cost=1):
+        """
+        Пытается потратить cost токенов. Возвращает (allowed, remaining, retry_after):
+        разрешён ли запрос, сколько токенов осталось и через сколько секунд
+        их хватит, если запрос отклонён
+        """
+        now = time.time()
+        tokens, updated_at = cache.get(self.key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        # Полная корзина равна отсутствующей - ключу достаточно прожить до пополнения
+        cache.set(self.key, (tokens, now), timeout=math.ceil((self.burst - tokens) / self.rate) + 1)
+        retry_after = 0 if allowed else math.ceil((cost - tokens) / self.rate)
+        return allowed, int(tokens), retry_after
@@ -0,0 +1,220 @@
+"""
+Напоминания о предстоящих оплатах подписок.
+
+Один проход (ReminderDispatcher.run) читает окно дат оплаты
+[today, today + days_before] по частичному индексу активных подписок
+sub_active_next_billing_idx, пропуская уже напомненные (ReminderLog),
+и собирает по одному письму-сводке на пользователя. Сводки пачками
+отправляются отправителем из настройки REMINDER_BACKEND в пуле из
+REMINDER_WORKERS потоков; в пуле одновременно не больше двух пачек
+на поток.
+
+Перед отправкой пачки её напоминания записываются в ReminderLog, при
+ошибке отправки записи удаляются и следующий проход повторит их. Уже
+записанные другим процессом напоминания пропускаются поштучно, остальные
+напоминания пачки отправляются. Поэтому после перезапуска (и при
+параллельном запуске второго процесса) напоминание не уходит повторно;
+сбой процесса посреди отправки пачки может её потерять, но не продублировать.
+Сводки, которые отправитель не может доставить (например, письма
+пользователям без адреса), в журнал не записываются
+"""
+
+import logging
+import uuid
+from collections import defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Exists, F, OuterRef, Q
+from django.template.loader import render_to_string
+from django.utils.module_loading import import_string
+
+from .models import ReminderLog, Subscription
+
+
+logger = logging.getLogger('core.reminders')
+
+ReminderItem = namedtuple(
+    'ReminderItem', ['subscription_id', 'billing_date', 'company', 'plan_name', 'price', 'billing_period'],
+)
+Digest = namedtuple('Digest', ['user_id', 'username', 'email', 'items'])
+
+
+# ==================== Отправители ====================
+class ReminderBackend:
+    """
+    Отправитель сводок. send_batch() вызывается из потоков пула и не должен
+    обращаться к БД; исключение означает, что пачка не отправлена
+    """
+
+    def can_send(self, digest):
+        """Можно ли доставить сводку; остальные не попадают в журнал и пачки"""
+        return True
+
+    def send_batch(self, digests):
+        raise NotImplementedError
+
+
+class EmailReminderBackend(ReminderBackend):
+    """
+    Письма через EMAIL_BACKEND Django, одно соединение на пачку.
+    Пользователям без адреса сводки не отправляются
+    """
+    subject_template = 'Предстоящие списания по подпискам: {count}'
+    body_template = 'core/reminder_digest.txt'
+
+    def message(self, digest):
+        total = sum((item.price for item in digest.items), 0)
+        return EmailMessage(
+            subject=self.subject_template.format(count=len(digest.items)),
+            body=render_to_string(self.body_template, {'digest': digest, 'total': total}),
+            to=[digest.email],
+        )
+
+    def can_send(self, digest):
+        return bool(digest.email)
+
+    def send_batch(self, digests):
+        messages = [self.message(digest) for digest in digests]
+        if messages:
+            with get_connection() as connection:
+                connection.send_messages(messages)
+
+
+def get_backend(path=None):
+    return import_string(path or getattr(settings, 'REMINDER_BACKEND', 'core.reminders.EmailReminderBackend'))()
+
+
+# ==================== Рассылка ====================
+class ReminderDispatcher:
+    """Один проход рассылки напоминаний на дату today"""
+
+    def __init__(self, today=None, days_before=None, backend=None, workers=None, batch_size=100, chunk_size=1000):
+        self.today = today or date.today()
+        if days_before is None:
+            days_before = getattr(settings, 'REMINDER_DAYS_BEFORE', 3)
+        self.until = self.today + timedelta(days=days_before)
+        self.backend = backend or get_backend()
+        self.workers = workers or getattr(settings, 'REMINDER_WORKERS', 4)
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+    def due(self):
+        """Активные подписки с оплатой в окне, по которым ещё не было напоминания"""
+        return (
+            Subscription.objects
+            .filter(status='active', next_billing_date__gte=self.today, next_billing_date__lte=self.until)
+            .filter(Q(end_date__isnull=True) | Q(end_date__gte=F('next_billing_date')))
+            .filter(~Exists(ReminderLog.objects.filter(
+                subscription=OuterRef('pk'), billing_date=OuterRef('next_billing_date'),
+            )))
+        )
+
+    def _due_rows(self):
+        # Пачки по (next_billing_date, pk) без OFFSET
+        queryset = self.due().order_by('next_billing_date', 'pk').values_list(
+            'pk', 'user_id', 'next_billing_date', 'company__name', 'plan_name', 'price', 'billing_period',
+        )
+        last = None
+        while True:
+            chunk = queryset
+            if last is not None:
+                chunk = chunk.filter(Q(next_billing_date__gt=last[0]) | Q(next_billing_date=last[0], pk__gt=last[1]))
+            rows = list(chunk[:self.chunk_size])
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][2], rows[-1][0]
+
+    def digests(self):
+        """Сводки по пользователям, по возрастанию id пользователя"""
+        items = defaultdict(list)
+        for pk, user_id, billing_date, company, plan_name, price, period in self._due_rows():
+            items[user_id].append(ReminderItem(pk, billing_date, company, plan_name, price, period))
+        user_ids = sorted(items)
+        for start in range(0, len(user_ids), self.chunk_size):
+            users = User.objects.filter(pk__in=user_ids[start:start + self.chunk_size]).order_by('pk')
+            for user_id, username, email in users.values_list('pk', 'username', 'email'):
+                yield Digest(user_id, username, email, items[user_id])
+
+    def _claim(self, batch):
+        """
+        Записывает напоминания пачки в журнал. Возвращает сводки только
+        с записанными этим проходом напоминаниями и id их записей
+        """
+        claim = uuid.uuid4()
+        logs = [
+            ReminderLog(
+                subscription_id=item.subscription_id, user_id=digest.user_id,
+                billing_date=item.billing_date, claim=claim,
+            )
+            for digest in batch
+            for item in digest.items
+        ]
+        # Записи другого процесса остаются его: конфликты пропускаются
+        ReminderLog.objects.bulk_create(logs, ignore_conflicts=True)
+        claimed = dict(
+            ReminderLog.objects.filter(claim=claim, subscription_id__in=[log.subscription_id for log in logs])
+            .values_list('subscription_id', 'pk')
+        )
+        digests = []
+        for digest in batch:
+            items = [item for item in digest.items if item.subscription_id in claimed]
+            if items:
+                digests.append(digest._replace(items=items))
+        return digests, list(claimed.values())
+
+    def _release(self, claimed):
+        for start in range(0, len(claimed), self.chunk_size):
+            ReminderLog.objects.filter(pk__in=claimed[start:start + self.chunk_size]).delete()
+
+    def _batches(self, result):
+        batch = []
+        for digest in self.digests():
+            if not self.backend.can_send(digest):
+                result['undeliverable'] += 1
+                continue
+            batch.append(digest)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def run(self):
+        """Выполняет проход и возвращает статистику"""
+        result = {'digests': 0, 'reminders': 0, 'failed': 0, 'skipped': 0, 'undeliverable': 0, 'purged': self.purge()}
+        pending = {}
+
+        def collect(futures):
+            for future in futures:
+                batch, claimed = pending.pop(future)
+                error = future.exception()
+                if error is not None:
+                    logger.error('Не отправлена пачка из %s сводок: %r', len(batch), error)
+                    self._release(claimed)
+                    result['failed'] += len(batch)
+                else:
+                    result['digests'] += len(batch)
+                    result['reminders'] += len(claimed)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch in self._batches(result):
+                claimed_batch, claimed = self._claim(batch)
+                result['skipped'] += len(batch) - len(claimed_batch)
+                if not claimed_batch:
+                    continue
+                batch = claimed_batch
+                pending[executor.submit(self.backend.send_batch, batch)] = batch, claimed
+                if len(pending) >= self.workers * 2:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            collect(wait(pending).done)
+        return result
+
+    def purge(self):
+        """Удаляет журнал по прошедшим датам оплаты - они уже не попадут в окно"""
+        deleted, _ = ReminderLog.objects.filter(billing_date__lt=self.today).delete()
+        return deleted
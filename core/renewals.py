@@ -0,0 +1,210 @@
+"""
+Пакетное продление подписок по next_billing_date и перевод
+закончившихся подписок в статус "Истекла". Каждое продление
+записывается в историю цен (PriceEvent) как списание
+"""
+
+import calendar
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cache import bump_user_subscriptions
+from .models import BILLING_PERIOD_MONTHS, JobCheckpoint, PriceEvent, Subscription, UserSubscriptionSummary
+
+
+CHECKPOINT_NAME = 'renewals'
+
+
+def add_months(value, months, day=None):
+    """Сдвигает дату на months месяцев, сохраняя день (или day) в пределах месяца"""
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    day = day or value.day
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+def next_billing_after(next_billing_date, start_date, billing_period, today):
+    """Первая дата оплаты после today, кратная периоду от дня начала подписки"""
+    months = BILLING_PERIOD_MONTHS[billing_period]
+    value = next_billing_date
+    while value <= today:
+        value = add_months(value, months, day=start_date.day)
+    return value
+
+
+def billing_dates_until(next_billing_date, start_date, billing_period, today):
+    """Даты оплаты от next_billing_date до today включительно"""
+    months = BILLING_PERIOD_MONTHS[billing_period]
+    value = next_billing_date
+    while value <= today:
+        yield value
+        value = add_months(value, months, day=start_date.day)
+
+
+def _locked(queryset):
+    """Блокирует строки подписок (не строки присоединённых таблиц - компании остаются доступны)"""
+    features = connection.features
+    if not features.has_select_for_update:
+        return queryset
+    return queryset.select_for_update(
+        skip_locked=features.has_select_for_update_skip_locked,
+        of=('self',) if features.has_select_for_update_of else (),
+    )
+
+
+class RenewalEngine:
+    """
+    Продлевает подписки пачками по chunk_size строк. Прогресс сохраняется в
+    JobCheckpoint в той же транзакции, что и изменения, поэтому после сбоя
+    повторный запуск продолжает с места остановки, а обработанные строки
+    не продлеваются второй раз. Сначала продлеваются подписки (у закончившихся -
+    только за даты оплаты до end_date), затем закончившиеся переводятся в "Истекла"
+    """
+
+    def __init__(self, today=None, chunk_size=1000, checkpoint_name=CHECKPOINT_NAME):
+        self.today = today or date.today()
+        self.chunk_size = chunk_size
+        self.checkpoint_name = checkpoint_name
+
+    def run(self):
+        """Выполняет полный проход и возвращает статистику"""
+        checkpoint, _ = JobCheckpoint.objects.get_or_create(name=self.checkpoint_name)
+        state = checkpoint.state
+        if state.get('run_date') != self.today.isoformat() or state.get('finished'):
+            state = {'run_date': self.today.isoformat(), 'expired': 0, 'renewed': 0}
+        resumed = 'stage' in state
+        state.setdefault('stage', 'renew')
+
+        if state['stage'] == 'renew':
+            while self._renew_chunk(checkpoint, state):
+                pass
+            state['stage'] = 'expire'
+        while self._expire_chunk(checkpoint, state):
+            pass
+
+        state['finished'] = True
+        self._save(checkpoint, state)
+        return {'expired': state['expired'], 'renewed': state['renewed'], 'resumed': resumed}
+
+    def _save(self, checkpoint, state):
+        checkpoint.state = state
+        checkpoint.save(update_fields=['state', 'updated_at'])
+
+    def _expire_chunk(self, checkpoint, state):
+        """Переводит в "Истекла" активные подписки с прошедшей датой окончания"""
+        with transaction.atomic():
+            rows = list(
+                _locked(Subscription.objects.filter(status='active', end_date__lt=self.today))
+                .order_by('end_date', 'pk')
+                .values_list('pk', 'user_id')[:self.chunk_size]
+            )
+            if not rows:
+                return False
+            Subscription.objects.filter(pk__in=[pk for pk, _ in rows]).update(
+                status='expired', updated_at=timezone.now()
+            )
+            # update() не вызывает сигналы - пересчитываем сводки затронутых пользователей
+            UserSubscriptionSummary.rebuild_many(sorted({user_id for _, user_id in rows}))
+            bump_user_subscriptions({user_id for _, user_id in rows})
+            state['expired'] += len(rows)
+            self._save(checkpoint, state)
+        return True
+
+    def _renew_chunk(self, checkpoint, state):
+        """
+        Переносит next_billing_date вперёд у подписок, дата оплаты которых наступила
+        не позже даты окончания; списания - за даты оплаты до today и end_date
+        """
+        queryset = Subscription.objects.filter(status='active', next_billing_date__lte=self.today).filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=F('next_billing_date'))
+        )
+        if 'last' in state:
+            last_date, last_pk = date.fromisoformat(state['last'][0]), state['last'][1]
+            queryset = queryset.filter(
+                Q(next_billing_date__gt=last_date) | Q(next_billing_date=last_date, pk__gt=last_pk)
+            )
+
+        with transaction.atomic():
+            rows = list(
+                _locked(queryset)
+                .order_by('next_billing_date', 'pk')
+                .values_list(
+                    'pk', 'next_billing_date', 'start_date', 'billing_period',
+                    'price', 'user_id', 'company__category_id', 'end_date',
+                )[:self.chunk_size]
+            )
+            if not rows:
+                return False
+            now = timezone.now()
+            Subscription.objects.bulk_update(
+                [
+                    Subscription(
+                        pk=pk,
+                        next_billing_date=next_billing_after(
+                            next_billing_date, start_date, period, min(self.today, end_date or self.today),
+                        ),
+                        updated_at=now,
+                    )
+                    for pk, next_billing_date, start_date, period, *_, end_date in rows
+                ],
+                ['next_billing_date', 'updated_at'],
+            )
+            # Списание за каждый наступивший период (пропущенные запуски тоже учитываются)
+            PriceEvent.record([
+                PriceEvent(
+                    subscription_id=pk,
+                    user_id=user_id,
+                    category_id=category_id,
+                    kind=PriceEvent.KIND_CHARGE,
+                    effective_date=billing_date,
+                    amount=price,
+                )
+                for pk, next_billing_date, start_date, period, price, user_id, category_id, end_date in rows
+                for billing_date in billing_dates_until(
+                    next_billing_date, start_date, period, min(self.today, end_date or self.today),
+                )
+            ])
+            bump_user_subscriptions({row[5] for row in rows})
+            last_pk, last_date = rows[-1][0], rows[-1][1]
+            state['last'] = [last_date.isoformat(), last_pk]
+            state['renewed'] += len(rows)
+            self._save(checkpoint, state)
+        return True
+
+
+def backfill_price_history(today=None, chunk_size=1000):
+    """
+    Заполняет историю цен подписок, у которых её ещё нет: начальная цена
+    на дату начала и списания за уже оплаченные периоды (до next_billing_date).
+    Возвращает количество записанных событий
+    """
+    today = today or date.today()
+    queryset = Subscription.objects.filter(price_events__isnull=True).order_by('pk')
+    recorded = 0
+    last_pk = 0
+    while True:
+        rows = list(
+            queryset.filter(pk__gt=last_pk).values_list(
+                'pk', 'user_id', 'company__category_id', 'price',
+                'billing_period', 'start_date', 'next_billing_date', 'end_date',
+            )[:chunk_size]
+        )
+        if not rows:
+            return recorded
+        events = []
+        for pk, user_id, category_id, price, period, start_date, next_billing_date, end_date in rows:
+            event = dict(subscription_id=pk, user_id=user_id, category_id=category_id, amount=price)
+            events.append(PriceEvent(kind=PriceEvent.KIND_PRICE_CHANGE, effective_date=start_date, **event))
+            until = min(today, next_billing_date - timedelta(days=1), end_date or today)
+            events.extend(
+                PriceEvent(kind=PriceEvent.KIND_CHARGE, effective_date=billing_date, **event)
+                for billing_date in billing_dates_until(start_date, start_date, period, until)
+            )
+        with transaction.atomic():
+            PriceEvent.record(events)
+        recorded += len(events)
+        last_pk = rows[-1][0]
@@ -0,0 +1,68 @@
+"""
+Маршрутизация ORM между основной БД (default) и репликами для чтения
+(settings.DATABASE_REPLICAS). Запись всегда идёт в основную БД и
+закрепляет за ней оставшуюся часть запроса, чтобы чтение сразу после
+записи не попало на отстающую реплику. Закрепление хранится в ContextVar
+и сбрасывается ReplicaPinningMiddleware в начале каждого запроса.
+Запрос, прочитавший недавно изменённую версию кэша, тоже закрепляется
+(см. core.cache)
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+_pinned = ContextVar('db_pinned_to_primary', default=False)
+_written = ContextVar('db_written', default=False)
+
+
+def pin_to_primary():
+    """Направляет все последующие запросы текущего контекста в основную БД"""
+    _pinned.set(True)
+
+
+def has_written():
+    """Была ли в текущем контексте запись в основную БД"""
+    return _written.get()
+
+
+def reset_pin():
+    _pinned.set(False)
+    _written.set(False)
+
+
+@contextmanager
+def use_primary():
+    """Читает с основной БД внутри блока"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def __init__(self):
+        self.replicas = list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        _written.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит с репликацией
+        return db not in self.replicas
@@ -0,0 +1,302 @@
+"""
+Полнотекстовый поиск по каталогу компаний (название, категория, описание).
+
+Индекс хранится отдельно от таблицы компаний и обновляется сигналами
+Company/Category, а после массовых операций - index_companies() или
+командой rebuild_search_index:
+
+  * SQLite - виртуальная таблица FTS5 (rowid = id компании) с префиксными
+    индексами; слова приводятся к основе стеммером stem() и при индексации,
+    и при поиске, ранжирование - bm25 с весами колонок;
+  * PostgreSQL - tsvector с конфигурацией russian, GIN-индекс и ts_rank.
+
+Каждое слово запроса ищется как префикс, поэтому поиск подходит для
+подсказок при наборе. Ранжируются не все совпадения, а кандидаты: до
+CANDIDATE_LIMIT совпадений в названии и столько же любых совпадений
+(LIMIT без сортировки прекращает обход индекса). Совпадения в названии
+идут выше совпадений только в категории или описании. Результаты
+кэшируются до изменения версии каталога
+"""
+
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, router
+
+from .cache import catalog_version
+from .models import Company
+
+
+SEARCH_TABLE = 'core_company_search'
+
+# Веса колонок при ранжировании: название, категория, описание
+COLUMN_WEIGHTS = (10.0, 3.0, 1.0)
+
+# Кандидатов каждого вида (в названии и любых) перед ранжированием
+CANDIDATE_LIMIT = 200
+
+
+# ==================== Стеммер ====================
+# Упрощённая реализация алгоритма Snowball для русского языка:
+# окончания удаляются только в области RV (после первой гласной)
+
+_VOWEL = re.compile('[аеиоуыэюя]')
+_WORD = re.compile(r'\w+')
+
+_PERFECTIVE_GERUND = re.compile(r'(?:(?<=[ая])(?:в|вши|вшись)|ив|ивши|ившись|ыв|ывши|ывшись)$')
+_REFLEXIVE = re.compile(r'(?:ся|сь)$')
+_ADJECTIVAL = re.compile(
+    r'(?:(?<=[ая])(?:ем|нн|вш|ющ|щ)|ивш|ывш|ующ)?'
+    r'(?:ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$'
+)
+_VERB = re.compile(
+    r'(?:(?<=[ая])(?:ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)'
+    r'|ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)$'
+)
+_NOUN = re.compile(
+    r'(?:а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_DERIVATIONAL = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'ейше?$')
+
+
+def _region_after_consonant(word, start):
+    """Начало области после первой согласной, следующей за гласной (R1/R2)"""
+    for index in range(start + 1, len(word)):
+        if _VOWEL.match(word[index - 1]) and not _VOWEL.match(word[index]):
+            return index + 1
+    return len(word)
+
+
+def stem(word):
+    """Основа русского слова; слова без русских гласных возвращаются как есть"""
+    word = word.lower().replace('ё', 'е')
+    match = _VOWEL.search(word)
+    if match is None:
+        return word
+    rv_start = match.end()
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1: деепричастие или возвратная частица + прилагательное/глагол/существительное
+    match = _PERFECTIVE_GERUND.search(rv)
+    if match:
+        rv = rv[:match.start()]
+    else:
+        rv = _REFLEXIVE.sub('', rv, count=1)
+        for pattern in (_ADJECTIVAL, _VERB, _NOUN):
+            match = pattern.search(rv)
+            if match:
+                rv = rv[:match.start()]
+                break
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательные суффиксы в R2
+    r2 = _region_after_consonant(word, _region_after_consonant(word, 0))
+    match = _DERIVATIONAL.search(rv)
+    if match and rv_start + match.start() >= r2:
+        rv = rv[:match.start()]
+
+    # Шаг 4: превосходная степень, двойное "н", мягкий знак
+    match = _SUPERLATIVE.search(rv)
+    if match:
+        rv = rv[:match.start()]
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    elif rv.endswith('ь'):
+        rv = rv[:-1]
+    return prefix + rv
+
+
+def terms(text):
+    """Основы слов текста"""
+    return [stem(word) for word in _WORD.findall(text or '')]
+
+
+# ==================== Индекс SQLite (FTS5) ====================
+class SqliteSearchBackend:
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+            f"name, category, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3 4 5 6')"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def optimize(self, cursor):
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+
+    def remove(self, cursor, company_ids):
+        cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(pk,) for pk in company_ids])
+
+    def index(self, cursor, rows):
+        self.remove(cursor, [row[0] for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, category, description) VALUES (%s, %s, %s, %s)',
+            [
+                (pk, ' '.join(terms(name)), ' '.join(terms(category)), ' '.join(terms(description)))
+                for pk, name, category, description in rows
+            ],
+        )
+
+    def search(self, cursor, words, limit):
+        match = ' '.join('"{}"*'.format(stem(word).replace('"', '""')) for word in words)
+        candidates = (
+            f'SELECT rowid, %s AS tier, bm25({SEARCH_TABLE}, %s, %s, %s) AS score '
+            f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s LIMIT %s'
+        )
+        # Строка, найденная обоими запросами, ранжируется как совпадение в названии:
+        # при min() остальные столбцы берутся из строки с минимумом
+        cursor.execute(
+            f'SELECT rowid, min(tier) AS tier, score FROM ('
+            f'SELECT * FROM ({candidates}) UNION ALL SELECT * FROM ({candidates})'
+            f') GROUP BY rowid ORDER BY tier, score LIMIT %s',
+            [
+                0, *COLUMN_WEIGHTS, f'{{name}} : ({match})', CANDIDATE_LIMIT,
+                1, *COLUMN_WEIGHTS, match, CANDIDATE_LIMIT,
+                limit,
+            ],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+# ==================== Индекс PostgreSQL (tsvector) ====================
+class PostgresSearchBackend:
+    document = (
+        "setweight(to_tsvector('russian', %s), 'A') || "
+        "setweight(to_tsvector('russian', %s), 'B') || "
+        "setweight(to_tsvector('russian', %s), 'C')"
+    )
+
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+            f'company_id bigint PRIMARY KEY REFERENCES core_company (id) ON DELETE CASCADE, '
+            f'document tsvector NOT NULL)'
+        )
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_gin ON {SEARCH_TABLE} USING gin (document)')
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def optimize(self, cursor):
+        cursor.execute(f'ANALYZE {SEARCH_TABLE}')
+
+    def remove(self, cursor, company_ids):
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE company_id = ANY(%s)', [list(company_ids)])
+
+    def index(self, cursor, rows):
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (company_id, document) VALUES (%s, {self.document}) '
+            f'ON CONFLICT (company_id) DO UPDATE SET document = EXCLUDED.document',
+            [(pk, name or '', category or '', description or '') for pk, name, category, description in rows],
+        )
+
+    def search(self, cursor, words, limit):
+        query = ' & '.join(f'{word}:*' for word in words)
+        # :*A - префикс в названии (вес A)
+        name_query = ' & '.join(f'{word}:*A' for word in words)
+        candidates = (
+            f'(SELECT company_id, %s AS tier, ts_rank(document, query) AS score '
+            f"FROM {SEARCH_TABLE}, to_tsquery('russian', %s) query WHERE document @@ query LIMIT %s)"
+        )
+        cursor.execute(
+            f'SELECT company_id FROM ('
+            f'SELECT DISTINCT ON (company_id) company_id, tier, score '
+            f'FROM ({candidates} UNION ALL {candidates}) candidates ORDER BY company_id, tier'
+            f') ranked ORDER BY tier, score DESC LIMIT %s',
+            [0, name_query, CANDIDATE_LIMIT, 1, query, CANDIDATE_LIMIT, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend(),
+    'postgresql': PostgresSearchBackend(),
+}
+
+
+def get_backend(connection):
+    return BACKENDS.get(connection.vendor)
+
+
+# ==================== Индексация и поиск ====================
+def _index_rows(companies):
+    return list(companies.values_list('pk', 'name', 'category__name', 'description'))
+
+
+def index_companies(company_ids, using=DEFAULT_DB_ALIAS):
+    """Обновляет записи индекса компаний (удалённые компании убираются из индекса)"""
+    connection = connections[using]
+    backend = get_backend(connection)
+    if backend is None:
+        return
+    company_ids = list(company_ids)
+    rows = _index_rows(Company.objects.using(using).filter(pk__in=company_ids))
+    with connection.cursor() as cursor:
+        backend.remove(cursor, set(company_ids) - {row[0] for row in rows})
+        backend.index(cursor, rows)
+
+
+def remove_companies(company_ids, using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    backend = get_backend(connection)
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, list(company_ids))
+
+
+def rebuild_index(connection, companies=None, batch_size=5000):
+    """
+    Пересоздаёт индекс целиком. companies - менеджер модели компаний
+    (в миграции - исторической); возвращает количество проиндексированных компаний
+    """
+    backend = get_backend(connection)
+    if backend is None:
+        return 0
+    companies = (companies if companies is not None else Company.objects).using(connection.alias).order_by('pk')
+    indexed = 0
+    last_pk = 0
+    with connection.cursor() as cursor:
+        backend.drop(cursor)
+        backend.create(cursor)
+        while True:
+            rows = _index_rows(companies.filter(pk__gt=last_pk)[:batch_size])
+            if not rows:
+                backend.optimize(cursor)
+                return indexed
+            backend.index(cursor, rows)
+            indexed += len(rows)
+            last_pk = rows[-1][0]
+
+
+def _search(words, limit):
+    connection = connections[router.db_for_read(Company)]
+    backend = get_backend(connection)
+    if backend is None:
+        return list(
+            Company.objects.filter(name__icontains=' '.join(words)).order_by('name').values_list('pk', flat=True)[:limit]
+        )
+    with connection.cursor() as cursor:
+        return backend.search(cursor, words, limit)
+
+
+def search_company_ids(query, limit=20):
+    """
+    id компаний по запросу в порядке релевантности. Если БД не поддерживает
+    индекс, используется поиск подстроки по названию
+    """
+    words = _WORD.findall(query.lower())[:8]
+    if not words:
+        return []
+    key = hashlib.md5(' '.join(words).encode()).hexdigest()
+    return cache.get_or_set(
+        f'search:{catalog_version()}:{key}:{limit}',
+        lambda: _search(words, limit),
+        getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300),
+    )
@@ -0,0 +1,225 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import counters, search, sync
+from .cache import bump_user_subscriptions, bump_version
+from .models import Category, Company, Plan, PriceEvent, Subscription, Tombstone, UserSubscriptionSummary
+
+
+# ==================== Сводка подписок пользователя ====================
+def _contribution(subscription, category_id=None):
+    """
+    Вклад подписки в сводку: (status, billing_period, category_id, price).
+    category_id - уже известная категория компании, иначе она запрашивается
+    """
+    if category_id is None:
+        if Subscription.company.is_cached(subscription):
+            category_id = subscription.company.category_id
+        else:
+            category_id = Company.objects.values_list('category_id', flat=True).get(pk=subscription.company_id)
+    return (subscription.status, subscription.billing_period, category_id, subscription.price)
+
+
+def _apply_to_summary(user_id, old=None, new=None):
+    with transaction.atomic():
+        summary = UserSubscriptionSummary.objects.select_for_update().filter(user_id=user_id).first()
+        if summary is None:
+            # Сводки ещё нет - при сохранении собираем её целиком, при удалении
+            # (в том числе каскадном вместе с пользователем) ничего не делаем
+            if new is not None:
+                UserSubscriptionSummary.rebuild(user_id)
+            return
+        summary.apply(old, new)
+        summary.save()
+
+
+@receiver(pre_save, sender=Subscription)
+def remember_subscription_state(sender, instance, raw=False, **kwargs):
+    """
+    Запоминает прежнего владельца (_old_user_id) и вклад в сводку до сохранения
+    (_summary_old), а также новый вклад (_summary_new) - один раз на сохранение
+    для всех обработчиков post_save
+    """
+    instance._old_user_id = instance._summary_old = instance._summary_new = None
+    if raw:
+        return
+    category_id = None
+    if not instance._state.adding and instance.pk is not None:
+        row = (
+            Subscription.objects
+            .filter(pk=instance.pk)
+            .values_list('user_id', 'company_id', 'status', 'billing_period', 'company__category_id', 'price')
+            .first()
+        )
+        if row is not None:
+            instance._old_user_id, instance._summary_old = row[0], row[2:]
+            # Компания не сменилась - её категория уже известна
+            if row[1] == instance.company_id:
+                category_id = row[4]
+    instance._summary_new = _contribution(instance, category_id)
+
+
+@receiver(post_save, sender=Subscription)
+def update_summary_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = instance._summary_old
+    if old is not None and instance._old_user_id != instance.user_id:
+        _apply_to_summary(instance._old_user_id, old=old)
+        old = None
+    _apply_to_summary(instance.user_id, old=old, new=instance._summary_new)
+
+
+@receiver(pre_delete, sender=Subscription)
+def remember_subscription_contribution(sender, instance, **kwargs):
+    instance._old_user_id = None
+    instance._summary_deleted = _contribution(instance)
+
+
+@receiver(post_delete, sender=Subscription)
+def update_summary_on_delete(sender, instance, **kwargs):
+    _apply_to_summary(instance.user_id, old=instance._summary_deleted)
+
+
+@receiver(pre_save, sender=Company)
+def remember_company_category(sender, instance, raw=False, **kwargs):
+    instance._old_category_id = None
+    if not raw and not instance._state.adding and instance.pk is not None:
+        instance._old_category_id = (
+            Company.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Company)
+def rebuild_summaries_on_category_change(sender, instance, created=False, raw=False, **kwargs):
+    """При смене категории компании пересчитываем сводки её подписчиков"""
+    old_category_id = getattr(instance, '_old_category_id', None)
+    if raw or created or old_category_id is None or old_category_id == instance.category_id:
+        return
+    user_ids = list(
+        Subscription.objects.filter(company=instance).order_by().values_list('user_id', flat=True).distinct()
+    )
+    if user_ids:
+        UserSubscriptionSummary.rebuild_many(user_ids)
+
+
+# ==================== История цен ====================
+@receiver(post_save, sender=Subscription)
+def record_price_change(sender, instance, created=False, raw=False, **kwargs):
+    """Записывает в историю начальную цену подписки и её изменения"""
+    if raw:
+        return
+    old = instance._summary_old
+    if created:
+        effective_date = instance.start_date
+    elif old is not None and old[3] != Decimal(str(instance.price)):
+        effective_date = date.today()
+    else:
+        return
+    PriceEvent.record([
+        PriceEvent(
+            subscription=instance,
+            user_id=instance.user_id,
+            category_id=instance._summary_new[2],
+            kind=PriceEvent.KIND_PRICE_CHANGE,
+            effective_date=effective_date,
+            amount=instance.price,
+        )
+    ])
+
+
+# ==================== Планы подписок ====================
+@receiver(post_save, sender=Company)
+def sync_company_plans(sender, instance, raw=False, **kwargs):
+    """Переносит subscription_plans компании в таблицу Plan"""
+    if not raw:
+        Plan.sync_companies([instance.pk])
+
+
+# ==================== Поисковый индекс ====================
+@receiver(post_save, sender=Company)
+def index_company(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_companies([instance.pk])
+
+
+@receiver(post_delete, sender=Company)
+def unindex_company(sender, instance, **kwargs):
+    search.remove_companies([instance.pk])
+
+
+@receiver(pre_save, sender=Category)
+def remember_category_name(sender, instance, raw=False, **kwargs):
+    instance._old_name = None
+    if not raw and not instance._state.adding and instance.pk is not None:
+        instance._old_name = Category.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_companies(sender, instance, created=False, raw=False, **kwargs):
+    """Название категории входит в индекс компаний - переиндексируем их при переименовании"""
+    old_name = getattr(instance, '_old_name', None)
+    if raw or created or old_name is None or old_name == instance.name:
+        return
+    search.index_companies(Company.objects.filter(category=instance).values_list('pk', flat=True))
+
+
+# ==================== Версии кэша каталога ====================
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_category_version(sender, **kwargs):
+    bump_version('category')
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def bump_company_version(sender, **kwargs):
+    bump_version('company')
+
+
+# ==================== Версии кэша подписок ====================
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def bump_subscriptions_version(sender, instance, **kwargs):
+    """Сбрасывает кэш подписок владельца (и прежнего владельца, если он сменился)"""
+    user_ids = {instance.user_id}
+    if getattr(instance, '_old_user_id', None) is not None:
+        user_ids.add(instance._old_user_id)
+    bump_user_subscriptions(user_ids)
+
+
+# ==================== Лента изменений ====================
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Subscription)
+def record_deletion(sender, instance, **kwargs):
+    sync.record_deletion(instance)
+
+
+@receiver(post_save, sender=Subscription)
+def record_owner_change(sender, instance, raw=False, **kwargs):
+    """Для прежнего владельца подписка, переданная другому пользователю, удалена"""
+    old_user_id = getattr(instance, '_old_user_id', None)
+    if not raw and old_user_id is not None and old_user_id != instance.user_id:
+        Tombstone.objects.create(object_type='subscription', object_id=instance.pk, user_id=old_user_id)
+
+
+# ==================== Счётчики главной страницы ====================
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Company)
+def increment_counter(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        counters.increment(_COUNTER_NAMES[sender])
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Company)
+def decrement_counter(sender, instance, **kwargs):
+    counters.increment(_COUNTER_NAMES[sender], -1)
+
+
+_COUNTER_NAMES = {model: name for name, model in counters.COUNTED_MODELS.items()}
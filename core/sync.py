@@ -0,0 +1,138 @@
+"""
+Лента изменений для синхронизации клиентов (мобильные приложения, выгрузка в BI).
+
+Клиент передаёт отметку since из предыдущего ответа и получает только
+категории, компании и подписки с updated_at после неё, а также удаления
+из таблицы Tombstone. Строки читаются пачками по индексу (updated_at, id)
+и отдаются потоком NDJSON:
+
+    {"model": "company", "id": 7, "deleted": false, "data": {...}}
+    {"model": "subscription", "id": 42, "deleted": true}
+    {"since": "2024-05-01T10:00:00+00:00", "reset": false, "count": 2}
+
+Последняя строка содержит отметку для следующего запроса. Отметка
+сдвигается назад на SYNC_OVERLAP, чтобы не пропустить транзакции,
+зафиксированные позже записанного в них updated_at, поэтому часть строк
+может прийти повторно - клиент применяет их по id. Если since старше
+срока хранения записей об удалениях, лента начинается заново ("reset": true)
+"""
+
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Category, Company, Subscription, Tombstone
+
+
+SYNC_MODELS = {
+    'category': (Category, ['id', 'name', 'description', 'created_at', 'updated_at']),
+    'company': (
+        Company,
+        ['id', 'name', 'category_id', 'description', 'website', 'logo_url', 'subscription_plans',
+         'created_at', 'updated_at'],
+    ),
+    'subscription': (
+        Subscription,
+        ['id', 'company_id', 'plan_name', 'price', 'billing_period', 'status', 'start_date',
+         'next_billing_date', 'end_date', 'notes', 'created_at', 'updated_at'],
+    ),
+}
+
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+def tombstone_retention():
+    return timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 90))
+
+
+def _keyset_chunks(queryset, field, chunk_size):
+    """Строки queryset.values() по возрастанию (field, id) пачками без OFFSET"""
+    queryset = queryset.order_by(field, 'id')
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            chunk = chunk.filter(Q(**{f'{field}__gt': last[0]}) | Q(**{field: last[0], 'id__gt': last[1]}))
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+        yield from rows
+        last = rows[-1][field], rows[-1]['id']
+
+
+class ChangeFeed:
+    """
+    Изменения после since (None - все объекты). user ограничивает подписки
+    и их удаления подписками пользователя; без него лента содержит все подписки
+    """
+
+    def __init__(self, since=None, user=None, models=None, chunk_size=1000):
+        self.now = timezone.now()
+        self.reset = since is not None and since < self.now - tombstone_retention()
+        self.since = None if self.reset else since
+        self.user = user
+        self.models = [name for name in SYNC_MODELS if models is None or name in models]
+        self.chunk_size = chunk_size
+        self.count = 0
+
+    def _queryset(self, name):
+        model, _ = SYNC_MODELS[name]
+        queryset = model.objects.all()
+        if name == 'subscription' and self.user is not None:
+            queryset = queryset.filter(user=self.user)
+        return queryset
+
+    def changed(self, name):
+        _, fields = SYNC_MODELS[name]
+        queryset = self._queryset(name)
+        if self.since is not None:
+            queryset = queryset.filter(updated_at__gt=self.since - SYNC_OVERLAP)
+        for row in _keyset_chunks(queryset.values(*fields), 'updated_at', self.chunk_size):
+            yield {'model': name, 'id': row['id'], 'deleted': False, 'data': row}
+
+    def deleted(self, name):
+        # При полной выгрузке удалённых объектов у клиента нет
+        if self.since is None:
+            return
+        if name == 'subscription' and self.user is not None:
+            queryset = Tombstone.objects.filter(user=self.user)
+        else:
+            queryset = Tombstone.objects.filter(object_type=name)
+        # Подписка, переданная другому и возвращённая, у клиента по-прежнему есть
+        queryset = queryset.exclude(Exists(self._queryset(name).filter(pk=OuterRef('object_id'))))
+        queryset = queryset.filter(deleted_at__gt=self.since - SYNC_OVERLAP).values('id', 'object_id', 'deleted_at')
+        for row in _keyset_chunks(queryset, 'deleted_at', self.chunk_size):
+            yield {'model': name, 'id': row['object_id'], 'deleted': True}
+
+    def __iter__(self):
+        for name in self.models:
+            for change in self.changed(name):
+                self.count += 1
+                yield change
+            for change in self.deleted(name):
+                self.count += 1
+                yield change
+
+    def ndjson(self):
+        for change in self:
+            yield json.dumps(change, ensure_ascii=False, default=str) + '\n'
+        yield json.dumps({'since': self.now.isoformat(), 'reset': self.reset, 'count': self.count}) + '\n'
+
+
+def record_deletion(instance):
+    """Сохраняет запись об удалении instance (категории, компании или подписки)"""
+    object_type = instance._meta.model_name
+    Tombstone.objects.create(
+        object_type=object_type,
+        object_id=instance.pk,
+        user_id=instance.user_id if object_type == 'subscription' else None,
+    )
+
+
+def purge_tombstones():
+    """Удаляет записи об удалениях старше срока хранения; возвращает их количество"""
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=timezone.now() - tombstone_retention()).delete()
+    return deleted
@@ -0,0 +1,26 @@
+"""
+Кэшируемые варианты тегов админки
+"""
+
+import hashlib
+
+from django import template
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.core.cache import cache
+
+
+register = template.Library()
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def cached_date_hierarchy(cl):
+    """
+    Тег date_hierarchy с результатом из кэша: пока год не выбран, Django
+    считает MIN/MAX и список лет по всей таблице при каждом открытии списка.
+    Время жизни - date_hierarchy_cache_timeout модели админки (0 - без кэша)
+    """
+    timeout = getattr(cl.model_admin, 'date_hierarchy_cache_timeout', 0)
+    if not timeout:
+        return date_hierarchy(cl)
+    query = hashlib.md5(cl.get_query_string().encode()).hexdigest()
+    return cache.get_or_set(f'admin:date_hierarchy:{cl.opts.label_lower}:{query}', lambda: date_hierarchy(cl), timeout)
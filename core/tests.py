@@ -1,3 +1,1309 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import csv
+import io
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .templatetags import admin_cache
+from . import analytics, checks, counters, details, forecast, routers, search, sync
+from .reminders import EmailReminderBackend, ReminderDispatcher
+from .admin import SubscriptionAdmin
+from .pagination import EstimatedCountPaginator, KeysetPaginator
+from .renewals import RenewalEngine, add_months
+from .cache import bump_version, get_version, user_subscriptions_version
+from .catalog import build_catalog, get_catalog
+from .exports import EXPORT_COLUMNS
+from .imports import Importer
+from .middleware import RequestMetricsMiddleware
+from .models import (
+    BILLING_PERIOD_MONTHS, Category, Company, MonthlySpend, Plan, PriceEvent, ReminderLog, Subscription, UserSubscriptionSummary,
+    parse_plan_prices,
+)
+
+
+def make_subscription(user, company, **fields):
+    values = {
+        'plan_name': 'Базовая',
+        'price': Decimal('100.00'),
+        'billing_period': 'monthly',
+        'status': 'active',
+        'start_date': date(2024, 1, 1),
+        'next_billing_date': date(2024, 2, 1),
+        **fields,
+    }
+    return Subscription.objects.create(user=user, company=company, **values)
+
+
+# Метрики пишут в лог каждый повторяющийся SQL - в тестах они выключены,
+# даже если включены в окружении (их тесты включают метрики сами)
+@override_settings(REQUEST_METRICS_ENABLED=False)
+class CatalogTestCase(TestCase):
+    """Пользователь, категория и компания для тестов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.category = Category.objects.create(name='Музыка')
+        cls.company = Company.objects.create(name='Звук', category=cls.category)
+
+    def setUp(self):
+        # Версии и записи кэша не должны переходить из теста в тест
+        cache.clear()
+
+
+# ==================== Сводки подписок ====================
+class SummaryTests(CatalogTestCase):
+
+    def assertSummaryMatchesRebuild(self, user):
+        summary = UserSubscriptionSummary.objects.get(user=user)
+        rebuilt = UserSubscriptionSummary.rebuild(user.pk)
+        for field in ('total_count', 'active_count', 'monthly_cost', 'cost_by_period', 'by_category'):
+            self.assertEqual(getattr(summary, field), getattr(rebuilt, field), field)
+        return rebuilt
+
+    def test_summary_follows_subscription_changes(self):
+        other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        monthly = make_subscription(self.user, self.company)
+        yearly = make_subscription(self.user, self.company, price=Decimal('1200.00'), billing_period='yearly')
+        summary = self.assertSummaryMatchesRebuild(self.user)
+        self.assertEqual((summary.total_count, summary.active_count), (2, 2))
+        self.assertEqual(summary.monthly_cost, Decimal('200.00'))
+
+        monthly.status = 'cancelled'
+        monthly.save()
+        yearly.price = Decimal('600.00')
+        yearly.save()
+        summary = self.assertSummaryMatchesRebuild(self.user)
+        self.assertEqual(summary.monthly_cost, Decimal('50.00'))
+
+        # Передача подписки другому пользователю - вычитание у прежнего владельца
+        UserSubscriptionSummary.for_user(other)
+        yearly.user = other
+        yearly.save()
+        self.assertSummaryMatchesRebuild(other)
+        summary = self.assertSummaryMatchesRebuild(self.user)
+        self.assertEqual((summary.total_count, summary.active_count, summary.by_category), (1, 0, {}))
+
+        monthly.delete()
+        self.assertEqual(self.assertSummaryMatchesRebuild(self.user).total_count, 0)
+
+    def test_company_category_read_once_per_save(self):
+        def company_queries(save):
+            with CaptureQueriesContext(connection) as context:
+                save()
+            return [query for query in context.captured_queries if 'FROM "core_company"' in query['sql']]
+
+        subscription = Subscription(
+            user=self.user, company_id=self.company.pk, plan_name='Базовая', price=Decimal('100.00'),
+            billing_period='monthly', start_date=date(2024, 1, 1), next_billing_date=date(2024, 2, 1),
+        )
+        self.assertEqual(len(company_queries(subscription.save)), 1)
+
+        subscription = Subscription.objects.get(pk=subscription.pk)
+        subscription.price = Decimal('150.00')
+        # Компания не сменилась - категория берётся из запроса прежнего состояния
+        self.assertEqual(company_queries(subscription.save), [])
+        self.assertSummaryMatchesRebuild(self.user)
+
+    def test_owner_change_resets_both_owners_caches(self):
+        other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        subscription = make_subscription(self.user, self.company)
+        versions = [user_subscriptions_version(user.pk) for user in (self.user, other)]
+        subscription.user = other
+        subscription.save()
+        self.assertTrue(all(
+            user_subscriptions_version(user.pk) != version for user, version in zip((self.user, other), versions)
+        ))
+
+        # Удаление сбрасывает кэш только текущего владельца
+        version = user_subscriptions_version(self.user.pk)
+        subscription.delete()
+        self.assertEqual(user_subscriptions_version(self.user.pk), version)
+        self.assertSummaryMatchesRebuild(other)
+
+    def test_category_change_rebuilds_summary(self):
+        make_subscription(self.user, self.company)
+        UserSubscriptionSummary.for_user(self.user)
+        self.company.category = Category.objects.create(name='Видео')
+        self.company.save()
+        summary = self.assertSummaryMatchesRebuild(self.user)
+        self.assertEqual(list(summary.by_category), [str(self.company.category_id)])
+
+
+# ==================== Статистика подписок ====================
+class SubscriptionStatsTests(CatalogTestCase):
+
+    def loop_stats(self, queryset):
+        """Прежний подсчёт циклом по подпискам - эталон для агрегирующего запроса"""
+        subscriptions = list(queryset)
+        monthly_cost = sum(
+            (sub.price / BILLING_PERIOD_MONTHS[sub.billing_period] for sub in subscriptions if sub.status == 'active'),
+            Decimal('0'),
+        )
+        return {
+            'total': len(subscriptions),
+            'active': sum(sub.status == 'active' for sub in subscriptions),
+            'monthly_cost': monthly_cost.quantize(Decimal('0.01')),
+        }
+
+    def assertMatchesLoop(self, stats, queryset):
+        self.assertEqual(
+            {key: stats[key] for key in ('total', 'active', 'monthly_cost')}, self.loop_stats(queryset),
+        )
+
+    def test_empty_queryset(self):
+        stats = Subscription.objects.filter(user=self.user).stats()
+        self.assertEqual((stats['total'], stats['active'], stats['monthly_cost']), (0, 0, Decimal('0.00')))
+        self.assertEqual(set(stats['by_status'].values()), {0})
+        self.assertEqual(set(stats['cost_by_period'].values()), {Decimal('0.00')})
+        self.assertMatchesLoop(stats, Subscription.objects.filter(user=self.user))
+
+    def test_periods_normalized_to_monthly(self):
+        make_subscription(self.user, self.company, price=Decimal('100.00'))
+        make_subscription(self.user, self.company, price=Decimal('300.00'), billing_period='quarterly')
+        make_subscription(self.user, self.company, price=Decimal('1200.00'), billing_period='yearly')
+        make_subscription(self.user, self.company, price=Decimal('999.00'), billing_period='yearly', status='paused')
+        make_subscription(self.user, self.company, price=Decimal('50.00'), status='cancelled')
+        queryset = Subscription.objects.filter(user=self.user)
+
+        stats = queryset.stats()
+        self.assertEqual((stats['total'], stats['active'], stats['monthly_cost']), (5, 3, Decimal('300.00')))
+        self.assertEqual(stats['by_status'], {'active': 3, 'cancelled': 1, 'expired': 0, 'paused': 1})
+        self.assertEqual(stats['cost_by_period'], {
+            'monthly': Decimal('100.00'), 'quarterly': Decimal('300.00'), 'yearly': Decimal('1200.00'),
+        })
+        self.assertMatchesLoop(stats, queryset)
+
+    def test_astats_matches_stats(self):
+        make_subscription(self.user, self.company, price=Decimal('10.00'), billing_period='quarterly')
+        make_subscription(self.user, self.company, status='expired')
+        queryset = Subscription.objects.filter(user=self.user)
+        stats = async_to_sync(queryset.astats)()
+        self.assertEqual(stats, queryset.stats())
+        self.assertEqual(stats['monthly_cost'], Decimal('3.33'))
+        self.assertMatchesLoop(stats, queryset)
+
+
+# ==================== Планы подписок ====================
+class PlanSyncTests(CatalogTestCase):
+
+    def test_parse_plan_prices_skips_invalid_values(self):
+        self.assertEqual(parse_plan_prices(['Базовая']), {})
+        self.assertEqual(parse_plan_prices(None), {})
+        self.assertEqual(parse_plan_prices({
+            'nan': 'NaN',
+            'inf': 'Infinity',
+            'huge': '1e12',
+            'rounded up': '99999999.999',
+            'text': 'бесплатно',
+            'Семейная': '1 290,50',
+            'x' * 150: 5,
+        }), {'Семейная': Decimal('1290.50'), 'x' * 100: Decimal('5.00')})
+
+    def test_company_with_malformed_plans_is_saved(self):
+        company = Company.objects.create(name='Список', category=self.category, subscription_plans=['Базовая'])
+        self.assertFalse(company.plans.exists())
+        self.assertEqual(company.get_plan_names(), [])
+
+        company.subscription_plans = {'nan': 'NaN', 'huge': 1e12, 'Базовая': '199'}
+        company.save()
+        self.assertEqual(list(company.plans.values_list('name', 'price')), [('Базовая', Decimal('199.00'))])
+
+    def test_company_form_accepts_malformed_plans(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('company-update', args=[self.company.pk]), {
+            'name': self.company.name,
+            'category': self.category.pk,
+            'subscription_plans': '[1, 2]',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Plan.objects.filter(company=self.company).exists())
+
+        response = self.client.post(reverse('company-update', args=[self.company.pk]), {
+            'name': self.company.name,
+            'category': self.category.pk,
+            'subscription_plans': '{"Базовая": NaN}',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('subscription_plans', response.context['form'].errors)
+
+
+# ==================== Продление подписок ====================
+class RenewalTests(CatalogTestCase):
+
+    def charges(self, subscription):
+        return list(
+            PriceEvent.objects.filter(subscription=subscription, kind=PriceEvent.KIND_CHARGE)
+            .order_by('effective_date').values_list('effective_date', flat=True)
+        )
+
+    def test_renews_each_due_period_once(self):
+        # Оплата 31-го числа: в коротких месяцах - последний день месяца
+        subscription = make_subscription(
+            self.user, self.company, start_date=date(2024, 1, 31), next_billing_date=date(2024, 2, 29),
+        )
+        result = RenewalEngine(today=date(2024, 4, 15), chunk_size=1).run()
+        self.assertEqual((result['renewed'], result['resumed']), (1, False))
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.next_billing_date, date(2024, 4, 30))
+        self.assertEqual(self.charges(subscription), [date(2024, 2, 29), date(2024, 3, 31)])
+        self.assertEqual(
+            MonthlySpend.objects.get(user=self.user, month=date(2024, 3, 1)).total, Decimal('100.00'),
+        )
+
+        # Повторный запуск в тот же день ничего не списывает
+        self.assertEqual(RenewalEngine(today=date(2024, 4, 15)).run()['renewed'], 0)
+        self.assertEqual(len(self.charges(subscription)), 2)
+
+    def test_resumes_after_failure(self):
+        first = make_subscription(self.user, self.company)
+        second = make_subscription(self.user, self.company, plan_name='Семейная')
+        record = PriceEvent.record
+        calls = []
+
+        def failing_record(events):
+            calls.append(events)
+            if len(calls) == 2:
+                raise RuntimeError('сбой')
+            return record(events)
+
+        with mock.patch.object(PriceEvent, 'record', side_effect=failing_record):
+            with self.assertRaises(RuntimeError):
+                RenewalEngine(today=date(2024, 2, 5), chunk_size=1).run()
+
+        result = RenewalEngine(today=date(2024, 2, 5), chunk_size=1).run()
+        self.assertEqual((result['renewed'], result['resumed']), (2, True))
+        self.assertEqual(self.charges(first), [date(2024, 2, 1)])
+        self.assertEqual(self.charges(second), [date(2024, 2, 1)])
+
+    def test_expires_ended_subscriptions(self):
+        ended = make_subscription(self.user, self.company, end_date=date(2024, 1, 20))
+        active = make_subscription(self.user, self.company, next_billing_date=date(2024, 3, 1))
+        summary = UserSubscriptionSummary.for_user(self.user)
+        self.assertEqual(summary.active_count, 2)
+
+        result = RenewalEngine(today=date(2024, 2, 10)).run()
+        self.assertEqual((result['expired'], result['renewed']), (1, 0))
+        ended.refresh_from_db()
+        self.assertEqual(ended.status, 'expired')
+        self.assertEqual(self.charges(ended), [])
+        summary.refresh_from_db()
+        self.assertEqual(summary.active_count, 1)
+        active.refresh_from_db()
+        self.assertEqual(active.status, 'active')
+
+    def test_charges_overdue_dates_before_expiring(self):
+        # Оплаты 1 февраля и 1 марта пропущены, подписка закончилась 10 марта
+        subscription = make_subscription(self.user, self.company, end_date=date(2024, 3, 10))
+        result = RenewalEngine(today=date(2024, 4, 15)).run()
+        self.assertEqual((result['expired'], result['renewed']), (1, 1))
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.status, 'expired')
+        self.assertEqual(subscription.next_billing_date, date(2024, 4, 1))
+        self.assertEqual(self.charges(subscription), [date(2024, 2, 1), date(2024, 3, 1)])
+
+
+# ==================== Пагинация ====================
+class KeysetPaginationTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Повторяющиеся даты начала: порядок однозначен только вместе с id
+        for index in range(7):
+            make_subscription(self.user, self.company, start_date=date(2024, 1, 1 + index % 3))
+        self.queryset = Subscription.objects.filter(user=self.user)
+        self.expected = list(self.queryset.order_by('-start_date', 'id').values_list('pk', flat=True))
+
+    def test_pages_cover_all_rows_in_both_directions(self):
+        paginator = KeysetPaginator(self.queryset, ('-start_date', 'id'), per_page=3)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([obj.pk for page in pages for obj in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        backwards = [pages[-1]]
+        while backwards[-1].has_previous():
+            backwards.append(paginator.page(backwards[-1].previous_cursor))
+        self.assertEqual(
+            [[obj.pk for obj in page] for page in reversed(backwards)],
+            [[obj.pk for obj in page] for page in pages],
+        )
+
+    def test_list_view_cursor(self):
+        for _ in range(5):
+            make_subscription(self.user, self.company, start_date=date(2023, 12, 1))
+        expected = list(self.queryset.order_by('-start_date', 'id').values_list('pk', flat=True))
+        self.client.force_login(self.user)
+        url = reverse('subscription-list')
+
+        first = self.client.get(url).context['page_obj']
+        self.assertEqual([obj.pk for obj in first], expected[:10])
+        second = self.client.get(url, {'cursor': first.next_cursor}).context['page_obj']
+        self.assertEqual([obj.pk for obj in second], expected[10:])
+        self.assertFalse(second.has_next())
+        self.assertEqual(self.client.get(url, {'cursor': 'не курсор'}).status_code, 404)
+
+
+# ==================== Прогноз списаний ====================
+class ForecastTests(CatalogTestCase):
+    today = date(2024, 1, 20)
+    months = 15
+
+    def expected(self, subscriptions):
+        """Перебор дат списаний по графику продления (core.renewals)"""
+        first = forecast.month_index(self.today)
+        amounts, charges = [Decimal('0.00')] * self.months, [0] * self.months
+        for subscription in subscriptions:
+            period = BILLING_PERIOD_MONTHS[subscription.billing_period]
+            billing_date, step = subscription.next_billing_date, 0
+            while forecast.month_index(billing_date) < first + self.months:
+                if subscription.end_date is not None and billing_date > subscription.end_date:
+                    break
+                index = forecast.month_index(billing_date) - first
+                if index >= 0:
+                    amounts[index] += subscription.price
+                    charges[index] += 1
+                step += period
+                billing_date = add_months(
+                    subscription.next_billing_date, step, day=subscription.start_date.day,
+                )
+        return [
+            forecast.MonthForecast(forecast.month_from_index(first + index), amount, count)
+            for index, (amount, count) in enumerate(zip(amounts, charges))
+        ]
+
+    def make_schedule(self):
+        subscriptions = []
+        ends = [
+            None, date(2024, 2, 28), date(2024, 2, 29), date(2024, 4, 30), date(2024, 4, 29),
+            date(2024, 3, 15), date(2024, 6, 30), date(2024, 12, 31), date(2025, 1, 10),
+        ]
+        for period, months in BILLING_PERIOD_MONTHS.items():
+            for start_day in (1, 15, 28, 29, 30, 31):
+                start = date(2023, 1, start_day)
+                # Следующая оплата от месяца до начала прогноза до нескольких месяцев после
+                for shift in range(10, 16):
+                    next_billing = add_months(start, shift * months, day=start_day)
+                    for end in ends:
+                        if end is not None and end < self.today:
+                            continue
+                        subscriptions.append(Subscription(
+                            user=self.user, company=self.company, plan_name='План', price=Decimal(f'{start_day}.50'),
+                            billing_period=period, status='active', start_date=start,
+                            next_billing_date=next_billing, end_date=end,
+                        ))
+        # Неактивные подписки в прогноз не попадают
+        subscriptions.append(Subscription(
+            user=self.user, company=self.company, plan_name='План', price=Decimal('999.00'),
+            billing_period='monthly', status='cancelled', start_date=date(2023, 1, 1),
+            next_billing_date=date(2024, 2, 1),
+        ))
+        Subscription.objects.bulk_create(subscriptions)
+        return [subscription for subscription in subscriptions if subscription.status == 'active']
+
+    def test_matches_brute_force_schedule(self):
+        expected = self.expected(self.make_schedule())
+        self.assertIsNotNone(forecast.numpy)
+        self.assertEqual(forecast.forecast(Subscription.objects.all(), self.today, self.months), expected)
+        with mock.patch.object(forecast, 'numpy', None):
+            self.assertEqual(forecast.forecast(Subscription.objects.all(), self.today, self.months), expected)
+
+    def test_empty_forecast(self):
+        result = forecast.forecast(Subscription.objects.none(), self.today, 3)
+        self.assertEqual([(item.amount, item.charges) for item in result], [(Decimal('0.00'), 0)] * 3)
+
+    def test_views(self):
+        make_subscription(self.user, self.company, next_billing_date=date.today())
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('subscription-upcoming'), {'months': 2, 'format': 'json'})
+        self.assertEqual(response.json()['total'], '200.00')
+        self.assertEqual(self.client.get(reverse('revenue-forecast')).status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('revenue-forecast'), {'months': 1, 'format': 'json'})
+        self.assertEqual(response.json()['months'][0]['charges'], 1)
+
+
+# ==================== Поиск компаний ====================
+class CompanySearchTests(CatalogTestCase):
+
+    def test_exact_name_ranked_first_among_many_matches(self):
+        # Совпадения по описанию идут в индексе раньше, чем компания с этим названием
+        companies = Company.objects.bulk_create(
+            Company(name=f'Компания {index}', category=self.category, description='Стриминг музыки и подкастов')
+            for index in range(300)
+        )
+        exact = Company.objects.create(name='Музыка', category=self.category)
+        search.index_companies([company.pk for company in companies])
+
+        self.assertEqual(search.search_company_ids('музыка', limit=10)[0], exact.pk)
+
+    def test_only_bounded_candidates_are_ranked(self):
+        companies = Company.objects.bulk_create(
+            Company(name=f'Компания {index}', category=self.category, description='Музыка')
+            for index in range(30)
+        )
+        exact = Company.objects.create(name='Музыка', category=self.category)
+        search.index_companies([company.pk for company in companies])
+
+        # 5 любых совпадений (первые в индексе) и совпадение в названии
+        with mock.patch.object(search, 'CANDIDATE_LIMIT', 5):
+            found = search.search_company_ids('музыка', limit=50)
+        self.assertEqual(len(found), 6)
+        self.assertEqual(found[0], exact.pk)
+        self.assertEqual(set(found[1:]), {self.company.pk, *(company.pk for company in companies[:4])})
+
+    def test_prefix_search_and_reindex_on_rename(self):
+        self.assertEqual(search.search_company_ids('зву'), [self.company.pk])
+        self.company.name = 'Мелодия'
+        self.company.save()
+        self.assertEqual(search.search_company_ids('зву'), [])
+        self.assertEqual(search.search_company_ids('мелод'), [self.company.pk])
+
+
+# ==================== История цен ====================
+class MonthlySpendTests(CatalogTestCase):
+
+    def charge(self, subscription, day, amount):
+        PriceEvent.record([PriceEvent(
+            subscription=subscription,
+            user=self.user,
+            category=self.category,
+            kind=PriceEvent.KIND_CHARGE,
+            effective_date=day,
+            amount=Decimal(amount),
+        )])
+
+    def test_out_of_order_charge_keeps_month_total(self):
+        subscription = make_subscription(self.user, self.company)
+        self.charge(subscription, date(2024, 1, 20), '100.00')
+        # Более раннее списание того же месяца записано позже
+        self.charge(subscription, date(2024, 1, 5), '10.00')
+
+        rollup = MonthlySpend.objects.get(user=self.user, category=self.category, month=date(2024, 1, 1))
+        self.assertEqual(rollup.total, Decimal('110.00'))
+        self.assertEqual(rollup.charges, 2)
+
+    def test_series_includes_empty_months(self):
+        subscription = make_subscription(self.user, self.company)
+        self.charge(subscription, date(2024, 1, 20), '100.00')
+        self.charge(subscription, date(2024, 3, 2), '50.00')
+
+        self.assertEqual(MonthlySpend.series(date(2024, 1, 1), date(2024, 3, 31), user=self.user), [
+            (date(2024, 1, 1), Decimal('100.00')),
+            (date(2024, 2, 1), Decimal('0.00')),
+            (date(2024, 3, 1), Decimal('50.00')),
+        ])
+
+
+# ==================== Счётчики ====================
+class CounterTests(CatalogTestCase):
+
+    def test_counters_follow_changes_without_queries(self):
+        self.assertEqual(counters.get_counters(['categories', 'companies']), {'categories': 1, 'companies': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            company = Company.objects.create(name='Аккорд', category=self.category)
+        with self.assertNumQueries(0):
+            self.assertEqual(counters.get_counters(['companies']), {'companies': 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            company.delete()
+        self.assertEqual(counters.get_counters(['companies']), {'companies': 1})
+
+    def test_increment_without_cached_value(self):
+        counters.reconcile()
+        cache.delete('counter:companies')
+        with self.captureOnCommitCallbacks(execute=True):
+            Company.objects.create(name='Аккорд', category=self.category)
+        self.assertEqual(counters.get_counters(['companies']), {'companies': 2})
+
+    def test_deploy_check_warns_about_process_cache(self):
+        self.assertEqual([warning.id for warning in checks.check_shared_cache(None)], ['core.W001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379'}}
+        with mock.patch.object(checks.settings, 'CACHES', shared):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+
+# ==================== Каталог компаний ====================
+class CompanyCatalogTests(CatalogTestCase):
+
+    def test_company_catalog_revalidates_with_etag(self):
+        url = reverse('company-catalog')
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(response.json()['companies'][0]['name'], 'Звук')
+
+        self.assertEqual(self.client.get(url, headers={'if-none-match': response['ETag']}).status_code, 304)
+        self.company.name = 'Мелодия'
+        self.company.save()
+        changed = self.client.get(url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['companies'][0]['name'], 'Мелодия')
+
+
+class CatalogPageCacheTests(CatalogTestCase):
+
+    def assertServedFromCache(self, url):
+        content = self.client.get(url).content
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).content, content)
+        return content.decode()
+
+    def test_category_page_invalidated_on_save_and_delete(self):
+        url = reverse('category-list')
+        self.assertIn('Музыка', self.assertServedFromCache(url))
+
+        self.category.name = 'Музыка и звук'
+        self.category.save()
+        self.assertIn('Музыка и звук', self.assertServedFromCache(url))
+
+        extra = Category.objects.create(name='Игры')
+        self.assertIn('Игры', self.assertServedFromCache(url))
+        extra.delete()
+        self.assertNotIn('Игры', self.assertServedFromCache(url))
+
+    def test_company_page_invalidated_on_save_and_delete(self):
+        url = reverse('company-list')
+        self.assertIn('Звук', self.assertServedFromCache(url))
+
+        self.company.name = 'Мелодия'
+        self.company.save()
+        self.assertIn('Мелодия', self.assertServedFromCache(url))
+
+        self.company.delete()
+        self.assertNotIn('Мелодия', self.client.get(url).content.decode())
+
+    def test_pages_with_session_are_not_cached(self):
+        url = reverse('category-list')
+        self.client.get(url)
+        self.client.force_login(self.user)
+        Category.objects.filter(pk=self.category.pk).update(name='Только для сессии')
+        # update() не сбрасывает версию, но запрос с сессией рендерится заново
+        self.assertIn('Только для сессии', self.client.get(url).content.decode())
+
+
+# ==================== Асинхронные представления ====================
+class AsyncViewTests(CatalogTestCase):
+
+    async def test_home_counts_for_anonymous_and_user(self):
+        await sync_to_async(make_subscription)(self.user, self.company)
+        await sync_to_async(make_subscription)(self.user, self.company, status='paused')
+
+        response = await self.async_client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.context['categories_count'], response.context['companies_count']), (1, 1),
+        )
+        self.assertEqual(response.context['subscriptions_count'], 0)
+        self.assertNotContains(response, reverse('subscription-create'))
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('home'))
+        self.assertEqual(response.context['subscriptions_count'], 1)
+        self.assertContains(response, reverse('subscription-create'))
+
+    async def test_subscription_stats_requires_login(self):
+        url = reverse('subscription-stats')
+        response = await self.async_client.get(url)
+        self.assertRedirects(response, f'{settings.LOGIN_URL}?next={url}', fetch_redirect_response=False)
+
+    async def test_subscription_stats(self):
+        other = await User.objects.acreate_user('bob', 'bob@example.com', 'password')
+        await sync_to_async(make_subscription)(other, self.company)
+        later = await sync_to_async(make_subscription)(
+            self.user, self.company, price=Decimal('1200.00'), billing_period='yearly', next_billing_date=date(2024, 6, 1),
+        )
+        first = await sync_to_async(make_subscription)(self.user, self.company, plan_name='Семейная')
+        await sync_to_async(make_subscription)(self.user, self.company, status='cancelled', next_billing_date=date(2024, 1, 5))
+
+        await self.async_client.aforce_login(self.user)
+        data = (await self.async_client.get(reverse('subscription-stats'))).json()
+        self.assertEqual((data['total'], data['active'], Decimal(data['monthly_cost'])), (3, 2, Decimal('200.00')))
+        self.assertEqual(data['by_status']['cancelled'], 1)
+        self.assertEqual(Decimal(data['cost_by_period']['yearly']), Decimal('1200.00'))
+        self.assertEqual(data['next_charge'], {
+            'pk': first.pk, 'company__name': 'Звук', 'plan_name': 'Семейная',
+            'price': '100.00', 'next_billing_date': '2024-02-01',
+        })
+        self.assertNotEqual(data['next_charge']['pk'], later.pk)
+
+    async def test_company_catalog_payload(self):
+        self.company.subscription_plans = {'Семейная': '250', 'Базовая': '100'}
+        await self.company.asave()
+        other = await Company.objects.acreate(name='Аккорд', category=self.category)
+
+        data = (await self.async_client.get(reverse('company-catalog'))).json()
+        self.assertEqual([company['name'] for company in data['companies']], ['Аккорд', 'Звук'])
+        self.assertEqual(data['companies'][1], {
+            'id': self.company.pk, 'name': 'Звук', 'category_id': self.category.pk, 'category': 'Музыка',
+            'plans': {'Базовая': '100.00', 'Семейная': '250.00'},
+        })
+
+        response = await self.async_client.get(reverse('company-catalog'), {'company': [str(other.pk), 'x']})
+        self.assertEqual([company['id'] for company in response.json()['companies']], [other.pk])
+
+
+# ==================== Импорт ====================
+class ImporterTests(CatalogTestCase):
+
+    def subscription_record(self, **fields):
+        return {
+            'username': 'alice', 'company': 'Звук', 'plan_name': 'Базовая', 'price': '100.00',
+            'start_date': '2024-01-01', 'next_billing_date': '2024-02-01', **fields,
+        }
+
+    def test_imported_subscriptions_get_price_history(self):
+        existing = make_subscription(self.user, self.company)
+        PriceEvent.objects.all().delete()
+
+        report = Importer().import_subscriptions([
+            self.subscription_record(start_date='2024-03-05', price='50.00'),
+            self.subscription_record(id=str(existing.pk), price='120.00'),
+            self.subscription_record(id=str(existing.pk + 100), start_date='2024-04-01'),
+        ])
+        self.assertEqual(report.imported, 3)
+        self.assertEqual(report.rejected, [])
+
+        events = PriceEvent.objects.filter(kind=PriceEvent.KIND_PRICE_CHANGE)
+        self.assertEqual(
+            sorted(events.exclude(subscription=existing).values_list('effective_date', 'amount', 'category_id')),
+            [(date(2024, 3, 5), Decimal('50.00'), self.category.pk), (date(2024, 4, 1), Decimal('100.00'), self.category.pk)],
+        )
+        self.assertEqual(
+            list(events.filter(subscription=existing).values_list('effective_date', 'amount')),
+            [(date.today(), Decimal('120.00'))],
+        )
+
+    def test_duplicate_id_in_batch_keeps_last_row(self):
+        existing = make_subscription(self.user, self.company)
+        new_pk = existing.pk + 100
+        report = Importer().import_subscriptions([
+            self.subscription_record(id=str(existing.pk), price='110.00'),
+            self.subscription_record(id=str(new_pk), plan_name='Семейная'),
+            self.subscription_record(id=str(existing.pk), price='130.00'),
+            self.subscription_record(id=str(new_pk), plan_name='Премиум'),
+        ])
+        self.assertEqual(report.imported, 2)
+        self.assertEqual(report.rejected, [
+            (1, f'id {existing.pk} повторяется в строке 3'), (2, f'id {new_pk} повторяется в строке 4'),
+        ])
+        existing.refresh_from_db()
+        self.assertEqual(existing.price, Decimal('130.00'))
+        self.assertEqual(Subscription.objects.get(pk=new_pk).plan_name, 'Премиум')
+        self.assertEqual(UserSubscriptionSummary.objects.get(user=self.user).total_count, 2)
+
+    def test_company_category_change_rebuilds_summaries(self):
+        make_subscription(self.user, self.company)
+        summary = UserSubscriptionSummary.for_user(self.user)
+        self.assertEqual(list(summary.by_category), [str(self.category.pk)])
+
+        Importer().import_companies([{'name': 'Звук', 'category': 'Подкасты'}])
+
+        new_category = Category.objects.get(name='Подкасты')
+        summary.refresh_from_db()
+        self.assertEqual(list(summary.by_category), [str(new_category.pk)])
+        self.assertEqual(summary.total_count, 1)
+
+
+# ==================== Экспорт подписок ====================
+class ExportTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        self.quoted = make_subscription(self.user, self.company, notes='Скидка, "семейная"\nвторая строка')
+        self.plain = make_subscription(self.user, self.company, plan_name='Семейная', end_date=None)
+        self.foreign = make_subscription(self.other, self.company)
+
+    def download(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_is_scoped_to_user_and_escaped(self):
+        self.client.force_login(self.user)
+        response, content = self.download(reverse('subscription-export'))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('filename="subscriptions.csv"', response['Content-Disposition'])
+
+        header, *rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(header, [column for column, _ in EXPORT_COLUMNS])
+        self.assertEqual([int(row[0]) for row in rows], [self.quoted.pk, self.plain.pk])
+        record = dict(zip(header, rows[0]))
+        self.assertEqual(record['notes'], 'Скидка, "семейная"\nвторая строка')
+        self.assertEqual((record['username'], record['company'], record['category']), ('alice', 'Звук', 'Музыка'))
+        self.assertEqual(dict(zip(header, rows[1]))['end_date'], '')
+
+    def test_ndjson_is_scoped_to_user(self):
+        self.client.force_login(self.user)
+        response, content = self.download(reverse('subscription-export'), format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([record['id'] for record in records], [self.quoted.pk, self.plain.pk])
+        self.assertEqual(list(records[0]), [column for column, _ in EXPORT_COLUMNS])
+        self.assertEqual((records[0]['price'], records[0]['notes']), ('100.00', self.quoted.notes))
+        self.assertIsNone(records[1]['end_date'])
+
+    def test_unknown_format_rejected(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('subscription-export'), {'format': 'xml'}).status_code, 400)
+
+    def test_export_all_only_for_staff(self):
+        url = reverse('subscription-export-all')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.client.force_login(staff)
+        response, content = self.download(url, format='ndjson')
+        self.assertIn('filename="subscriptions_all.ndjson"', response['Content-Disposition'])
+        self.assertEqual(
+            sorted(json.loads(line)['id'] for line in content.splitlines()),
+            sorted([self.quoted.pk, self.plain.pk, self.foreign.pk]),
+        )
+
+    def test_admin_action_exports_selected(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        response = self.client.post(reverse('admin:core_subscription_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': [self.plain.pk, self.foreign.pk],
+        })
+        self.assertEqual(response.status_code, 200)
+        header, *rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(header[0], 'id')
+        self.assertEqual([int(row[0]) for row in rows], [self.plain.pk, self.foreign.pk])
+
+
+# ==================== Админка ====================
+class AdminTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        for day in (1, 2, 3, 4, 5):
+            make_subscription(self.user, self.company, start_date=date(2023 + day % 2, 1, day))
+
+    def test_changelists_load(self):
+        for model in ('category', 'company', 'subscription', 'usersubscriptionsummary'):
+            response = self.client.get(reverse(f'admin:core_{model}_changelist'))
+            self.assertEqual(response.status_code, 200, model)
+        response = self.client.get(reverse('admin:core_subscription_changelist'), {'status__exact': 'active'})
+        self.assertEqual(response.context['cl'].result_count, 5)
+
+    def test_estimated_paginator_falls_back_to_exact_count(self):
+        class SmallLimitPaginator(EstimatedCountPaginator):
+            count_limit = 3
+
+        queryset = Subscription.objects.order_by('pk')
+        with mock.patch('core.pagination.estimated_row_count', return_value=1000) as estimate:
+            # Меньше count_limit - точное число без оценки
+            self.assertEqual(EstimatedCountPaginator(queryset, 2).count, 5)
+            # Отфильтрованный запрос - не больше count_limit, без оценки по таблице
+            self.assertEqual(SmallLimitPaginator(queryset.filter(status='active'), 2).count, 3)
+            estimate.assert_not_called()
+            self.assertEqual(SmallLimitPaginator(queryset, 2).count, 1000)
+        with mock.patch('core.pagination.estimated_row_count', return_value=None):
+            self.assertEqual(SmallLimitPaginator(queryset, 2).count, 3)
+
+    def test_filter_choices_cached_until_catalog_changes(self):
+        # Фильтр с единственным вариантом не выводится
+        Category.objects.create(name='Кино')
+        url = reverse('admin:core_subscription_changelist')
+        self.client.get(url)
+
+        with mock.patch('django.contrib.admin.RelatedFieldListFilter.field_choices') as field_choices:
+            self.assertContains(self.client.get(url), 'Музыка')
+            field_choices.assert_not_called()
+
+        Category.objects.create(name='Игры')
+        self.assertContains(self.client.get(url), 'Игры')
+
+    def test_date_hierarchy_cached(self):
+        url = reverse('admin:core_subscription_changelist')
+        with mock.patch('core.templatetags.admin_cache.date_hierarchy', wraps=admin_cache.date_hierarchy) as tag:
+            first = self.client.get(url)
+            self.client.get(url)
+            self.assertEqual(tag.call_count, 1)
+            # Выбранный год - другой ключ кэша
+            self.assertEqual(self.client.get(url, {'start_date__year': 2024}).status_code, 200)
+            self.assertEqual(tag.call_count, 2)
+
+            with mock.patch.object(SubscriptionAdmin, 'date_hierarchy_cache_timeout', 0):
+                self.client.get(url)
+                self.client.get(url)
+            self.assertEqual(tag.call_count, 4)
+        self.assertContains(first, '2023')
+        self.assertContains(first, '2024')
+
+
+# ==================== Напоминания ====================
+class RecordingBackend(EmailReminderBackend):
+    """Запоминает сводки вместо отправки писем"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    def send_batch(self, digests):
+        if self.fail:
+            raise ConnectionError('SMTP недоступен')
+        self.sent.extend(digests)
+
+
+class ReminderTests(CatalogTestCase):
+    today = date(2024, 1, 30)
+
+    def setUp(self):
+        super().setUp()
+        self.first = make_subscription(self.user, self.company)
+        self.second = make_subscription(self.user, self.company, plan_name='Семейная')
+        self.silent = User.objects.create_user('carol', '', 'password')
+        make_subscription(self.silent, self.company)
+
+    def dispatch(self, backend):
+        return ReminderDispatcher(today=self.today, days_before=3, backend=backend, workers=1).run()
+
+    def test_reminder_is_sent_once(self):
+        backend = RecordingBackend()
+        result = self.dispatch(backend)
+        self.assertEqual(result['digests'], 1)
+        self.assertEqual(result['reminders'], 2)
+        self.assertEqual(result['undeliverable'], 1)
+        self.assertEqual([digest.username for digest in backend.sent], ['alice'])
+        # Пользователь без адреса не попадает в журнал
+        self.assertEqual(
+            set(ReminderLog.objects.values_list('subscription_id', flat=True)), {self.first.pk, self.second.pk},
+        )
+
+        repeat = RecordingBackend()
+        self.assertEqual(self.dispatch(repeat)['reminders'], 0)
+        self.assertEqual(repeat.sent, [])
+
+    def test_failed_batch_is_retried(self):
+        with self.assertLogs('core.reminders', 'ERROR'):
+            self.assertEqual(self.dispatch(RecordingBackend(fail=True))['failed'], 1)
+        self.assertFalse(ReminderLog.objects.exists())
+        self.assertEqual(self.dispatch(RecordingBackend())['reminders'], 2)
+
+    def test_claim_skips_reminders_of_another_process(self):
+        dispatcher = ReminderDispatcher(today=self.today, days_before=3, backend=RecordingBackend())
+        batch = [digest for digest in dispatcher.digests() if digest.username == 'alice']
+        # Другой процесс успел записать одно из напоминаний
+        ReminderLog.objects.create(subscription=self.first, user=self.user, billing_date=date(2024, 2, 1))
+
+        digests, claimed = dispatcher._claim(batch)
+        self.assertEqual([item.subscription_id for item in digests[0].items], [self.second.pk])
+        self.assertEqual(claimed, list(ReminderLog.objects.filter(subscription=self.second).values_list('pk', flat=True)))
+        self.assertEqual(dispatcher._claim(batch), ([], []))
+
+
+# ==================== Аналитика ====================
+class SpendPortfolioTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Хранилище общее для процесса - между тестами меняются id подписок
+        analytics._store = None
+        self.addCleanup(setattr, analytics, '_store', None)
+
+    def test_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('subscription-spend-all')).status_code, 403)
+
+    def test_spend_by_category(self):
+        make_subscription(self.user, self.company)
+        make_subscription(
+            self.user, self.company, price=Decimal('1200.00'), billing_period='yearly',
+            start_date=date(2024, 2, 10), end_date=date(2024, 2, 20),
+        )
+        staff = User.objects.create_user('admin', 'admin@example.com', 'password', is_staff=True)
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse('subscription-spend-all'), {'from': '2024-01', 'months': 3})
+        self.assertEqual(response.json(), {
+            'from': '2024-01',
+            'by': 'category',
+            'months': ['2024-01', '2024-02', '2024-03'],
+            'groups': [{'key': self.category.pk, 'name': 'Музыка', 'totals': ['100.00', '200.00', '100.00']}],
+        })
+        self.assertEqual(self.client.get(reverse('subscription-spend-all'), {'by': 'month'}).status_code, 400)
+
+
+class SubscriptionStoreTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        other_category = Category.objects.create(name='Видео')
+        self.other_company = Company.objects.create(name='Кадр', category=other_category)
+        self.subscriptions = [
+            make_subscription(self.user, self.company),
+            make_subscription(self.user, self.company, status='paused', price=Decimal('50.00')),
+            make_subscription(self.user, self.other_company, billing_period='quarterly', price=Decimal('300.00'),
+                              start_date=date(2024, 2, 15), end_date=date(2024, 5, 1)),
+            make_subscription(self.user, self.other_company, billing_period='yearly', price=Decimal('1200.00'),
+                              start_date=date(2023, 11, 3)),
+        ]
+
+    def columns(self, store):
+        return {name: list(getattr(store, name)) for name in store.typecodes}
+
+    def assertBothPaths(self, func, expected):
+        self.assertIsNotNone(analytics.numpy)
+        self.assertEqual(func(), expected)
+        with mock.patch.object(analytics, 'numpy', None):
+            self.assertEqual(func(), expected)
+
+    def test_group_sum_matches_database(self):
+        store = analytics.SubscriptionStore().load()
+        rows = Subscription.objects.order_by().values_list('company__category_id', 'status').annotate(
+            total=Sum('price'), count=Count('pk'),
+        )
+        self.assertBothPaths(
+            lambda: store.group_sum(('category', 'status'), 'price'),
+            {(category, status): total for category, status, total, _ in rows},
+        )
+        self.assertBothPaths(
+            lambda: store.group_sum('category', 'count', statuses=['active']),
+            {(self.category.pk,): 1, (self.other_company.category_id,): 2},
+        )
+        self.assertBothPaths(
+            lambda: store.group_sum('month', 'monthly', statuses=['active']),
+            {(date(2024, 1, 1),): Decimal('100.00'), (date(2024, 2, 1),): Decimal('100.00'),
+             (date(2023, 11, 1),): Decimal('100.00')},
+        )
+
+    def test_monthly_spend(self):
+        store = analytics.SubscriptionStore().load()
+        self.assertBothPaths(
+            lambda: store.monthly_spend(date(2024, 1, 1), 6, by='category', statuses=['active']),
+            {
+                self.category.pk: [Decimal('100.00')] * 6,
+                self.other_company.category_id: [Decimal(value) for value in (
+                    '100.00', '200.00', '200.00', '200.00', '200.00', '100.00',
+                )],
+            },
+        )
+
+    def test_refresh_removes_deleted_rows(self):
+        for numpy_module in (analytics.numpy, None):
+            with self.subTest(numpy=numpy_module is not None), mock.patch.object(analytics, 'numpy', numpy_module):
+                store = analytics.SubscriptionStore().load()
+                added = make_subscription(self.user, self.company, plan_name='Новая')
+                deleted = Subscription.objects.exclude(pk=added.pk).order_by('pk').first()
+                deleted.delete()
+                # Передача другому пользователю оставляет запись Tombstone, но не удаляет подписку
+                transferred = Subscription.objects.exclude(pk=added.pk).order_by('pk').first()
+                transferred.user = User.objects.create_user(f'bob{added.pk}', '', 'password')
+                transferred.save()
+
+                with mock.patch.object(analytics.SubscriptionStore, 'load') as load:
+                    result = store.refresh()
+                load.assert_not_called()
+                self.assertEqual((result['deleted'], result['reloaded']), (1, False))
+                self.assertEqual(self.columns(store), self.columns(analytics.SubscriptionStore().load()))
+
+    def test_refresh_after_tombstone_retention_reloads(self):
+        store = analytics.SubscriptionStore().load()
+        store.watermark -= sync.tombstone_retention()
+        self.subscriptions[0].delete()
+        self.assertTrue(store.refresh()['reloaded'])
+        self.assertEqual(len(store), 3)
+
+
+# ==================== Лента изменений ====================
+class SyncFeedTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        self.kept = make_subscription(self.user, self.company)
+        self.changed = make_subscription(self.user, self.company, plan_name='Семейная')
+        self.foreign = make_subscription(self.other, self.company)
+        # Всё создано давно, кроме того, что тест изменит после since
+        for model in (Category, Company, Subscription):
+            model.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        self.since = timezone.now() - timedelta(hours=1)
+
+    def feed(self, since, user=None):
+        return [(change['model'], change['id'], change['deleted']) for change in sync.ChangeFeed(since, user=user)]
+
+    def test_changes_and_deletions_after_since(self):
+        self.changed.price = Decimal('150.00')
+        self.changed.save()
+        deleted_pk = self.kept.pk
+        self.kept.delete()
+        # Подписка побывала у пользователя и вернулась прежнему владельцу
+        self.foreign.user = self.user
+        self.foreign.save()
+        self.foreign.user = self.other
+        self.foreign.save()
+
+        self.assertEqual(self.feed(self.since, user=self.user), [
+            ('subscription', self.changed.pk, False),
+            ('subscription', deleted_pk, True),
+            ('subscription', self.foreign.pk, True),
+        ])
+        self.assertEqual(self.feed(self.since, user=self.other), [('subscription', self.foreign.pk, False)])
+        self.assertEqual(sorted(self.feed(self.since)), sorted([
+            ('subscription', self.changed.pk, False),
+            ('subscription', self.foreign.pk, False),
+            ('subscription', deleted_pk, True),
+        ]))
+
+    def test_full_feed_and_reset(self):
+        full = self.feed(None, user=self.user)
+        self.assertEqual(sorted(full), sorted([
+            ('category', self.category.pk, False),
+            ('company', self.company.pk, False),
+            ('subscription', self.kept.pk, False),
+            ('subscription', self.changed.pk, False),
+        ]))
+        stale = sync.ChangeFeed(timezone.now() - sync.tombstone_retention() - timedelta(days=1), user=self.user)
+        self.assertTrue(stale.reset)
+        self.assertEqual(sorted((change['model'], change['id'], change['deleted']) for change in stale), sorted(full))
+
+    def test_view_streams_ndjson_with_next_since(self):
+        self.client.force_login(self.user)
+        self.company.description = 'Новое описание'
+        self.company.save()
+        response = self.client.get(reverse('sync-feed'), {'since': self.since.isoformat(), 'models': 'company'})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(line['model'], line['id']) for line in lines[:-1]], [('company', self.company.pk)])
+        self.assertEqual((lines[-1]['count'], lines[-1]['reset']), (1, False))
+        self.assertLess(self.since, timezone.datetime.fromisoformat(lines[-1]['since']))
+        self.assertEqual(self.client.get(reverse('sync-feed'), {'since': '2024-01-01'}).status_code, 400)
+
+
+# ==================== JSON API ====================
+class ApiTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.subscription = make_subscription(self.user, self.company)
+        self.client.force_login(self.user)
+
+    def send(self, method, url, payload, **headers):
+        return getattr(self.client, method)(url, json.dumps(payload), content_type='application/json', headers=headers)
+
+    def item(self, **fields):
+        return {
+            'company': self.company.pk, 'plan_name': 'Премиум', 'price': '300.00', 'billing_period': 'monthly',
+            'status': 'active', 'start_date': '2024-03-01', 'next_billing_date': '2024-04-01', **fields,
+        }
+
+    def test_list_revalidates_with_etag(self):
+        url = reverse('api-subscription-list')
+        response = self.client.get(url)
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.subscription.pk])
+        self.assertEqual(self.client.get(url, headers={'if-none-match': response['ETag']}).status_code, 304)
+
+        self.assertEqual(self.send('post', url, self.item()).status_code, 201)
+        changed = self.client.get(url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.json()['results']), 2)
+
+    def test_detail_conditional_update(self):
+        url = reverse('api-subscription-detail', args=[self.subscription.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+
+        response = self.send('patch', url, {'price': '120.00'}, if_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['price'], '120.00')
+        # Версия, по которой клиент читал объект, устарела
+        self.assertEqual(self.send('patch', url, {'price': '130.00'}, if_match=etag).status_code, 412)
+        self.assertEqual(self.client.delete(url, headers={'if-match': etag}).status_code, 412)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.price, Decimal('120.00'))
+
+    def test_access_is_limited_to_owner(self):
+        url = reverse('api-subscription-detail', args=[self.subscription.pk])
+        self.client.force_login(User.objects.create_user('bob', 'bob@example.com', 'password'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(reverse('api-company-list')).status_code, 200)
+
+    @override_settings(API_RATE_LIMIT_RATE=1, API_RATE_LIMIT_BURST=2)
+    def test_rate_limit(self):
+        url = reverse('api-company-list')
+        self.assertEqual(self.client.get(url)['X-RateLimit-Remaining'], '1')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_batch_is_all_or_nothing(self):
+        url = reverse('api-subscription-batch')
+        response = self.send('post', url, {
+            'create': [self.item(), self.item(price='-1')],
+            'update': [{'id': self.subscription.pk, 'status': 'cancelled'}],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['errors']['create']), ['1'])
+        self.assertEqual(Subscription.objects.count(), 1)
+
+        response = self.send('post', url, {
+            'create': [self.item(), self.item(plan_name='Семейная')],
+            'update': [{'id': self.subscription.pk, 'price': '110.00'}],
+        })
+        self.assertEqual(response.status_code, 200)
+        created = [row['id'] for row in response.json()['created']]
+        summary = UserSubscriptionSummary.objects.get(user=self.user)
+        self.assertEqual((summary.total_count, summary.monthly_cost), (3, Decimal('710.00')))
+        self.assertEqual(
+            sorted(PriceEvent.objects.filter(subscription_id__in=created).values_list('effective_date', 'amount')),
+            [(date(2024, 3, 1), Decimal('300.00'))] * 2,
+        )
+        self.assertTrue(PriceEvent.objects.filter(subscription=self.subscription, amount=Decimal('110.00')).exists())
+
+    def test_batch_category_read_from_database(self):
+        category = Category.objects.create(name='Видео')
+        get_catalog()
+        # bulk_create не сбрасывает версию каталога - компании нет в снимке в кэше,
+        # а форма успела проверить её по более новому снимку
+        company, = Company.objects.bulk_create([Company(name='Кадр', category=category)])
+        with mock.patch('core.forms.get_catalog', return_value=build_catalog('new')):
+            response = self.send('post', reverse('api-subscription-batch'), {
+                'create': [self.item(company=company.pk)],
+                'update': [{'id': self.subscription.pk, 'company': company.pk, 'price': '120.00'}],
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(PriceEvent.objects.filter(amount__in=[Decimal('300.00'), Decimal('120.00')]).values_list('category_id', flat=True)),
+            {category.pk},
+        )
+
+
+# ==================== Детальные страницы ====================
+class DetailCacheTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.subscription = make_subscription(self.user, self.company)
+        self.other = User.objects.create_user('bob', 'bob@example.com', 'password')
+
+    def test_subscription_detail_is_cached(self):
+        with self.assertNumQueries(1):
+            details.subscription_detail(self.user, self.subscription.pk)
+        with self.assertNumQueries(0):
+            subscription = details.subscription_detail(self.user, self.subscription.pk)
+        self.assertEqual(subscription.company.category.name, 'Музыка')
+
+    def test_subscription_detail_is_not_shared_between_users(self):
+        details.subscription_detail(self.user, self.subscription.pk)
+        with self.assertRaises(Subscription.DoesNotExist):
+            details.subscription_detail(self.other, self.subscription.pk)
+
+        url = reverse('subscription-detail', args=[self.subscription.pk])
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_subscription_detail_invalidated_on_save(self):
+        details.subscription_detail(self.user, self.subscription.pk)
+        self.subscription.plan_name = 'Премиум'
+        self.subscription.save()
+        self.assertEqual(details.subscription_detail(self.user, self.subscription.pk).plan_name, 'Премиум')
+
+    def test_category_detail_in_one_query(self):
+        Company.objects.create(name='Аккорд', category=self.category)
+        with self.assertNumQueries(1):
+            detail = details.category_detail(self.category.pk)
+        self.assertEqual([company.name for company in detail.companies], ['Аккорд', 'Звук'])
+        with self.assertNumQueries(0):
+            details.category_detail(self.category.pk)
+
+
+# ==================== Метрики запросов ====================
+def run_query():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+@override_settings(REQUEST_METRICS_ENABLED=True)
+class RequestMetricsTests(TestCase):
+
+    def test_concurrent_async_requests_count_own_queries(self):
+        # Оба запроса выполняют SQL в одном потоке sync_to_async и на одном соединении
+        second_done = asyncio.Event()
+
+        async def view(request):
+            for _ in range(request.queries):
+                await sync_to_async(run_query)()
+                await asyncio.sleep(0)
+            if request.queries == 1:
+                await second_done.wait()
+                await sync_to_async(run_query)()
+            else:
+                second_done.set()
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(view)
+        factory = RequestFactory()
+
+        async def handle(queries):
+            request = factory.get('/')
+            request.queries = queries
+            return await middleware(request)
+
+        async def handle_both():
+            return await asyncio.gather(handle(1), handle(3))
+
+        first, second = async_to_sync(handle_both)()
+        self.assertIn('desc="2 queries"', first['Server-Timing'])
+        self.assertIn('desc="3 queries"', second['Server-Timing'])
+
+
+# ==================== Реплики и кэш ====================
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaCacheTests(CatalogTestCase):
+
+    def pinned_after(self, func):
+        # Каждый вызов - как отдельный HTTP-запрос со своим контекстом
+        def run():
+            routers.reset_pin()
+            func()
+            return routers._pinned.get()
+        return contextvars.copy_context().run(run)
+
+    def test_fresh_version_pins_reads_to_primary(self):
+        get_version('company')
+        cache.delete('version:fresh:company')
+        self.assertFalse(self.pinned_after(lambda: get_version('company')))
+
+        bump_version('company')
+        self.assertTrue(self.pinned_after(lambda: get_version('company')))
+
+        cache.delete('version:fresh:company')
+        self.assertFalse(self.pinned_after(lambda: get_version('company')))
+
+    def test_catalog_snapshot_expires(self):
+        self.assertEqual(get_catalog().by_id[self.company.pk].name, 'Звук')
+        # Изменение без сигналов: версия каталога та же
+        Company.objects.filter(pk=self.company.pk).update(name='Мелодия')
+        self.assertEqual(get_catalog().by_id[self.company.pk].name, 'Звук')
+        with override_settings(CATALOG_CACHE_TIMEOUT=0):
+            self.assertEqual(get_catalog().by_id[self.company.pk].name, 'Мелодия')
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     # Главная страница
@@ -18,6 +18,8 @@ urlpatterns = [
     path('companies/create/', views.CompanyCreateView.as_view(), name='company-create'),
     path('companies/<int:pk>/update/', views.CompanyUpdateView.as_view(), name='company-update'),
     path('companies/<int:pk>/delete/', views.CompanyDeleteView.as_view(), name='company-delete'),
+    path('companies/catalog.json', views.company_catalog, name='company-catalog'),
+    path('companies/search.json', views.company_search, name='company-search'),
     
     # URL для подписок
     path('subscriptions/', views.SubscriptionListView.as_view(), name='subscription-list'),
@@ -25,5 +27,27 @@ urlpatterns = [
     path('subscriptions/create/', views.SubscriptionCreateView.as_view(), name='subscription-create'),
     path('subscriptions/<int:pk>/update/', views.SubscriptionUpdateView.as_view(), name='subscription-update'),
     path('subscriptions/<int:pk>/delete/', views.SubscriptionDeleteView.as_view(), name='subscription-delete'),
+    path('subscriptions/export/', views.SubscriptionExportView.as_view(), name='subscription-export'),
+    path('subscriptions/export/all/', views.SubscriptionExportAllView.as_view(), name='subscription-export-all'),
+    path('subscriptions/stats.json', views.subscription_stats, name='subscription-stats'),
+    path('subscriptions/spend.json', views.SpendSeriesView.as_view(), name='subscription-spend'),
+    path('subscriptions/spend/all.json', views.SpendPortfolioView.as_view(), name='subscription-spend-all'),
+    path('subscriptions/upcoming/', views.UpcomingChargesView.as_view(), name='subscription-upcoming'),
+    path('subscriptions/forecast/', views.RevenueForecastView.as_view(), name='revenue-forecast'),
+    
+    # Лента изменений для синхронизации клиентов
+    path('sync/', views.SyncFeedView.as_view(), name='sync-feed'),
+    path('sync/all/', views.SyncFeedAllView.as_view(), name='sync-feed-all'),
+    
+    # JSON API
+    path('api/categories/', api.CategoryListApi.as_view(), name='api-category-list'),
+    path('api/categories/<int:pk>/', api.CategoryDetailApi.as_view(), name='api-category-detail'),
+    path('api/companies/', api.CompanyListApi.as_view(), name='api-company-list'),
+    path('api/companies/<int:pk>/', api.CompanyDetailApi.as_view(), name='api-company-detail'),
+    path('api/subscriptions/', api.SubscriptionListApi.as_view(), name='api-subscription-list'),
+    path('api/subscriptions/<int:pk>/', api.SubscriptionDetailApi.as_view(), name='api-subscription-detail'),
+    path('api/subscriptions/batch/', api.SubscriptionBatchApi.as_view(), name='api-subscription-batch'),
+    
+    # Метрики запросов (для сотрудников)
+    path('metrics/', views.RequestMetricsView.as_view(), name='request-metrics'),
 ]
-
@@ -1,26 +1,58 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.views import View
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
 from django.urls import reverse_lazy
 from django.contrib import messages
-from .models import Category, Company, Subscription
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from . import analytics, details, sync
+from .cache import CatalogCacheMixin, cached_count
+from .catalog import aget_catalog, get_catalog
+from .counters import aget_counters
+from .exports import EXPORT_FORMATS, export_response
+from .forecast import month_from_index, month_index, revenue_forecast, user_forecast
+from .forms import SubscriptionForm
+from .metrics import registry as metrics_registry
+from .models import Category, Company, MonthlySpend, Subscription, UserSubscriptionSummary
+from .pagination import KeysetPaginationMixin
+from .search import search_company_ids
+import asyncio
+import hashlib
 from datetime import date
+from decimal import Decimal
 
 
 # ==================== Главная страница ====================
-def home(request):
+async def _active_subscriptions_count(user):
+    if not user.is_authenticated:
+        return 0
+    return (await UserSubscriptionSummary.afor_user(user)).active_count
+
+
+async def home(request):
     """Главная страница приложения"""
+    # Шаблон обращается к request.user - отдаём уже загруженного пользователя
+    request.user = user = await request.auser()
+    # Количества категорий и компаний - из материализованных счётчиков, без COUNT(*)
+    totals, subscriptions_count = await asyncio.gather(
+        aget_counters(['categories', 'companies']),
+        _active_subscriptions_count(user),
+    )
     context = {
-        'categories_count': Category.objects.count(),
-        'companies_count': Company.objects.count(),
-        'subscriptions_count': Subscription.objects.filter(status='active').count() if request.user.is_authenticated else 0,
+        'categories_count': totals['categories'],
+        'companies_count': totals['companies'],
+        'subscriptions_count': subscriptions_count,
     }
-    return render(request, 'core/home.html', context)
+    return TemplateResponse(request, 'core/home.html', context)
 
 
 # ==================== CRUD для Категорий ====================
-class CategoryListView(ListView):
+class CategoryListView(CatalogCacheMixin, ListView):
     """Список всех категорий"""
     model = Category
     template_name = 'core/category_list.html'
@@ -28,12 +60,25 @@ class CategoryListView(ListView):
     paginate_by = 10
 
 
-class CategoryDetailView(DetailView):
+class CategoryDetailView(CatalogCacheMixin, DetailView):
     """Детальная информация о категории"""
     model = Category
     template_name = 'core/category_detail.html'
     context_object_name = 'category'
 
+    def get_object(self, queryset=None):
+        # Категория и её компании - одним запросом и из кэша (см. core.details)
+        try:
+            self.detail = details.category_detail(self.kwargs['pk'])
+        except Category.DoesNotExist:
+            raise Http404('Категория не найдена')
+        return self.detail.category
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['companies'] = self.detail.companies
+        return context
+
 
 class CategoryCreateView(LoginRequiredMixin, CreateView):
     """Создание новой категории"""
@@ -71,32 +116,55 @@ class CategoryDeleteView(LoginRequiredMixin, DeleteView):
 
 
 # ==================== CRUD для Компаний ====================
-class CompanyListView(ListView):
+class CompanyListView(CatalogCacheMixin, KeysetPaginationMixin, ListView):
     """Список всех компаний"""
     model = Company
     template_name = 'core/company_list.html'
     context_object_name = 'companies'
     paginate_by = 12
+    keyset_ordering = ('name',)
+    search_limit = 50
+    
+    def get_search_query(self):
+        return self.request.GET.get('q', '').strip()
+    
+    def get_paginate_by(self, queryset):
+        # Результаты поиска - одна страница лучших совпадений по релевантности
+        return None if self.get_search_query() else self.paginate_by
     
     def get_queryset(self):
         queryset = Company.objects.select_related('category')
         category_id = self.request.GET.get('category')
         if category_id:
             queryset = queryset.filter(category_id=category_id)
+        query = self.get_search_query()
+        if query:
+            ranks = {pk: rank for rank, pk in enumerate(search_company_ids(query, self.search_limit))}
+            return sorted(queryset.filter(pk__in=ranks), key=lambda company: ranks[company.pk])
         return queryset
     
+    def get_approximate_total(self, queryset):
+        return cached_count(queryset, 'company', self.request.GET.get('category', ''))
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['categories'] = Category.objects.all()
+        context['search_query'] = self.get_search_query()
         return context
 
 
-class CompanyDetailView(DetailView):
+class CompanyDetailView(CatalogCacheMixin, DetailView):
     """Детальная информация о компании"""
     model = Company
     template_name = 'core/company_detail.html'
     context_object_name = 'company'
 
+    def get_object(self, queryset=None):
+        try:
+            return details.company_detail(self.kwargs['pk'])
+        except Company.DoesNotExist:
+            raise Http404('Компания не найдена')
+
 
 class CompanyCreateView(LoginRequiredMixin, CreateView):
     """Создание новой компании"""
@@ -133,27 +201,58 @@ class CompanyDeleteView(LoginRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
+async def company_catalog(request):
+    """Компании и их планы в JSON (для автозаполнения формы подписки)"""
+    catalog = await aget_catalog()
+    company_ids = None
+    if request.GET.get('company'):
+        company_ids = [int(pk) for pk in request.GET.getlist('company') if pk.isdigit()]
+    # Как в core.api: ETag по версии каталога, браузер перепроверяет его при каждом запросе
+    etag = f'"{hashlib.md5(f"{catalog.version}:{company_ids}".encode()).hexdigest()}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse({'version': catalog.version, 'companies': catalog.as_json(company_ids)})
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def company_search(request):
+    """Подсказки при поиске компаний: ?q=муз -> лучшие совпадения из индекса"""
+    company_ids = search_company_ids(request.GET.get('q', ''), limit=10)
+    catalog = get_catalog()
+    results = [
+        {'id': entry.id, 'name': entry.name, 'category': entry.category_name}
+        for entry in map(catalog.by_id.get, company_ids) if entry is not None
+    ]
+    return JsonResponse({'results': results})
+
+
 # ==================== CRUD для Подписок ====================
-class SubscriptionListView(LoginRequiredMixin, ListView):
+class SubscriptionListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """Список подписок пользователя"""
     model = Subscription
     template_name = 'core/subscription_list.html'
     context_object_name = 'subscriptions'
     paginate_by = 10
+    keyset_ordering = ('-start_date', 'id')
     
     def get_queryset(self):
         return Subscription.objects.filter(user=self.request.user).select_related('company', 'company__category')
     
+    def get_summary(self):
+        if not hasattr(self, '_summary'):
+            self._summary = UserSubscriptionSummary.for_user(self.request.user)
+        return self._summary
+    
+    def get_approximate_total(self, queryset):
+        return self.get_summary().total_count
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        subscriptions = self.get_queryset()
         
-        # Статистика
-        context['total_subscriptions'] = subscriptions.count()
-        context['active_subscriptions'] = subscriptions.filter(status='active').count()
-        context['total_monthly_cost'] = sum(
-            sub.price for sub in subscriptions.filter(status='active', billing_period='monthly')
-        )
+        # Статистика из сводки пользователя (без пересчёта по всем подпискам)
+        context['summary'] = self.get_summary()
         
         return context
 
@@ -164,33 +263,38 @@ class SubscriptionDetailView(LoginRequiredMixin, DetailView):
     template_name = 'core/subscription_detail.html'
     context_object_name = 'subscription'
     
-    def get_queryset(self):
-        return Subscription.objects.filter(user=self.request.user)
+    def get_object(self, queryset=None):
+        try:
+            return details.subscription_detail(self.request.user, self.kwargs['pk'])
+        except Subscription.DoesNotExist:
+            raise Http404('Подписка не найдена')
 
 
 class SubscriptionCreateView(LoginRequiredMixin, CreateView):
     """Создание новой подписки"""
     model = Subscription
     template_name = 'core/subscription_form.html'
-    fields = ['company', 'plan_name', 'price', 'billing_period', 'status', 'start_date', 'next_billing_date', 'end_date', 'notes']
+    form_class = SubscriptionForm
     success_url = reverse_lazy('subscription-list')
     
+    def get_initial(self):
+        initial = super().get_initial()
+        company_id = self.request.GET.get('company', '')
+        if company_id.isdigit() and int(company_id) in get_catalog().by_id:
+            initial['company'] = int(company_id)
+        return initial
+    
     def form_valid(self, form):
         form.instance.user = self.request.user
         messages.success(self.request, 'Подписка успешно создана!')
         return super().form_valid(form)
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['companies'] = Company.objects.all()
-        return context
 
 
 class SubscriptionUpdateView(LoginRequiredMixin, UpdateView):
     """Обновление подписки"""
     model = Subscription
     template_name = 'core/subscription_form.html'
-    fields = ['company', 'plan_name', 'price', 'billing_period', 'status', 'start_date', 'next_billing_date', 'end_date', 'notes']
+    form_class = SubscriptionForm
     success_url = reverse_lazy('subscription-list')
     
     def get_queryset(self):
@@ -213,3 +317,249 @@ class SubscriptionDeleteView(LoginRequiredMixin, DeleteView):
     def delete(self, request, *args, **kwargs):
         messages.success(self.request, 'Подписка успешно удалена!')
         return super().delete(request, *args, **kwargs)
+
+
+@login_required
+async def subscription_stats(request):
+    """Статистика подписок пользователя в JSON"""
+    user = await request.auser()
+    subscriptions = Subscription.objects.filter(user=user)
+    stats, next_charge = await asyncio.gather(
+        subscriptions.astats(),
+        subscriptions.active()
+        .order_by('next_billing_date')
+        .values('pk', 'company__name', 'plan_name', 'price', 'next_billing_date')
+        .afirst(),
+    )
+    return JsonResponse({**stats, 'next_charge': next_charge})
+
+
+# ==================== Экспорт подписок ====================
+class SubscriptionExportView(LoginRequiredMixin, View):
+    """Потоковая выгрузка подписок пользователя в CSV или NDJSON"""
+    filename = 'subscriptions'
+
+    def get_queryset(self):
+        return Subscription.objects.filter(user=self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return HttpResponseBadRequest('Неизвестный формат выгрузки')
+        return export_response(self.get_queryset(), export_format, self.filename)
+
+
+class SubscriptionExportAllView(UserPassesTestMixin, SubscriptionExportView):
+    """Выгрузка всех подписок для сотрудников"""
+    filename = 'subscriptions_all'
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_queryset(self):
+        return Subscription.objects.all()
+
+
+# ==================== Лента изменений ====================
+class SyncFeedView(LoginRequiredMixin, View):
+    """
+    Изменения каталога и подписок пользователя после ?since=<ISO 8601> потоком NDJSON
+    (см. core.sync). Без since отдаются все объекты; ?models=company,subscription
+    ограничивает набор моделей
+    """
+
+    def get_feed_user(self):
+        return self.request.user
+
+    def get(self, request, *args, **kwargs):
+        since = None
+        if request.GET.get('since'):
+            # "+" в непроцентированном запросе превращается в пробел
+            since = parse_datetime(request.GET['since'].replace(' ', '+'))
+            if since is None or timezone.is_naive(since):
+                return HttpResponseBadRequest('Некорректная отметка since: нужна дата и время с часовым поясом')
+        models = None
+        if request.GET.get('models'):
+            models = set(request.GET['models'].split(','))
+            if not models <= set(sync.SYNC_MODELS):
+                return HttpResponseBadRequest(f'Доступные модели: {", ".join(sync.SYNC_MODELS)}')
+        feed = sync.ChangeFeed(since=since, user=self.get_feed_user(), models=models)
+        return StreamingHttpResponse(feed.ndjson(), content_type='application/x-ndjson; charset=utf-8')
+
+
+class SyncFeedAllView(UserPassesTestMixin, SyncFeedView):
+    """Лента изменений по всем подпискам для сотрудников"""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_feed_user(self):
+        return None
+
+
+# ==================== Расходы по месяцам ====================
+class SpendSeriesView(LoginRequiredMixin, View):
+    """
+    Помесячные расходы пользователя в JSON: ?from=2024-01&to=2024-12&category=<id>.
+    Сотрудники могут запросить расходы всех пользователей (?all=1)
+    """
+    max_months = 240
+
+    @staticmethod
+    def parse_month(value):
+        year, month = value.split('-')
+        return date(int(year), int(month), 1)
+
+    def get(self, request, *args, **kwargs):
+        today = date.today()
+        try:
+            end = self.parse_month(request.GET['to']) if request.GET.get('to') else today.replace(day=1)
+            start = (
+                self.parse_month(request.GET['from']) if request.GET.get('from')
+                else date(end.year - 1, end.month, 1)
+            )
+            category = int(request.GET['category']) if request.GET.get('category') else None
+        except ValueError:
+            return HttpResponseBadRequest('Некорректный период или категория')
+        if start > end or (end.year - start.year) * 12 + end.month - start.month >= self.max_months:
+            return HttpResponseBadRequest(f'Период должен быть от 1 до {self.max_months} месяцев')
+
+        user = None if request.user.is_staff and request.GET.get('all') else request.user
+        series = MonthlySpend.series(start, end, user=user, category=category)
+        return JsonResponse({
+            'from': f'{start:%Y-%m}',
+            'to': f'{end:%Y-%m}',
+            'category': category,
+            'total': str(sum((total for _, total in series), Decimal('0.00'))),
+            'series': [{'month': f'{month:%Y-%m}', 'total': str(total)} for month, total in series],
+        })
+
+
+class SpendPortfolioView(UserPassesTestMixin, View):
+    """
+    Ежемесячные расходы по всем подпискам из хранилища core.analytics
+    (только для сотрудников): ?from=2024-01&months=12&by=category.
+    by - category, company, status или billing_period
+    """
+    max_months = SpendSeriesView.max_months
+    dimensions = ('category', 'company', 'status', 'billing_period')
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_names(self, by):
+        if by == 'category':
+            return dict(Category.objects.values_list('pk', 'name'))
+        if by == 'company':
+            return {entry.id: entry.name for entry in get_catalog().entries}
+        choices = Subscription.STATUS_CHOICES if by == 'status' else Subscription.BILLING_PERIOD_CHOICES
+        return dict(choices)
+
+    def get(self, request, *args, **kwargs):
+        by = request.GET.get('by', 'category')
+        try:
+            first = (
+                SpendSeriesView.parse_month(request.GET['from']) if request.GET.get('from')
+                else date.today().replace(day=1)
+            )
+            months = int(request.GET.get('months', 12))
+        except ValueError:
+            return HttpResponseBadRequest('Некорректный период')
+        if not 1 <= months <= self.max_months:
+            return HttpResponseBadRequest(f'Период должен быть от 1 до {self.max_months} месяцев')
+        if by not in self.dimensions:
+            return HttpResponseBadRequest(f'Разрез должен быть одним из: {", ".join(self.dimensions)}')
+
+        spend = analytics.portfolio_spend(first, months, by=by)
+        names = self.get_names(by)
+        return JsonResponse({
+            'from': f'{first:%Y-%m}',
+            'by': by,
+            'months': [f'{month_from_index(month_index(first) + offset):%Y-%m}' for offset in range(months)],
+            'groups': [
+                {'key': key, 'name': names.get(key), 'totals': [str(total) for total in totals]}
+                for key, totals in sorted(spend.items(), key=lambda item: str(item[0]))
+            ],
+        })
+
+
+# ==================== Прогноз списаний ====================
+class UpcomingChargesView(LoginRequiredMixin, TemplateView):
+    """Предстоящие списания пользователя по месяцам (?months=12, ?format=json)"""
+    template_name = 'core/upcoming_charges.html'
+    default_months = 12
+    max_months = 60
+
+    def get_months(self):
+        try:
+            months = int(self.request.GET.get('months', self.default_months))
+        except ValueError:
+            months = self.default_months
+        return min(max(months, 1), self.max_months)
+
+    def get_forecast(self, months):
+        return user_forecast(self.request.user, months=months)
+
+    def get_upcoming(self):
+        return (
+            Subscription.objects.active()
+            .filter(user=self.request.user)
+            .select_related('company')
+            .order_by('next_billing_date')[:10]
+        )
+
+    def get(self, request, *args, **kwargs):
+        months = self.get_months()
+        self.forecast = self.get_forecast(months)
+        if request.GET.get('format') == 'json':
+            return JsonResponse({
+                'months': [
+                    {'month': f'{item.month:%Y-%m}', 'amount': str(item.amount), 'charges': item.charges}
+                    for item in self.forecast
+                ],
+                'total': str(sum((item.amount for item in self.forecast), Decimal('0.00'))),
+            })
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['forecast'] = self.forecast
+        context['total'] = sum((item.amount for item in self.forecast), Decimal('0.00'))
+        context['upcoming'] = self.get_upcoming()
+        return context
+
+
+class RevenueForecastView(UserPassesTestMixin, UpcomingChargesView):
+    """Прогноз списаний по всем подпискам (только для сотрудников)"""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_forecast(self, months):
+        return revenue_forecast(months=months)
+
+    def get_upcoming(self):
+        return None
+
+
+# ==================== Метрики запросов ====================
+class RequestMetricsView(UserPassesTestMixin, TemplateView):
+    """Метрики запросов по URL (только для сотрудников)"""
+    template_name = 'core/request_metrics.html'
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('format') == 'json':
+            return JsonResponse({
+                'routes': metrics_registry.snapshot(),
+                'flagged': list(metrics_registry.flagged),
+            })
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['routes'] = metrics_registry.snapshot()
+        context['flagged'] = list(reversed(metrics_registry.flagged))
+        return context
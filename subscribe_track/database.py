@@ -0,0 +1,127 @@
+"""
+Профили настроек базы данных. Профиль выбирается переменной окружения
+DB_PROFILE:
+
+    sqlite      SQLite с настройками по умолчанию (соединение на каждый запрос)
+    sqlite-wal  SQLite в режиме WAL с настроенными PRAGMA и постоянными соединениями
+    postgres    PostgreSQL с постоянными соединениями или пулом psycopg (DB_POOL=1)
+
+Общие переменные: DB_NAME, DB_CONN_MAX_AGE; для PostgreSQL также DB_USER,
+DB_PASSWORD, DB_HOST, DB_PORT, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE.
+
+Реплики для чтения задаются через DB_REPLICAS - список через запятую
+файлов SQLite или хостов PostgreSQL; они получают алиасы replica1, replica2, ...
+(см. core.routers)
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+# PRAGMA профиля sqlite-wal; выполняются при каждом подключении
+SQLITE_WAL_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # В режиме WAL NORMAL не теряет целостность, но не ждёт fsync на каждой фиксации
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - размер в КиБ (64 МиБ на соединение)
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ImproperlyConfigured(f'{name} должно быть целым числом: {value!r}')
+
+
+def _conn_max_age(default):
+    # Пустое значение или "none" - соединения без ограничения времени жизни
+    value = os.environ.get('DB_CONN_MAX_AGE')
+    if value is not None and value.lower() == 'none':
+        return None
+    return _env_int('DB_CONN_MAX_AGE', default)
+
+
+def sqlite(base_dir):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('DB_NAME') or base_dir / 'db.sqlite3',
+        'CONN_MAX_AGE': _conn_max_age(0),
+    }
+
+
+def sqlite_wal(base_dir):
+    return {
+        **sqlite(base_dir),
+        'CONN_MAX_AGE': _conn_max_age(600),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_WAL_PRAGMAS.items()),
+            # Запись берёт блокировку сразу - без ошибок "database is locked" при повышении блокировки
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+
+
+def postgres(base_dir):
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'subscribe_track'),
+        'USER': os.environ.get('DB_USER', ''),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', ''),
+        'PORT': os.environ.get('DB_PORT', ''),
+        'CONN_MAX_AGE': _conn_max_age(60),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    if os.environ.get('DB_POOL') == '1':
+        # Пул psycopg (psycopg[pool]) несовместим с CONN_MAX_AGE
+        config['CONN_MAX_AGE'] = 0
+        config['CONN_HEALTH_CHECKS'] = False
+        config['OPTIONS'] = {
+            'pool': {
+                'min_size': _env_int('DB_POOL_MIN_SIZE', 2),
+                'max_size': _env_int('DB_POOL_MAX_SIZE', 10),
+                'timeout': 10,
+            },
+        }
+    return config
+
+
+PROFILES = {
+    'sqlite': sqlite,
+    'sqlite-wal': sqlite_wal,
+    'postgres': postgres,
+}
+
+
+def database_profile(name, base_dir):
+    """Настройки БД default для профиля name"""
+    try:
+        return PROFILES[name](base_dir)
+    except KeyError:
+        raise ImproperlyConfigured(f'Неизвестный профиль БД {name!r}; доступны: {", ".join(PROFILES)}')
+
+
+def replica_databases(name, base_dir):
+    """Настройки реплик из DB_REPLICAS с тем же профилем, что и у основной БД"""
+    replicas = {}
+    targets = [target.strip() for target in os.environ.get('DB_REPLICAS', '').split(',') if target.strip()]
+    for index, target in enumerate(targets, start=1):
+        config = database_profile(name, base_dir)
+        if config['ENGINE'] == 'django.db.backends.sqlite3':
+            config['NAME'] = target
+        else:
+            config['HOST'] = target
+        # В тестах реплика читает тестовую копию основной БД
+        config['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica{index}'] = config
+    return replicas
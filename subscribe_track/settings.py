@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_profile, replica_databases
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,6 +55,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Метрики запросов (Server-Timing, /metrics/) включаются явно: REQUEST_METRICS_ENABLED=1
+# в окружении. Отключено - middleware не подключается
+REQUEST_METRICS_ENABLED = os.environ.get('REQUEST_METRICS_ENABLED') == '1'
+REQUEST_METRICS_SLOW_MS = 500
+REQUEST_METRICS_REPEATED_QUERY_THRESHOLD = 2
+
 ROOT_URLCONF = 'subscribe_track.urls'
 
 TEMPLATES = [
@@ -74,13 +85,74 @@ WSGI_APPLICATION = 'subscribe_track.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Профиль выбирается переменной окружения DB_PROFILE (см. subscribe_track/database.py)
+DB_PROFILE = os.environ.get('DB_PROFILE', 'sqlite')
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_profile(DB_PROFILE, BASE_DIR),
+    **replica_databases(DB_PROFILE, BASE_DIR),
 }
 
+# Чтение - с реплик, запись и чтение после записи - с основной БД
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+# Сколько секунд после записи запросы клиента читают с основной БД (отставание реплик)
+REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# В кэше хранятся версии каталога и подписок пользователей (core.cache) и счётчики
+# главной страницы (core.counters): изменение сбрасывает версии и меняет счётчики
+# только в кэше своего процесса. LocMemCache у каждого процесса свой, поэтому он
+# подходит лишь для одного процесса (runserver, тесты; check --deploy предупреждает).
+# При нескольких воркерах задайте REDIS_URL - общий кэш (нужен пакет redis)
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'subscribe-track',
+        }
+    }
+
+# Время жизни кэша страниц и фрагментов каталога, сек
+CATALOG_CACHE_TIMEOUT = 300
+
+# Время жизни счётчиков главной страницы в кэше (core.counters), сек
+COUNTER_CACHE_TIMEOUT = 300
+
+# Срок хранения записей об удалениях для ленты изменений (core.sync), дней
+SYNC_TOMBSTONE_RETENTION_DAYS = 90
+
+# JSON API (core.api): запросов в секунду на пользователя, запас корзины, подписок в пакете
+API_RATE_LIMIT_RATE = 10
+API_RATE_LIMIT_BURST = 100
+API_BATCH_MAX_SIZE = 500
+
+
+# Email
+# https://docs.djangoproject.com/en/5.0/topics/email/
+
+# Письма сохраняются в файлы; для рабочей отправки - smtp.EmailBackend и EMAIL_HOST
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+DEFAULT_FROM_EMAIL = 'reminders@subscribe-track.local'
+
+# Напоминания об оплате (core.reminders): за сколько дней, чем отправлять, сколько потоков
+REMINDER_DAYS_BEFORE = 3
+REMINDER_BACKEND = 'core.reminders.EmailReminderBackend'
+REMINDER_WORKERS = 4
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators